@@ -72,7 +72,7 @@ def start_pgvector_if_needed():
         print(f"[pgvector] WARNING: failed to manage docker: {e}")
 
 
-def eval_backend(backend: str):
+def eval_backend(backend: str, batch: bool = False):
     print(f"\n=== Backend: {backend.upper()} ===")
     os.environ["VECTOR_BACKEND"] = backend
 
@@ -86,8 +86,13 @@ def eval_backend(backend: str):
     df = ingester.load_products()
     df = ingester.preprocess_data(df)
     vector_store = embedder.embed_products(df)
+    if hasattr(vector_store, "build_indexes"):
+        # Approximate indexes are built at ingest, never by a search
+        vector_store.build_indexes()
 
-    searcher = ProductSearcher(vector_store)
+    searcher = ProductSearcher(
+        vector_store, embedding_generator=embedder.embedding_generator, bm25_index=embedder.bm25_index
+    )
 
     latencies = []
     all_results = []
@@ -121,6 +126,22 @@ def eval_backend(backend: str):
     p95_ms = statistics.quantiles(latencies, n=20)[18] if len(latencies) >= 20 else max(latencies) if latencies else 0.0
     print(f"\nLatency (ms): avg={avg_ms:.2f}, p95={p95_ms:.2f}")
 
+    if batch:
+        t0 = time.perf_counter()
+        searcher.search_batch(QUERIES, top_k=5)
+        dt = (time.perf_counter() - t0) * 1000.0
+        print(f"Batch retrieval (ms): total={dt:.2f}, per_query={dt / len(QUERIES):.2f}")
+
+    ann_config = getattr(vector_store, "ann_config", None)
+    quantization_config = getattr(vector_store, "quantization_config", None)
+    if (ann_config is not None and ann_config.enabled) or (quantization_config is not None and quantization_config.enabled):
+        # In-memory approximate search (MEMORY_INDEX / MEMORY_QUANTIZATION): recall of the eval queries vs exact
+        label = "+".join(c for c in (ann_config.index_type, quantization_config.kind) if c not in ("exact", "none"))
+        recall = vector_store.recall(searcher._embed_queries(QUERIES))
+        print(f"Approximate recall@10 ({label}): {recall:.3f}")
+        if ann_config.enabled and vector_store._ann_index() is None:
+            print(f"  ANN inactive below MEMORY_INDEX_MIN_ROWS={ann_config.min_rows} rows")
+
 
 def main():
     load_dotenv(ROOT / ".env")
@@ -133,6 +154,11 @@ def main():
         default=None,
         help="Comma-separated list of backends to test (memory,pgvector,pinecone). If omitted, uses VECTOR_BACKEND if set, otherwise defaults to memory,pgvector (+pinecone if configured).",
     )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Also time a single batched dense retrieval over all queries (one encode call, one store round trip).",
+    )
     args = parser.parse_args()
 
     selected: list[str]
@@ -148,7 +174,7 @@ def main():
                 selected.append("pinecone")
 
     for b in selected:
-        eval_backend(b)
+        eval_backend(b, batch=args.batch)
 
 
 if __name__ == "__main__":
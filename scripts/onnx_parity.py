@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""Compare ONNX Runtime embeddings against the PyTorch SentenceTransformer ones.
+
+Encodes the catalog texts and the eval queries with both backends, reports
+per-vector cosine agreement, top-10 overlap of query results and encode
+timings, and exits non-zero when the mean cosine falls below --min-cosine or
+the overlap below --min-overlap. tests/test_onnx_parity.py asserts the same
+thresholds.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from ingest import DataIngester
+from embed_and_load import EmbeddingGenerator, ProductEmbedder
+from eval_harness import QUERIES
+
+MIN_COSINE = 0.99
+MIN_OVERLAP = 0.9
+
+
+def encode_timed(generator, texts):
+    start = time.perf_counter()
+    embeddings = np.asarray(generator.generate_embeddings(texts, use_cache=False), dtype=np.float32)
+    return embeddings, time.perf_counter() - start
+
+
+def query_latency_ms(generator, queries, repeats=5):
+    samples = []
+    for _ in range(repeats):
+        for q in queries:
+            start = time.perf_counter()
+            generator.generate_single_embedding(q)
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def unit(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def compare(torch_gen, onnx_gen, texts, queries):
+    """Per-text and per-query cosines between the two backends, top-k overlap
+    of query results over ``texts`` and catalog encode seconds"""
+    torch_docs, torch_seconds = encode_timed(torch_gen, texts)
+    onnx_docs, onnx_seconds = encode_timed(onnx_gen, texts)
+    torch_queries, _ = encode_timed(torch_gen, queries)
+    onnx_queries, _ = encode_timed(onnx_gen, queries)
+
+    k = min(10, len(texts))
+    torch_top = np.argsort(-(unit(torch_queries) @ unit(torch_docs).T), axis=1)[:, :k]
+    onnx_top = np.argsort(-(unit(onnx_queries) @ unit(onnx_docs).T), axis=1)[:, :k]
+    return {
+        "cosines": np.sum(unit(torch_docs) * unit(onnx_docs), axis=1),
+        "query_cosines": np.sum(unit(torch_queries) * unit(onnx_queries), axis=1),
+        "k": k,
+        "overlap": float(np.mean([len(set(a) & set(b)) / k for a, b in zip(torch_top, onnx_top)])),
+        "torch_seconds": torch_seconds,
+        "onnx_seconds": onnx_seconds,
+    }
+
+
+def catalog_texts(model, limit):
+    # Only the text formatting of ProductEmbedder is used; keep it off the database
+    os.environ["VECTOR_BACKEND"] = "memory"
+    ingester = DataIngester()
+    df = ingester.preprocess_data(ingester.load_products())
+    return ProductEmbedder(model, lazy_model=True).create_product_texts(df)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check ONNX encoder parity with PyTorch")
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--limit", type=int, default=1000, help="Catalog texts to compare")
+    parser.add_argument("--no-quantize", action="store_true", help="Compare the fp32 ONNX export instead of int8")
+    parser.add_argument("--min-cosine", type=float, default=MIN_COSINE)
+    parser.add_argument("--min-overlap", type=float, default=MIN_OVERLAP)
+    args = parser.parse_args()
+
+    if args.no_quantize:
+        os.environ["ONNX_QUANTIZE"] = "0"
+    texts = catalog_texts(args.model, args.limit)
+
+    torch_gen = EmbeddingGenerator(args.model, backend="torch")
+    onnx_gen = EmbeddingGenerator(args.model, backend="onnx")
+    label = onnx_gen.inference_config.variant
+
+    # One throwaway call each so timings exclude first-run setup
+    torch_gen.generate_single_embedding("warm up")
+    onnx_gen.generate_single_embedding("warm up")
+
+    stats = compare(torch_gen, onnx_gen, texts, QUERIES)
+    cosines, query_cosines, k, overlap = stats["cosines"], stats["query_cosines"], stats["k"], stats["overlap"]
+    torch_seconds, onnx_seconds = stats["torch_seconds"], stats["onnx_seconds"]
+
+    print(f"Model: {args.model} (torch vs {label})")
+    print(f"Catalog cosine over {len(texts)} texts: mean {cosines.mean():.5f}, min {cosines.min():.5f}")
+    print(f"Query cosine over {len(QUERIES)} queries: mean {query_cosines.mean():.5f}, min {query_cosines.min():.5f}")
+    print(f"Top-{k} overlap of query results: {overlap:.3f}")
+    print(f"Catalog encode: torch {torch_seconds:.2f}s, {label} {onnx_seconds:.2f}s "
+          f"({torch_seconds / max(onnx_seconds, 1e-9):.2f}x)")
+    torch_ms = query_latency_ms(torch_gen, QUERIES)
+    onnx_ms = query_latency_ms(onnx_gen, QUERIES)
+    print(f"Single-query encode (median): torch {torch_ms:.2f} ms, {label} {onnx_ms:.2f} ms "
+          f"({torch_ms / max(onnx_ms, 1e-9):.2f}x)")
+
+    if cosines.mean() < args.min_cosine:
+        print(f"FAIL: mean cosine {cosines.mean():.5f} < {args.min_cosine}")
+        sys.exit(1)
+    if overlap < args.min_overlap:
+        print(f"FAIL: top-{k} overlap {overlap:.3f} < {args.min_overlap}")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib  # type: ignore
+except Exception:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+
+class IVFIndex:
+    """Inverted-file index over the store's normalized rows.
+
+    Rows are assigned to the nearest of ``lists`` spherical k-means centroids;
+    a query scans the rows of its ``probes`` closest lists. Assignments are
+    kept row-aligned with the store matrix so appends, in-place updates and
+    swap-removes are applied without retraining. Appends go into a
+    capacity-doubling buffer and are scanned as an unsorted tail until it
+    outgrows ``TAIL_RATIO`` of the sorted lists, so chunked ingest stays
+    amortized O(1) per row.
+    """
+
+    kind = "ivf"
+    TAIL_RATIO = 0.25
+
+    def __init__(self, lists: int = 0, probes: int = 0) -> None:
+        self.lists = lists
+        self.probes = probes
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        # Backing storage when ``assignments`` is a prefix view of it
+        self._buffer: Optional[np.ndarray] = None
+        # (offsets, order) over the first ``_sorted_rows`` rows; later rows are the tail
+        self._inverted: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._sorted_rows = 0
+
+    @staticmethod
+    def default_lists(rows: int) -> int:
+        return max(1, int(4 * math.sqrt(rows)))
+
+    def _assign(self, vectors: np.ndarray, chunk_size: int = 65536) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), chunk_size):
+            out[start:start + chunk_size] = np.argmax(vectors[start:start + chunk_size] @ self.centroids.T, axis=1)
+        return out
+
+    def build(self, matrix: np.ndarray, iterations: int = 10, seed: int = 0) -> None:
+        rows = len(matrix)
+        self.lists = min(self.lists or self.default_lists(rows), rows)
+        self.probes = min(self.probes or max(1, int(math.sqrt(self.lists))), self.lists)
+        rng = np.random.default_rng(seed)
+        # Train on a sample; ~40 points per centroid is enough for spherical k-means
+        sample_size = min(rows, self.lists * 40)
+        sample = matrix[np.sort(rng.choice(rows, sample_size, replace=False))]
+        self.centroids = sample[rng.choice(sample_size, self.lists, replace=False)].copy()
+        for _ in range(iterations):
+            labels = self._assign(sample)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=self.lists)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            empty = counts == 0
+            sums = np.zeros_like(self.centroids)
+            if (~empty).any():
+                sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.centroids = (sums / norms).astype(np.float32)
+        self.assignments = self._assign(matrix)
+        self._inverted = None
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        tail = len(self.assignments) - self._sorted_rows
+        if self._inverted is None or tail > self.TAIL_RATIO * self._sorted_rows:
+            order = np.argsort(self.assignments, kind="stable").astype(np.int64)
+            counts = np.bincount(self.assignments, minlength=self.lists)
+            offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            self._inverted = (offsets, order)
+            self._sorted_rows = len(self.assignments)
+        return self._inverted
+
+    def add(self, vectors: np.ndarray, start_row: int) -> None:
+        new = self._assign(vectors)
+        needed = start_row + len(new)
+        buffer = self._buffer
+        if buffer is None or self.assignments.base is not buffer or needed > len(buffer):
+            buffer = np.empty(max(needed, 2 * len(self.assignments), 1024), dtype=np.int32)
+            buffer[:start_row] = self.assignments[:start_row]
+            self._buffer = buffer
+        buffer[start_row:needed] = new
+        self.assignments = buffer[:needed]
+        if start_row < self._sorted_rows:
+            self._inverted = None
+
+    def update(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        self.assignments[rows] = self._assign(vectors)
+        self._inverted = None
+
+    def move(self, src: int, dst: int, vector: np.ndarray) -> None:
+        self.assignments[dst] = self.assignments[src]
+        self.assignments = self.assignments[:src]
+        self._inverted = None
+
+    def detach(self) -> None:
+        self.centroids = np.array(self.centroids)
+        self.assignments = np.array(self.assignments)
+        self._buffer = None
+
+    def candidates_batch(self, queries: np.ndarray, k: int) -> List[np.ndarray]:
+        offsets, order = self._inverted_lists()
+        tail = self.assignments[self._sorted_rows:]
+        probes = min(self.probes, self.lists)
+        centroid_scores = queries @ self.centroids.T
+        if probes < self.lists:
+            probed = np.argpartition(centroid_scores, -probes, axis=1)[:, -probes:]
+        else:
+            probed = np.tile(np.arange(self.lists), (len(queries), 1))
+        out = []
+        for lists in probed:
+            parts = [order[offsets[c]:offsets[c + 1]] for c in lists]
+            if len(tail):
+                parts.append(self._sorted_rows + np.flatnonzero(np.isin(tail, lists)))
+            out.append(np.concatenate(parts))
+        return out
+
+    def save(self, directory: Path) -> Dict[str, Any]:
+        np.save(directory / "ivf_centroids.npy", self.centroids)
+        np.save(directory / "ivf_assignments.npy", self.assignments)
+        return {"kind": self.kind, "lists": self.lists, "probes": self.probes}
+
+    @classmethod
+    def load(cls, directory: Path, spec: Dict[str, Any], probes: int = 0) -> "IVFIndex":
+        index = cls(int(spec["lists"]), probes or int(spec["probes"]))
+        index.centroids = np.asarray(np.load(directory / "ivf_centroids.npy", mmap_mode="r"))
+        index.assignments = np.asarray(np.load(directory / "ivf_assignments.npy", mmap_mode="r"))
+        return index
+
+
+class HNSWIndex:
+    """hnswlib graph keyed by store row; requires the optional hnswlib package"""
+
+    kind = "hnsw"
+
+    def __init__(self, dimension: int, m: int = 16, ef_construction: int = 200, ef_search: int = 64) -> None:
+        if hnswlib is None:
+            raise ImportError("MEMORY_INDEX=hnsw requires the hnswlib package")
+        self.dimension = dimension
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = hnswlib.Index(space="ip", dim=dimension)
+
+    def _ensure_capacity(self, rows: int) -> None:
+        capacity = self.index.get_max_elements()
+        if rows > capacity:
+            self.index.resize_index(max(rows, capacity * 2))
+
+    def build(self, matrix: np.ndarray) -> None:
+        self.index.init_index(max_elements=max(1, len(matrix)), M=self.m, ef_construction=self.ef_construction)
+        self.index.add_items(matrix, np.arange(len(matrix)))
+        self.index.set_ef(self.ef_search)
+
+    def add(self, vectors: np.ndarray, start_row: int) -> None:
+        self._ensure_capacity(start_row + len(vectors))
+        self.index.add_items(vectors, np.arange(start_row, start_row + len(vectors)))
+
+    def update(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        self.index.add_items(vectors, rows)
+
+    def move(self, src: int, dst: int, vector: np.ndarray) -> None:
+        # Labels are row numbers: dst takes over src's vector and src goes away
+        if src != dst:
+            self.index.add_items(vector.reshape(1, -1), np.array([dst]))
+        self.index.mark_deleted(src)
+
+    def detach(self) -> None:
+        pass
+
+    def candidates_batch(self, queries: np.ndarray, k: int) -> List[np.ndarray]:
+        k = min(k, self.index.get_current_count())
+        self.index.set_ef(max(self.ef_search, k))
+        labels, _ = self.index.knn_query(queries, k=k)
+        return [row.astype(np.int64) for row in labels]
+
+    def save(self, directory: Path) -> Dict[str, Any]:
+        self.index.save_index(str(directory / "hnsw.bin"))
+        return {
+            "kind": self.kind,
+            "m": self.m,
+            "ef_construction": self.ef_construction,
+            "ef_search": self.ef_search,
+            "capacity": self.index.get_max_elements(),
+        }
+
+    @classmethod
+    def load(cls, directory: Path, spec: Dict[str, Any], dimension: int, ef_search: int = 0) -> "HNSWIndex":
+        index = cls(dimension, int(spec["m"]), int(spec["ef_construction"]), ef_search or int(spec["ef_search"]))
+        index.index.load_index(str(directory / "hnsw.bin"), max_elements=int(spec["capacity"]))
+        index.index.set_ef(index.ef_search)
+        return index
+
+
+class ANNConfig:
+    """Env-driven ANN settings for the in-memory store, mirroring PGVECTOR_* knobs"""
+
+    def __init__(self) -> None:
+        # "exact" (default), "ivf" (NumPy) or "hnsw" (hnswlib)
+        self.index_type = os.getenv("MEMORY_INDEX", "exact").lower()
+        # 0 = derive from corpus size: 4 * sqrt(rows) lists, sqrt(lists) probes
+        self.lists = int(os.getenv("MEMORY_LISTS", "0"))
+        self.probes = int(os.getenv("MEMORY_PROBES", "0"))
+        self.hnsw_m = int(os.getenv("MEMORY_HNSW_M", "16"))
+        self.hnsw_ef_construction = int(os.getenv("MEMORY_HNSW_EF_CONSTRUCTION", "200"))
+        self.hnsw_ef_search = int(os.getenv("MEMORY_HNSW_EF_SEARCH", "64"))
+        # below this many rows exact scans are fast enough and an index is not built
+        self.min_rows = int(os.getenv("MEMORY_INDEX_MIN_ROWS", "50000"))
+
+    @property
+    def enabled(self) -> bool:
+        return self.index_type in ("ivf", "hnsw")
+
+    def create(self, dimension: int):
+        if self.index_type == "hnsw":
+            return HNSWIndex(dimension, self.hnsw_m, self.hnsw_ef_construction, self.hnsw_ef_search)
+        return IVFIndex(self.lists, self.probes)
+
+    def load(self, directory: Path, spec: Dict[str, Any], dimension: int):
+        if spec.get("kind") == "hnsw":
+            if hnswlib is None:
+                logger.warning("Snapshot has an HNSW index but hnswlib is not installed; it will be rebuilt")
+                return None
+            return HNSWIndex.load(directory, spec, dimension, self.hnsw_ef_search)
+        return IVFIndex.load(directory, spec, self.probes)
+
+
+def build_index(config: ANNConfig, matrix: np.ndarray):
+    start = time.perf_counter()
+    index = config.create(matrix.shape[1])
+    index.build(matrix)
+    logger.info(f"Built {index.kind} index over {len(matrix)} rows in {time.perf_counter() - start:.1f}s")
+    return index
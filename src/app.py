@@ -1,37 +1,314 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import FileResponse, JSONResponse
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 
+import metrics
 from ingest import DataIngester
-from embed_and_load import ProductEmbedder
-from search import ProductSearcher
+from embed_and_load import ProductEmbedder, VectorDatabase
+from search import ProductSearcher, SearchOverloaded
+from catalog_sync import CatalogSync
+from bm25_index import BM25Index
+from item_graph import ItemGraph
+from snapshot import current_generation
+from profiling import MemoryTracker, ProfilingConfig, StackSampler, profile_call
+
 
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Product Search")
 
+BM25_PATH = "data/bm25_index.pkl"
+ITEM_GRAPH_PATH = os.getenv("ITEM_GRAPH_PATH", "data/item_graph")
+
+# Profiling endpoints answer 404 unless PROFILING_ENABLED is set
+profiling_config = ProfilingConfig()
+memory_tracker = MemoryTracker(profiling_config.tracemalloc_frames if profiling_config.enabled else 0)
+
+
+def _sync_catalog(embedder: ProductEmbedder) -> None:
+    ingester = DataIngester()
+    df = ingester.load_products()
+    df = ingester.preprocess_data(df)
+    catalog_sync = CatalogSync(embedder)
+    # Workers started by a bare `uvicorn --workers` each sync at startup; they
+    # take turns, and a worker that waited diffs against what the other saved
+    with catalog_sync.lock() as waited:
+        if waited:
+            embedder.restore_local_state()
+        # Start from the last saved state and only embed what changed since
+        stats = catalog_sync.sync(df)
+        if stats["mode"] == "full" or stats["added"] or stats["updated"] or stats["removed"]:
+            # Snapshot last: its CURRENT swap is what serving workers watch
+            embedder.save_bm25_index()
+            embedder.save_embeddings()
+
+
+def prepare_snapshot() -> None:
+    """Make sure a snapshot exists before workers start mapping it"""
+    embedder = ProductEmbedder(lazy_model=True)
+    if embedder.backend_type != "memory":
+        return
+    if not embedder.restore_local_state():
+        logger.info("No snapshot yet; syncing the catalog once before starting workers")
+        _sync_catalog(embedder)
+    elif not embedder.vector_db.is_mapped:
+        # Restored from a legacy pickle; convert it so workers can map it
+        embedder.save_bm25_index()
+        embedder.save_embeddings()
+
+
+def _reload_snapshot(remap_snapshot: bool = True) -> bool:
+    """Swap in newly published generations: the store snapshot (and its BM25
+    index) when ``remap_snapshot`` is set, and the item graph always"""
+    searcher = app.state.searcher
+    store, bm25_index, item_graph = searcher.vector_db, searcher.bm25_index, searcher.item_graph
+    switched = []
+    path = getattr(store, "snapshot_path", None) if remap_snapshot else None
+    generation = current_generation(Path(path)) if path is not None else None
+    if generation is not None and generation != store.snapshot_generation:
+        fresh = VectorDatabase()
+        fresh.load(path)
+        # Indexes the generation does not carry are built here, before the swap
+        fresh.build_indexes()
+        bm25_index = BM25Index.load(BM25_PATH) if os.path.exists(BM25_PATH) else None
+        switched.append(f"snapshot generation {fresh.snapshot_generation} (was {store.snapshot_generation})")
+        store = fresh
+    # item_graph.py publishes on its own schedule, so its pointer is checked separately
+    graph_generation = current_generation(Path(ITEM_GRAPH_PATH))
+    if graph_generation is not None and graph_generation != getattr(item_graph, "generation", None):
+        item_graph = ItemGraph.load(ITEM_GRAPH_PATH)
+        switched.append(f"item graph generation {item_graph.generation}")
+    if not switched:
+        return False
+    searcher.swap_stores(store, bm25_index, item_graph)
+    logger.info(f"Switched to {', '.join(switched)}")
+    return True
+
+
+async def _watch_snapshot(interval: float, remap_snapshot: bool) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(_reload_snapshot, remap_snapshot)
+        except Exception as e:
+            # A half-published generation is retried on the next tick
+            logger.warning(f"Snapshot reload failed: {e}")
+
+
+async def _flush_metrics(collector: metrics.MultiprocessCollector, interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(collector.flush)
+        except OSError as e:
+            logger.warning(f"Metrics flush failed: {e}")
+
 
 @app.on_event("startup")
-def on_startup() -> None:
+async def on_startup() -> None:
+    # Before anything is loaded, so the store's allocations are traced
+    memory_tracker.start()
     if getattr(app.state, "searcher", None) is not None:
         return
-    embedder = ProductEmbedder()
+    # With several workers each one publishes its metrics to METRICS_DIR so
+    # whichever worker answers /metrics can report all of them
+    metrics_dir = os.getenv("METRICS_DIR")
+    app.state.metrics_collector = None
+    if metrics.ENABLED and metrics_dir:
+        app.state.metrics_collector = metrics.MultiprocessCollector(metrics_dir)
+        app.state.metrics_flusher = asyncio.create_task(
+            _flush_metrics(app.state.metrics_collector, float(os.getenv("METRICS_FLUSH_SECONDS", "5")))
+        )
+    # "sync": diff the catalog CSV against the saved state before serving.
+    # "snapshot": serve the snapshot embed_and_load.py built and load the model
+    # in the background; readiness flips once it is warm.
+    snapshot_mode = os.getenv("APP_STARTUP", "sync").lower() == "snapshot"
+    embedder = ProductEmbedder(lazy_model=snapshot_mode)
     if embedder.backend_type == "memory":
-        ingester = DataIngester()
-        df = ingester.load_products()
-        df = ingester.preprocess_data(df)
-        vector_store = embedder.embed_products(df)
+        restored = await asyncio.to_thread(embedder.restore_local_state)
+        if snapshot_mode and restored:
+            logger.info("Serving prebuilt snapshot; run embed_and_load.py to pick up catalog changes")
+        else:
+            if snapshot_mode:
+                logger.warning("No snapshot to serve; syncing the catalog before startup")
+            await asyncio.to_thread(_sync_catalog, embedder)
+        vector_store = embedder.vector_db
+        # No-op when the snapshot carries the configured ANN index and codes
+        await asyncio.to_thread(vector_store.build_indexes)
     else:
         vector_store = embedder.vector_db
+        embedder.load_bm25_index()
+        CatalogSync(embedder).restore_catalog_version()
+
+    # One model instance serves both catalog embedding and query encoding
+    app.state.searcher = ProductSearcher(
+        vector_store, embedding_generator=embedder.embedding_generator, bm25_index=embedder.bm25_index,
+        item_graph=ItemGraph.load_if_exists(ITEM_GRAPH_PATH),
+    )
+    if snapshot_mode:
+        embedder.embedding_generator.warm_up_in_background()
+    # In snapshot mode the matrix is a read-only map of the snapshot files, so
+    # every worker shares the same page-cache pages; each one polls CURRENT and
+    # remaps when embed_and_load.py publishes a new generation. The item graph
+    # is published by item_graph.py on its own schedule and is polled in every
+    # mode and on every backend
+    interval = float(os.getenv("SNAPSHOT_RELOAD_SECONDS", "5"))
+    if interval > 0:
+        remap_snapshot = snapshot_mode and embedder.backend_type == "memory"
+        app.state.snapshot_watcher = asyncio.create_task(_watch_snapshot(interval, remap_snapshot))
 
-    app.state.searcher = ProductSearcher(vector_store)
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    for name in ("snapshot_watcher", "metrics_flusher"):
+        task = getattr(app.state, name, None)
+        if task is not None:
+            task.cancel()
+    searcher = getattr(app.state, "searcher", None)
+    if searcher is not None:
+        await searcher.aclose()
+
+
+@app.get("/api/ready")
+def api_ready() -> JSONResponse:
+    searcher = getattr(app.state, "searcher", None)
+    ready = searcher is not None and searcher.embedding_generator.is_ready
+    body = {"ready": ready}
+    if searcher is not None:
+        body["backend"] = searcher.backend_name
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+
+def _require_profiling(token: Optional[str]) -> ProfilingConfig:
+    if not profiling_config.enabled:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (needs PROFILING_ENABLED=1 and PROFILING_TOKEN)")
+    if not profiling_config.authorized(token):
+        raise HTTPException(status_code=403, detail="Invalid X-Profile-Token")
+    return profiling_config
 
 
 @app.get("/api/search")
-def api_search(query: str, k: int = 5) -> JSONResponse:
+async def api_search(query: str, k: int = 5, profile: Optional[str] = None,
+                     x_profile: Optional[str] = Header(None),
+                     x_profile_token: Optional[str] = Header(None)) -> JSONResponse:
     if not query or not query.strip():
         raise HTTPException(status_code=400, detail="Query is required")
-    results = app.state.searcher.simple_search(query.strip(), top_k=max(1, min(k, 50)))
-    return JSONResponse({"query": query, "results": results})
+    searcher = app.state.searcher
+    kind = profile or x_profile
+    if kind and profiling_config.enabled:
+        # The profiled request runs the synchronous path on one thread and skips
+        # the result cache, so the profile covers the actual search work
+        config = _require_profiling(x_profile_token)
+        kind = "sample" if kind.lower() == "sample" else "cprofile"
+        top_k = max(1, min(k, 50))
+        results, report = await asyncio.to_thread(
+            profile_call, kind, lambda: searcher.simple_search(query.strip(), top_k, use_cache=False), config
+        )
+        return JSONResponse({"query": query, "results": results, "profile": report})
+    try:
+        results = await searcher.asimple_search(query.strip(), top_k=max(1, min(k, 50)))
+    except SearchOverloaded as e:
+        # Shed load instead of queueing without bound behind the encoder
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    with metrics.stage("serialize", searcher.backend_name):
+        response = JSONResponse({"query": query, "results": results})
+    return response
+
+
+@app.get("/metrics")
+def api_metrics() -> PlainTextResponse:
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=0)")
+    body = metrics.exposition(getattr(app.state, "metrics_collector", None))
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/products/{product_id}/similar")
+def api_similar(product_id: str, k: int = 5) -> JSONResponse:
+    searcher = app.state.searcher
+    key = int(product_id) if product_id.isdigit() else product_id
+    results = searcher.get_recommendations(key, top_k=max(1, min(k, 50)))
+    similar = [
+        {
+            "id": r["id"],
+            "title": r["metadata"].get("title"),
+            "price": r["metadata"].get("price"),
+            "url": r["metadata"].get("url"),
+            "similarity": r["similarity"],
+        }
+        for r in results
+    ]
+    return JSONResponse({"id": product_id, "results": similar})
+
+
+@app.get("/api/browse/price")
+def api_browse_price(min_price: Optional[float] = None, max_price: Optional[float] = None,
+                     k: int = 20, offset: int = 0, order: str = "asc",
+                     after_price: Optional[float] = None, after_id: Optional[str] = None,
+                     count: bool = True) -> JSONResponse:
+    """Price-ordered pages; pass the previous response's ``next`` as
+    ``after_price``/``after_id`` to continue without re-scanning the skipped
+    rows, and ``count=false`` to skip the total"""
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    if (after_price is None) != (after_id is None):
+        raise HTTPException(status_code=400, detail="after_price and after_id go together")
+    limit = max(1, min(k, 100))
+    after = None if after_id is None else (after_price, after_id)
+    results, total = app.state.searcher.browse_by_price(
+        min_price, max_price, limit=limit, offset=max(0, offset), descending=order == "desc",
+        after=after, with_total=count
+    )
+    products = [
+        {
+            "id": r["id"],
+            "title": r["metadata"].get("title"),
+            "category": r["metadata"].get("category"),
+            "price": r["metadata"].get("price"),
+            "url": r["metadata"].get("url"),
+        }
+        for r in results
+    ]
+    last = products[-1] if len(products) == limit else None
+    next_cursor = None if last is None else {"after_price": last["price"], "after_id": last["id"]}
+    return JSONResponse({"offset": max(0, offset), "total": total, "next": next_cursor, "results": products})
+
+
+@app.post("/admin/profile")
+async def admin_profile(seconds: float = 10.0, interval_ms: Optional[float] = None,
+                        x_profile_token: Optional[str] = Header(None)) -> PlainTextResponse:
+    """Samples every thread for ``seconds`` and returns collapsed stacks
+    (``flamegraph.pl`` / speedscope input); the file is also kept in PROFILE_DIR"""
+    config = _require_profiling(x_profile_token)
+    duration = max(0.1, min(seconds, config.max_seconds))
+    sampler = StackSampler(interval_ms or config.sample_interval_ms).start()
+    try:
+        await asyncio.sleep(duration)
+    finally:
+        await asyncio.to_thread(sampler.stop)
+    path = sampler.save(config.output_path("sample", ".collapsed"))
+    return PlainTextResponse(
+        sampler.collapsed(), headers={"X-Profile-Path": str(path), "X-Profile-Samples": str(sampler.samples)}
+    )
+
+
+@app.get("/admin/memory")
+def admin_memory(limit: int = 25, group_by: str = "lineno",
+                 x_profile_token: Optional[str] = Header(None)) -> JSONResponse:
+    config = _require_profiling(x_profile_token)
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by must be lineno, filename or traceback")
+    store = app.state.searcher.vector_db
+    body = {"store": store.memory_usage() if hasattr(store, "memory_usage") else None}
+    if memory_tracker.tracing:
+        body["tracemalloc"] = memory_tracker.snapshot(config, max(1, min(limit, 200)), group_by)
+    return JSONResponse(body)
 
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -44,6 +321,16 @@ def root() -> FileResponse:
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000, reload=False)
+    workers = int(os.getenv("APP_WORKERS", "1"))
+    if workers > 1:
+        # Workers attach to one snapshot read-only instead of each syncing the
+        # catalog; build it once here, then start them in snapshot mode
+        os.environ["APP_STARTUP"] = "snapshot"
+        prepare_snapshot()
+        # Workers share their metrics through files; start from a clean directory
+        metrics.MultiprocessCollector.clear(os.environ.setdefault("METRICS_DIR", "data/metrics"))
+        uvicorn.run("app:app", host="127.0.0.1", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="127.0.0.1", port=8000, reload=False)
 
 
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Callable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-text encodes into one model call.
+
+    Callers ``submit`` a text and get a ``concurrent.futures.Future``. A
+    collector thread takes the first waiting text, keeps collecting for up to
+    ``max_wait_ms`` or until ``max_batch`` texts are queued, encodes the
+    batch with ``encode_fn`` and resolves every future with its row.
+
+    With an ``executor``, batches are encoded on it instead of the collector
+    thread, up to ``max_in_flight`` at a time; while all of them are busy the
+    collector waits and queued texts pile up into the next, larger batch.
+    """
+
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch: int = 32,
+        max_wait_ms: float = 3.0,
+        executor: Optional[Executor] = None,
+        max_in_flight: int = 1,
+    ) -> None:
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.executor = executor
+        self._slots = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.encoded = 0
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="encode-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        self._ensure_started()
+        self._queue.put((text, future))
+        return future
+
+    def _collect(self, first: Tuple[str, Future]) -> Tuple[List[Tuple[str, Future]], bool]:
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _encode_batch(self, batch: Sequence[Tuple[str, Future]]) -> None:
+        live = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not live:
+            return
+        # Identical queries arriving together are encoded once
+        unique = list(dict.fromkeys(text for text, _ in live))
+        try:
+            embeddings = self.encode_fn(unique)
+        except Exception as e:
+            for _, future in live:
+                future.set_exception(e)
+            return
+        rows = {text: embeddings[i] for i, text in enumerate(unique)}
+        for text, future in live:
+            future.set_result(rows[text])
+        with self._stats_lock:
+            self.batches += 1
+            self.encoded += len(unique)
+
+    def _encode_and_release(self, batch: Sequence[Tuple[str, Future]]) -> None:
+        try:
+            self._encode_batch(batch)
+        finally:
+            self._slots.release()
+
+    def _dispatch(self, batch: Sequence[Tuple[str, Future]]) -> None:
+        if self.executor is None:
+            self._encode_batch(batch)
+            return
+        try:
+            self.executor.submit(self._encode_and_release, batch)
+        except RuntimeError as e:
+            # Executor already shut down
+            self._slots.release()
+            for _, future in batch:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            if self.executor is not None:
+                # Wait for a free encode slot before closing the batch, so a
+                # busy pool makes batches bigger rather than the backlog longer
+                self._slots.acquire()
+            batch, stop = self._collect(item)
+            self._dispatch(batch)
+            if stop:
+                return
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.encoded / self.batches if self.batches else 0.0
+
+    def close(self) -> None:
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None and thread.is_alive():
+            self._queue.put(_STOP)
+            thread.join(timeout=5)
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import logging
+import os
+import pickle
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def tokenize(text: str) -> List[str]:
+    return text.lower().split()
+
+
+class BM25Index:
+    """Catalog-wide BM25 over a doc-major sparse term-document matrix.
+
+    Rows are appended as products are added; re-adding an id tombstones its
+    old row so document frequencies and average length stay exact. Once
+    tombstones pass ``COMPACT_RATIO`` of the rows the matrix is rewritten
+    with live rows only.
+    """
+
+    COMPACT_RATIO = 0.25
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.vocab: Dict[str, int] = {}
+        self.ids: List[Any] = []
+        self.id_to_row: Dict[str, int] = {}
+        # CSR: row r holds terms[indptr[r]:indptr[r + 1]] with counts tfs[...]
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._terms = np.empty(0, dtype=np.int32)
+        self._tfs = np.empty(0, dtype=np.float32)
+        self._doc_len = np.empty(0, dtype=np.float32)
+        self._alive = np.empty(0, dtype=bool)
+        self._df = np.empty(0, dtype=np.int64)
+        self._num_docs = 0
+        self._total_len = 0.0
+        self._idf: Optional[np.ndarray] = None
+        self._postings: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        # Backing storage of the arrays above, grown by doubling so that
+        # chunked ingest appends in amortized O(1) per entry
+        self._buffers: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return self._num_docs
+
+    @staticmethod
+    def document_text(metadata: Dict[str, Any]) -> str:
+        return (metadata.get('title') or '') + ' ' + (metadata.get('description') or '')
+
+    @classmethod
+    def build(cls, ids: Iterable[Any], texts: Iterable[str], **kwargs: Any) -> "BM25Index":
+        index = cls(**kwargs)
+        index.add_documents(ids, texts)
+        return index
+
+    def add_documents(self, ids: Iterable[Any], texts: Iterable[str]) -> None:
+        ids = list(ids)
+        texts = list(texts)
+        if len(ids) != len(texts):
+            raise ValueError("Lengths of ids and texts must match")
+        if not ids:
+            return
+        latest = {str(id_val): i for i, id_val in enumerate(ids)}
+        if len(latest) < len(ids):
+            # A batch that repeats an id keeps its last text only
+            keep = sorted(latest.values())
+            ids = [ids[i] for i in keep]
+            texts = [texts[i] for i in keep]
+
+        self.remove_documents(ids)
+
+        row_terms: List[np.ndarray] = []
+        row_tfs: List[np.ndarray] = []
+        lengths = np.empty(len(ids), dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            counts = Counter(tokens)
+            term_ids = np.fromiter((self._term_id(t) for t in counts), dtype=np.int32, count=len(counts))
+            row_terms.append(term_ids)
+            row_tfs.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            lengths[i] = len(tokens)
+
+        sizes = np.array([len(t) for t in row_terms], dtype=np.int64)
+        new_terms = np.concatenate(row_terms) if row_terms else np.empty(0, dtype=np.int32)
+        self._extend("_indptr", self._indptr[-1] + np.cumsum(sizes))
+        self._extend("_terms", new_terms)
+        self._extend("_tfs", np.concatenate(row_tfs) if row_tfs else np.empty(0, dtype=np.float32))
+        self._extend("_doc_len", lengths)
+        self._extend("_alive", np.ones(len(ids), dtype=bool))
+
+        if len(self._df) < len(self.vocab):
+            self._extend("_df", np.zeros(len(self.vocab) - len(self._df), dtype=np.int64))
+        np.add.at(self._df, new_terms, 1)
+
+        start = len(self.ids)
+        for offset, id_val in enumerate(ids):
+            self.id_to_row[str(id_val)] = start + offset
+        self.ids.extend(ids)
+        self._num_docs += len(ids)
+        self._total_len += float(lengths.sum())
+        self._idf = None
+        self._postings = None
+
+        logger.info(f"BM25 index updated with {len(ids)} documents ({self._num_docs} total, {len(self.vocab)} terms)")
+        self._maybe_compact()
+
+    def _extend(self, name: str, values: np.ndarray) -> None:
+        # The attribute stays a view of the filled prefix of its buffer, so
+        # in-place updates (tombstones, df counts) reach the buffer too
+        current = getattr(self, name)
+        size, needed = len(current), len(current) + len(values)
+        buffer = self._buffers.get(name)
+        if buffer is None or needed > len(buffer):
+            buffer = np.empty(max(needed, 2 * size, 1024), dtype=current.dtype)
+            buffer[:size] = current
+            self._buffers[name] = buffer
+        buffer[size:needed] = values
+        setattr(self, name, buffer[:needed])
+
+    def remove_documents(self, ids: Iterable[Any]) -> None:
+        for id_val in ids:
+            row = self.id_to_row.pop(str(id_val), None)
+            if row is None or not self._alive[row]:
+                continue
+            start, end = self._indptr[row], self._indptr[row + 1]
+            self._df[self._terms[start:end]] -= 1
+            self._alive[row] = False
+            self._num_docs -= 1
+            self._total_len -= float(self._doc_len[row])
+            self._idf = None
+            self._postings = None
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        dead = len(self.ids) - self._num_docs
+        if dead and dead > self.COMPACT_RATIO * len(self.ids):
+            self.compact()
+
+    def compact(self) -> None:
+        """Drop tombstoned rows from the matrix, ids and length statistics"""
+        alive = np.flatnonzero(self._alive)
+        if len(alive) == len(self.ids):
+            return
+        positions, lengths = self._row_positions(alive)
+        self._buffers = {}
+        self._indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self._terms = self._terms[positions]
+        self._tfs = self._tfs[positions]
+        self._doc_len = self._doc_len[alive]
+        self._alive = np.ones(len(alive), dtype=bool)
+        dropped = len(self.ids) - len(alive)
+        self.ids = [self.ids[row] for row in alive.tolist()]
+        self.id_to_row = {str(id_val): row for row, id_val in enumerate(self.ids)}
+        # Recomputed from live rows so float drift from many removals does not accumulate
+        self._total_len = float(self._doc_len.sum(dtype=np.float64))
+        self._idf = None
+        self._postings = None
+        logger.info(f"BM25 index compacted: dropped {dropped} replaced or removed rows")
+
+    def _row_positions(self, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # Positions in _terms/_tfs of every entry of ``rows``, in row order
+        starts = self._indptr[rows]
+        lengths = self._indptr[rows + 1] - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return positions, lengths
+
+    def _term_id(self, term: str) -> int:
+        term_id = self.vocab.get(term)
+        if term_id is None:
+            term_id = len(self.vocab)
+            self.vocab[term] = term_id
+        return term_id
+
+    @property
+    def idf(self) -> np.ndarray:
+        if self._idf is None:
+            df = self._df.astype(np.float64)
+            n = float(self._num_docs)
+            self._idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        return self._idf
+
+    def _query_weights(self, query: str) -> Dict[int, int]:
+        counts = Counter(tokenize(query))
+        return {self.vocab[t]: c for t, c in counts.items() if t in self.vocab}
+
+    def score_rows(self, query: str, rows: np.ndarray) -> np.ndarray:
+        rows = np.asarray(rows, dtype=np.int64)
+        scores = np.zeros(len(rows), dtype=np.float32)
+        weights = self._query_weights(query)
+        if not weights or len(rows) == 0 or self._num_docs == 0:
+            return scores
+
+        # Gather every (candidate, term) entry of the candidate rows in one shot
+        positions, lengths = self._row_positions(rows)
+        owner = np.repeat(np.arange(len(rows)), lengths)
+        terms = self._terms[positions]
+
+        query_terms = np.fromiter(weights.keys(), dtype=np.int32)
+        hit = np.isin(terms, query_terms)
+        if not hit.any():
+            return scores
+        owner, terms, tfs = owner[hit], terms[hit], self._tfs[positions[hit]]
+
+        query_weight = np.zeros(len(self.vocab), dtype=np.float32)
+        query_weight[query_terms] = np.fromiter(weights.values(), dtype=np.float32)
+        avgdl = self._total_len / self._num_docs if self._num_docs else 1.0
+        norm = self.k1 * (1 - self.b + self.b * self._doc_len[rows[owner]] / (avgdl or 1.0))
+        contrib = query_weight[terms] * self.idf[terms] * tfs * (self.k1 + 1) / (tfs + norm)
+        np.add.at(scores, owner, contrib)
+        return scores
+
+    def _term_postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Term-major transpose of the doc-major matrix, rebuilt only after updates
+        if self._postings is None:
+            rows = np.repeat(np.arange(len(self._doc_len), dtype=np.int64), np.diff(self._indptr))
+            order = np.argsort(self._terms, kind='stable')
+            counts = np.bincount(self._terms, minlength=len(self.vocab))
+            indptr = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+            self._postings = (indptr, rows[order], self._tfs[order])
+        return self._postings
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[Any, float]]:
+        weights = self._query_weights(query)
+        if not weights or self._num_docs == 0 or top_k <= 0:
+            return []
+
+        indptr, post_rows, post_tfs = self._term_postings()
+        avgdl = self._total_len / self._num_docs if self._num_docs else 1.0
+        scores = np.zeros(len(self._doc_len), dtype=np.float32)
+        idf = self.idf
+        for term_id, qtf in weights.items():
+            start, end = indptr[term_id], indptr[term_id + 1]
+            rows, tfs = post_rows[start:end], post_tfs[start:end]
+            norm = self.k1 * (1 - self.b + self.b * self._doc_len[rows] / (avgdl or 1.0))
+            scores[rows] += qtf * idf[term_id] * tfs * (self.k1 + 1) / (tfs + norm)
+
+        scores[~self._alive] = 0.0
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(scores[matched], -top_k)[-top_k:]]
+        matched = matched[np.argsort(scores[matched])[::-1]]
+        return [(self.ids[row], float(scores[row])) for row in matched]
+
+    def score(self, query: str, ids: Iterable[Any]) -> np.ndarray:
+        ids = list(ids)
+        rows = np.array([self.id_to_row.get(str(i), -1) for i in ids], dtype=np.int64)
+        known = rows >= 0
+        scores = np.zeros(len(ids), dtype=np.float32)
+        if known.any():
+            scores[known] = self.score_rows(query, rows[known])
+        return scores
+
+    def save(self, filepath: str) -> None:
+        path = Path(filepath)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Views pickle only their filled prefix; the spare buffer capacity is dropped
+        state = {k: v for k, v in self.__dict__.items() if k not in ('_idf', '_postings', '_buffers')}
+        # Written aside and renamed so a reloading worker never reads a partial file
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(state, f)
+        os.replace(tmp_path, path)
+        logger.info(f"BM25 index saved to {filepath}")
+
+    @classmethod
+    def load(cls, filepath: str) -> "BM25Index":
+        with open(filepath, 'rb') as f:
+            state = pickle.load(f)
+        index = cls()
+        index.__dict__.update(state)
+        index._idf = None
+        index._postings = None
+        index._buffers = {}
+        logger.info(f"BM25 index loaded from {filepath} ({index._num_docs} documents)")
+        return index
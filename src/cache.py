@@ -0,0 +1,457 @@
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def fresh_catalog_version() -> str:
+    """Catalog version for a store state no sync has committed yet (an
+    in-progress write or an unversioned load). It is unique, so results
+    cached under it are never served for another state, by this process
+    or any later one sharing the result cache."""
+    return f"uncommitted-{uuid.uuid4().hex}"
+
+
+class QueryEmbeddingCache:
+    """Bounded, thread-safe LRU of query embeddings with TTL expiry"""
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl_seconds: Optional[float] = 3600.0,
+        persist_path: Optional[str] = None,
+    ) -> None:
+        self.max_size = max(0, int(max_size))
+        self.ttl_seconds = ttl_seconds if ttl_seconds and ttl_seconds > 0 else None
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.persist_path is not None:
+            self.load()
+            atexit.register(self.save)
+
+    @classmethod
+    def from_env(cls) -> "QueryEmbeddingCache":
+        return cls(
+            max_size=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+            ttl_seconds=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+            persist_path=os.getenv("QUERY_CACHE_PATH") or None,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl_seconds is not None and now - stored_at > self.ttl_seconds
+
+    def get(self, model_name: str, query: str) -> Optional[np.ndarray]:
+        if not self.enabled:
+            return None
+        key = (model_name, normalize_query(query))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[0], now):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, model_name: str, query: str, embedding: np.ndarray) -> None:
+        if not self.enabled:
+            return
+        vector = np.array(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        key = (model_name, normalize_query(query))
+        with self._lock:
+            self._entries[key] = (time.time(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            size = len(self._entries)
+        total = self.hits + self.misses
+        return {
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+    def save(self) -> None:
+        if self.persist_path is None:
+            return
+        now = time.time()
+        with self._lock:
+            live = [
+                (key, stored_at, vec) for key, (stored_at, vec) in self._entries.items()
+                if not self._expired(stored_at, now)
+            ]
+        if not live:
+            return
+        try:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.persist_path.with_name(self.persist_path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    models=np.array([key[0] for key, _, _ in live]),
+                    queries=np.array([key[1] for key, _, _ in live]),
+                    stored_at=np.array([stored_at for _, stored_at, _ in live], dtype=np.float64),
+                    embeddings=np.stack([vec for _, _, vec in live]),
+                )
+            os.replace(tmp_path, self.persist_path)
+            logger.info(f"Saved {len(live)} cached query embeddings to {self.persist_path}")
+        except Exception as e:
+            logger.warning(f"Failed to persist query embedding cache: {e}")
+
+    def load(self) -> None:
+        if self.persist_path is None or not self.persist_path.exists():
+            return
+        try:
+            with np.load(self.persist_path) as data:
+                models = data["models"].tolist()
+                queries = data["queries"].tolist()
+                stored_at = data["stored_at"].tolist()
+                embeddings = data["embeddings"]
+            now = time.time()
+            with self._lock:
+                # Oldest first so the LRU order survives the round trip
+                for i in np.argsort(stored_at):
+                    if self._expired(stored_at[i], now):
+                        continue
+                    vector = np.array(embeddings[i], dtype=np.float32)
+                    vector.setflags(write=False)
+                    self._entries[(models[i], queries[i])] = (stored_at[i], vector)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+            logger.info(f"Loaded {len(self._entries)} cached query embeddings from {self.persist_path}")
+        except Exception as e:
+            logger.warning(f"Failed to load query embedding cache: {e}")
+
+
+class InProcessResultBackend:
+
+    def __init__(self, max_size: int = 2048) -> None:
+        self.max_size = max(0, int(max_size))
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any) -> None:
+        if self.max_size == 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class SqliteResultBackend:
+    """File-backed result store shared by every worker process on the host"""
+
+    def __init__(self, path: str = "data/result_cache.sqlite", max_size: int = 50000) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size = max(0, int(max_size))
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(str(self.path), timeout=5.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_stored_at ON results (stored_at)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[float, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stored_at, value FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def set(self, key: str, value: Any) -> None:
+        if self.max_size == 0:
+            return
+        payload = json.dumps(value, default=_json_default)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, payload, time.time()),
+            )
+            self._writes += 1
+            # Trim occasionally rather than on every write
+            if self._writes % 256 == 0:
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN ("
+                    " SELECT key FROM results ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_size,),
+                )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+
+def _json_default(value: Any) -> Any:
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class ResultCache:
+    """Search response cache keyed on (query, k, backend, catalog version)"""
+
+    def __init__(self, backend: Any, ttl_seconds: Optional[float] = 300.0) -> None:
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds if ttl_seconds and ttl_seconds > 0 else None
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> Optional["ResultCache"]:
+        kind = os.getenv("RESULT_CACHE", "memory").lower()
+        max_size = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+        ttl = float(os.getenv("RESULT_CACHE_TTL", "300"))
+        if kind in ("", "off", "none", "0") or max_size <= 0:
+            return None
+        if kind == "sqlite":
+            path = os.getenv("RESULT_CACHE_PATH", "data/result_cache.sqlite")
+            try:
+                return cls(SqliteResultBackend(path, max_size=max_size), ttl_seconds=ttl)
+            except Exception as e:
+                logger.warning(f"Shared result cache unavailable, falling back to in-process cache: {e}")
+        return cls(InProcessResultBackend(max_size=max_size), ttl_seconds=ttl)
+
+    @staticmethod
+    def make_key(query: str, top_k: int, backend_name: str, catalog_version: Any) -> str:
+        return json.dumps([normalize_query(query), int(top_k), backend_name, str(catalog_version)])
+
+    def get(self, query: str, top_k: int, backend_name: str, catalog_version: Any) -> Optional[List[Dict[str, Any]]]:
+        key = self.make_key(query, top_k, backend_name, catalog_version)
+        entry = self.backend.get(key)
+        if entry is not None and self.ttl_seconds is not None and time.time() - entry[0] > self.ttl_seconds:
+            self.backend.delete(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [dict(r) for r in entry[1]]
+
+    def put(self, query: str, top_k: int, backend_name: str, catalog_version: Any,
+            results: List[Dict[str, Any]]) -> None:
+        key = self.make_key(query, top_k, backend_name, catalog_version)
+        self.backend.set(key, [dict(r) for r in results])
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
+
+
+class EmbeddingCache:
+    """Content-addressed on-disk embedding store (model + exact text -> float32 vector).
+
+    Each model gets a directory holding two append-only files: ``keys.bin``
+    with fixed-width 16-byte digests and ``vectors.f32`` with the matching
+    raw float32 rows, which is memory-mapped for reads.
+    """
+
+    KEY_BYTES = 16
+
+    def __init__(self, directory: str, model_name: str) -> None:
+        safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in model_name)
+        self.directory = Path(directory) / safe_name
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self.keys_path = self.directory / "keys.bin"
+        self.vectors_path = self.directory / "vectors.f32"
+        self.meta_path = self.directory / "meta.json"
+        self.dimension: Optional[int] = None
+        self._rows: Dict[bytes, int] = {}
+        # Complete (key, vector) pairs read so far; the files only ever grow
+        # past this point, so later refreshes read just the tail
+        self._count = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    @classmethod
+    def from_env(cls, model_name: str) -> Optional["EmbeddingCache"]:
+        directory = os.getenv("EMBEDDING_CACHE_DIR", "data/embedding_cache")
+        if directory.lower() in ("", "off", "none", "0"):
+            return None
+        try:
+            return cls(directory, model_name)
+        except Exception as e:
+            logger.warning(f"Embedding cache disabled: {e}")
+            return None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).digest()[:self.KEY_BYTES]
+
+    def _load(self) -> None:
+        self._rows = {}
+        self._count = 0
+        self._refresh()
+        if self._count:
+            logger.info(f"Embedding cache at {self.directory} holds {self._count} vectors")
+
+    def _refresh(self) -> None:
+        if self.dimension is None and self.meta_path.exists():
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dimension = int(json.load(f)["dimension"])
+        if self.dimension is None or not self.keys_path.exists():
+            return
+        stored_keys = self.keys_path.stat().st_size // self.KEY_BYTES
+        stored_rows = self.vectors_path.stat().st_size // (self.dimension * 4) if self.vectors_path.exists() else 0
+        # A crash between the two appends leaves extra keys; trust only complete pairs
+        count = min(stored_keys, stored_rows)
+        if count < self._count:
+            # The files were replaced or cleared underneath us; start over
+            self._rows, self._count = {}, 0
+        if count == self._count:
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._count * self.KEY_BYTES)
+            tail = np.frombuffer(f.read((count - self._count) * self.KEY_BYTES), dtype=f"S{self.KEY_BYTES}")
+        for offset, key in enumerate(tail):
+            self._rows[bytes(key)] = self._count + offset
+        self._count = count
+        self._vectors = None
+
+    def _matrix(self) -> Optional[np.ndarray]:
+        if not self._rows or self.dimension is None:
+            return None
+        if self._vectors is None or self._vectors.shape[0] < self._count:
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(self._count, self.dimension)
+            )
+        return self._vectors
+
+    def get_many(self, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        with self._lock:
+            matrix = self._matrix()
+            found: Dict[int, np.ndarray] = {}
+            missing: List[int] = []
+            for i, text in enumerate(texts):
+                row = self._rows.get(self.key(text))
+                if row is None or matrix is None:
+                    missing.append(i)
+                else:
+                    found[i] = matrix[row]
+            return found, missing
+
+    def put_many(self, texts: List[str], vectors: np.ndarray) -> None:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = int(vectors.shape[1])
+                with open(self.meta_path, "w", encoding="utf-8") as f:
+                    json.dump({"model": self.model_name, "dimension": self.dimension}, f)
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(f"Expected embeddings of dimension {self.dimension}, got {vectors.shape[1]}")
+
+            with open(self.directory / "write.lock", "wb") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # Pick up rows other processes appended since we last looked, and
+                # drop any torn tail so both files stay row-aligned
+                self._refresh()
+                for path, width in ((self.keys_path, self.KEY_BYTES), (self.vectors_path, self.dimension * 4)):
+                    if path.exists() and path.stat().st_size != self._count * width:
+                        os.truncate(path, self._count * width)
+
+                new_keys: List[bytes] = []
+                new_rows: List[int] = []
+                pending = set()
+                for i, text in enumerate(texts):
+                    key = self.key(text)
+                    if key in self._rows or key in pending:
+                        continue
+                    pending.add(key)
+                    new_keys.append(key)
+                    new_rows.append(i)
+                if not new_keys:
+                    return
+
+                # Vectors first, keys second: a torn write never exposes a key without its row
+                with open(self.vectors_path, "ab") as f:
+                    f.write(vectors[new_rows].tobytes())
+                with open(self.keys_path, "ab") as f:
+                    f.write(b"".join(new_keys))
+                for offset, key in enumerate(new_keys):
+                    self._rows[key] = self._count + offset
+                self._count += len(new_keys)
+                self._vectors = None
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+import pandas as pd
+
+from bm25_index import BM25Index
+from embed_and_load import EmbeddingPipeline
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSync:
+    """Delta sync of a product DataFrame into the embedder's active vector store.
+
+    A per-backend manifest records a content hash for every product; only
+    new or changed products are re-embedded and upserted, and products that
+    disappeared from the catalog are deleted.
+    """
+
+    def __init__(self, embedder: Any, manifest_path: Optional[str] = None) -> None:
+        self.embedder = embedder
+        self.manifest_path = Path(manifest_path or f"data/catalog_manifest.{embedder.backend_type}.json")
+
+    @staticmethod
+    def content_hash(text: str, metadata: Dict[str, Any]) -> str:
+        # Metadata is hashed too so price/url edits reach the store; the text
+        # drives the embedding, so unchanged text is cheap to re-encode when
+        # the embedding cache is on
+        payload = text + "\x1f" + json.dumps(metadata, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def catalog_digest(self, hashes: Dict[str, str]) -> str:
+        """Content-derived catalog version: equal digests mean equal store
+        contents, so result-cache entries keyed on it stay valid across restarts
+        and rebuilds and can never be reused for a different catalog"""
+        generator = self.embedder.embedding_generator
+        digest = hashlib.sha256(f"{generator.model_name}@{generator.inference_config.variant}".encode("utf-8"))
+        for id_val in sorted(hashes):
+            digest.update(f"\x1e{id_val}\x1f{hashes[id_val]}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def restore_catalog_version(self) -> Optional[str]:
+        """Give a store that was not synced in this process (Pinecone at app
+        startup) the digest of the last committed sync"""
+        digest = self.load_manifest().get("digest")
+        store = self.embedder.vector_db
+        if digest and hasattr(store, "set_catalog_version"):
+            store.set_catalog_version(digest)
+        return digest
+
+    @contextmanager
+    def lock(self) -> Iterator[bool]:
+        """Hold the backend's sync lock for a load-sync-save cycle; yields
+        whether another process held it first, in which case the caller's
+        restored state predates that process's save and should be reloaded"""
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.manifest_path.with_name(self.manifest_path.name + ".lock"), "wb") as lock_file:
+            waited = False
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    logger.info("Waiting for another process to finish its catalog sync")
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    waited = True
+            yield waited
+
+    def load_manifest(self) -> Dict[str, Any]:
+        if not self.manifest_path.exists():
+            return {}
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable catalog manifest {self.manifest_path}: {e}")
+            return {}
+
+    def save_manifest(self, manifest: Dict[str, Any]) -> None:
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.manifest_path.with_name(self.manifest_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _full_reload_reason(self, manifest: Dict[str, Any], full: bool) -> Optional[str]:
+        if full:
+            return "requested"
+        if not manifest.get("hashes"):
+            return "no manifest"
+        generator = self.embedder.embedding_generator
+        # ONNX and int8 vectors differ from PyTorch ones, so a backend switch re-embeds too
+        if (manifest.get("model") != generator.model_name
+                or manifest.get("variant", "") != generator.inference_config.variant):
+            return "embedding model changed"
+        store = self.embedder.vector_db
+        if hasattr(store, "count"):
+            try:
+                if store.count() != len(manifest["hashes"]):
+                    return "store does not match manifest"
+            except Exception as e:
+                return f"store count unavailable ({e})"
+        return None
+
+    def sync(self, df: pd.DataFrame, full: bool = False) -> Dict[str, Any]:
+        texts, metadata, ids = self.embedder.product_records(df)
+        hashes = {str(id_val): self.content_hash(t, md) for t, md, id_val in zip(texts, metadata, ids)}
+
+        manifest = self.load_manifest()
+        previous: Dict[str, str] = manifest.get("hashes", {})
+        removed = [id_val for id_val in previous if id_val not in hashes]
+        store = self.embedder.vector_db
+
+        reason = self._full_reload_reason(manifest, full)
+        if reason is not None:
+            logger.info(f"Full catalog load of {len(ids)} products ({reason})")
+            if hasattr(store, "clear"):
+                store.clear()
+            self.embedder.bm25_index = BM25Index()
+            self.embedder.embed_products(df)
+            if removed and not hasattr(store, "clear"):
+                # Stores that upsert (Pinecone) keep products the catalog dropped
+                store.delete_ids(removed)
+            stats = {"mode": "full", "added": len(ids), "updated": 0, "removed": len(removed), "unchanged": 0}
+        else:
+            changed = [i for i, id_val in enumerate(ids) if previous.get(str(id_val)) != hashes[str(id_val)]]
+            added = sum(1 for i in changed if str(ids[i]) not in previous)
+
+            if len(self.embedder.bm25_index) != len(previous):
+                logger.info("BM25 index does not match manifest; rebuilding it from the catalog")
+                self.embedder.bm25_index = BM25Index.build(ids, [BM25Index.document_text(md) for md in metadata])
+
+            if changed:
+                # Large deltas stream through the same chunked pipeline as a full load
+                chunk_rows = int(os.getenv("EMBED_CHUNK_ROWS", "10000"))
+                record_chunks = (
+                    ([texts[i] for i in part], [metadata[i] for i in part], [ids[i] for i in part])
+                    for part in (changed[s:s + chunk_rows] for s in range(0, len(changed), chunk_rows))
+                )
+                pipeline = EmbeddingPipeline(self.embedder.embedding_generator)
+                for embeddings, changed_metadata, changed_ids in pipeline.run(record_chunks, total=len(changed)):
+                    store.upsert_embeddings(embeddings, changed_metadata, changed_ids)
+                    self.embedder.bm25_index.add_documents(
+                        changed_ids, [BM25Index.document_text(md) for md in changed_metadata]
+                    )
+            if removed:
+                store.delete_ids(removed)
+                self.embedder.bm25_index.remove_documents(removed)
+
+            stats = {
+                "mode": "delta",
+                "added": added,
+                "updated": len(changed) - added,
+                "removed": len(removed),
+                "unchanged": len(ids) - len(changed),
+            }
+
+        changes = stats["added"] + stats["updated"] + stats["removed"]
+        version = int(manifest.get("version", 0)) + (1 if changes else 0)
+        digest = self.catalog_digest(hashes)
+        stats["version"] = version
+        stats["digest"] = digest
+        # pgvector counts versions in the database itself; the other stores take the digest
+        if hasattr(store, "set_catalog_version"):
+            store.set_catalog_version(digest)
+        self.save_manifest({
+            "model": self.embedder.embedding_generator.model_name,
+            "variant": self.embedder.embedding_generator.inference_config.variant,
+            "backend": self.embedder.backend_type,
+            "version": version,
+            "digest": digest,
+            "updated_at": datetime.now().isoformat(),
+            "count": len(hashes),
+            "hashes": hashes,
+        })
+
+        logger.info(
+            f"Catalog sync ({stats['mode']}): {stats['added']} added, {stats['updated']} updated, "
+            f"{stats['removed']} removed, {stats['unchanged']} unchanged -> catalog version {version}"
+        )
+        return stats
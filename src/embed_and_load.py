@@ -1,12 +1,23 @@
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Deque, Iterator, Optional, Tuple
 import os
 import pickle
+import threading
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
+from bm25_index import BM25Index
+from filters import SearchFilter
+from cache import EmbeddingCache, fresh_catalog_version
+from snapshot import is_snapshot, read_snapshot, write_snapshot
+from ann_index import ANNConfig, build_index
+from quantization import QuantizationConfig
+from inference import InferenceConfig, load_encoder
 load_dotenv()
 
 logging.basicConfig(level=logging.INFO)
@@ -14,24 +25,58 @@ logger = logging.getLogger(__name__)
 
 
 class EmbeddingGenerator:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 cache: Optional[EmbeddingCache] = None, lazy: bool = False,
+                 backend: Optional[str] = None):
         self.model_name = model_name
         self.model = None
-        self._load_model()
+        # EMBEDDING_BACKEND picks PyTorch (default) or onnxruntime inference
+        self.inference_config = InferenceConfig(backend)
+        variant = self.inference_config.variant
+        if cache is None:
+            # ONNX/int8 vectors differ slightly from PyTorch ones, so they get their own cache
+            cache = EmbeddingCache.from_env(f"{model_name}@{variant}" if variant else model_name)
+        self.cache = cache
+        self._model_lock = threading.Lock()
+        self._warm_thread: Optional[threading.Thread] = None
+        if not lazy:
+            self._load_model()
     
     def _load_model(self):
+        with self._model_lock:
+            if self.model is not None:
+                return
+            try:
+                logger.info(f"Loading model: {self.model_name} ({self.inference_config.backend})")
+                self.model = load_encoder(self.model_name, self.inference_config)
+                logger.info("Model loaded successfully")
+            except Exception as e:
+                logger.error(f"Error loading model: {e}")
+                raise
+
+    @property
+    def is_ready(self) -> bool:
+        warming = self._warm_thread is not None and self._warm_thread.is_alive()
+        return self.model is not None and not warming
+
+    def _warm_up(self):
         try:
-            logger.info(f"Loading model: {self.model_name}")
-            self.model = SentenceTransformer(self.model_name)
-            logger.info("Model loaded successfully")
+            self._load_model()
+            # The first encode pays for lazy kernel/tokenizer setup; do it off the request path
+            self.model.encode(["warm up"], show_progress_bar=False)
+            logger.info("Model warm")
         except Exception as e:
-            logger.error(f"Error loading model: {e}")
-            raise
+            logger.error(f"Background model warm-up failed: {e}")
+
+    def warm_up_in_background(self) -> threading.Thread:
+        if self._warm_thread is None:
+            self._warm_thread = threading.Thread(target=self._warm_up, name="model-warm-up", daemon=True)
+            self._warm_thread.start()
+        return self._warm_thread
     
-    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
-        if not texts:
-            return np.array([])
-        
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        # Blocks until a background load finishes (or loads now if none was started)
+        self._load_model()
         try:
             logger.info(f"Generating embeddings for {len(texts)} texts")
             embeddings = self.model.encode(texts, show_progress_bar=True)
@@ -40,75 +85,689 @@ class EmbeddingGenerator:
         except Exception as e:
             logger.error(f"Error generating embeddings: {e}")
             raise
+
+    def generate_embeddings(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
+        if not texts:
+            return np.array([])
+        if self.cache is None or not use_cache:
+            return self._encode(texts)
+
+        # Only texts the content-addressed cache has never seen go through the model
+        found, missing = self.cache.get_many(texts)
+        if missing:
+            encoded = np.asarray(self._encode([texts[i] for i in missing]), dtype=np.float32)
+            self.cache.put_many([texts[i] for i in missing], encoded)
+            found.update(zip(missing, encoded))
+        logger.info(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} encoded")
+        return np.stack([found[i] for i in range(len(texts))]).astype(np.float32, copy=False)
     
     def generate_single_embedding(self, text: str) -> np.ndarray:
-        return self.generate_embeddings([text])[0]
+        # Queries are cached in memory by ProductSearcher; keep them out of the disk cache
+        return self.generate_embeddings([text], use_cache=False)[0]
 
 
 class VectorDatabase:
-    def __init__(self):
-        self.embeddings = []
+    # Rows are kept L2-normalized in a preallocated float32 matrix so a query is
+    # a single matvec; capacity doubles on growth to keep appends amortized O(1).
+    # A store loaded from a snapshot serves straight from read-only memory maps
+    # and copies itself into private arrays on the first write.
+    backend_name = "memory"
+
+    def __init__(self, dimension: Optional[int] = None, initial_capacity: int = 1024,
+                 quantization: Optional[str] = None):
+        self.dimension = dimension
+        # Result-cache key for the current contents: the digest CatalogSync
+        # commits (and the snapshot records), or a unique placeholder after
+        # writes that no sync has committed yet
+        self.catalog_version = fresh_catalog_version()
         self.metadata = []
         self.ids = []
-    
+        self._id_to_row: Dict[str, int] = {}
+        self._initial_capacity = max(1, int(initial_capacity))
+        self._matrix: Optional[np.ndarray] = None
+        self._size = 0
+        # Filter side indexes: a price column aligned with the matrix rows,
+        # per-category row arrays and the priced rows in price order with
+        # their sorted prices (both rebuilt lazily after writes)
+        self._prices = np.empty(0, dtype=np.float64)
+        self._category_rows: Optional[Dict[str, np.ndarray]] = None
+        self._price_order: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        # Optional ANN index (MEMORY_INDEX); built by build_indexes() (at save,
+        # startup and reload, never by a search) once the store reaches
+        # MEMORY_INDEX_MIN_ROWS, and maintained through writes
+        self.ann_config = ANNConfig()
+        self._ann = None
+        # Optional int8/PQ codes (MEMORY_QUANTIZATION or the quantization
+        # argument) scanned in place of the float32 matrix, which then only
+        # re-ranks a shortlist and is kept file-backed (MEMORY_SPILL_DIR)
+        self.quantization_config = QuantizationConfig(quantization)
+        self._codes = None
+        self._matrix_file_backed = False
+        self._index_lock = threading.RLock()
+        # Snapshot generation this store maps, if any; serving workers compare
+        # it with the snapshot's CURRENT pointer to pick up reloads
+        self.snapshot_path: Optional[str] = None
+        self.snapshot_generation: Optional[str] = None
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        if self._matrix is None:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        return self._matrix[:self._size]
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _reserve(self, capacity: int) -> None:
+        current = 0 if self._matrix is None else self._matrix.shape[0]
+        if capacity <= current:
+            return
+        new_capacity = max(self._initial_capacity, current)
+        while new_capacity < capacity:
+            new_capacity *= 2
+        matrix = self._allocate_matrix(new_capacity)
+        prices = np.full(new_capacity, np.nan, dtype=np.float64)
+        if self._size:
+            matrix[:self._size] = self._matrix[:self._size]
+            prices[:self._size] = self._prices[:self._size]
+        self._matrix = matrix
+        self._prices = prices
+
+    def _allocate_matrix(self, rows: int) -> np.ndarray:
+        # Quantized stores scan codes and touch float32 rows only to re-rank,
+        # so those rows live in page-cache pages the OS can evict
+        self._matrix_file_backed = self.quantization_config.enabled
+        if self._matrix_file_backed:
+            return self.quantization_config.allocate_matrix((rows, self.dimension))
+        return np.empty((rows, self.dimension), dtype=np.float32)
+
+    @property
+    def is_mapped(self) -> bool:
+        return not isinstance(self.metadata, list)
+
+    def _detach(self) -> None:
+        if not self.is_mapped:
+            return
+        self.metadata = list(self.metadata)
+        self.ids = list(self.ids)
+        self._id_to_row = {str(id_val): row for row, id_val in enumerate(self.ids)}
+        if self._matrix is not None:
+            matrix = self._allocate_matrix(self._size)
+            matrix[:] = self._matrix[:self._size]
+            self._matrix = matrix
+            self._prices = np.array(self._prices[:self._size])
+        if self._category_rows is not None:
+            self._category_rows = {c: np.array(rows) for c, rows in self._category_rows.items()}
+        if self._price_order is not None:
+            self._price_order = tuple(np.array(part) for part in self._price_order)
+        for index in self._row_indexes():
+            index.detach()
+        logger.info("Snapshot-backed store copied into memory for writing")
+
+    @staticmethod
+    def _price_of(md: Dict) -> float:
+        price = md.get('price')
+        return float(price) if isinstance(price, (int, float, np.floating)) else np.nan
+
     def add_embeddings(self, embeddings: np.ndarray, metadata: List[Dict], ids: List[Any]):
         if len(embeddings) != len(metadata) or len(embeddings) != len(ids):
             raise ValueError("Lengths of embeddings, metadata, and ids must match")
-        
-        self.embeddings.extend(embeddings)
+        if len(embeddings) == 0:
+            return
+
+        self._detach()
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+        elif vectors.shape[1] != self.dimension:
+            raise ValueError(f"Expected embeddings of dimension {self.dimension}, got {vectors.shape[1]}")
+
+        count = vectors.shape[0]
+        self._reserve(self._size + count)
+        self._matrix[self._size:self._size + count] = self._normalize(vectors)
+        for index in self._row_indexes():
+            index.add(self._matrix[self._size:self._size + count], self._size)
+        self._prices[self._size:self._size + count] = [self._price_of(md) for md in metadata]
+        self._size += count
+        self._category_rows = None
+        self._price_order = None
+        for offset, id_val in enumerate(ids):
+            self._id_to_row[str(id_val)] = self._size - count + offset
         self.metadata.extend(metadata)
         self.ids.extend(ids)
+        self.catalog_version = fresh_catalog_version()
         
-        logger.info(f"Added {len(embeddings)} embeddings to database")
+        logger.info(f"Added {count} embeddings to database")
     
-    def search(self, query_embedding: np.ndarray, top_k: int = 5) -> List[Dict]:
-        if not self.embeddings:
+    def count(self) -> int:
+        return self._size
+
+    def clear(self):
+        self._ann = None
+        self._codes = None
+        self._matrix = None
+        self._size = 0
+        self._prices = np.empty(0, dtype=np.float64)
+        self._category_rows = None
+        self._price_order = None
+        self.metadata = []
+        self.ids = []
+        self._id_to_row = {}
+        self.catalog_version = fresh_catalog_version()
+
+    def upsert_embeddings(self, embeddings: np.ndarray, metadata: List[Dict], ids: List[Any]):
+        if len(embeddings) != len(metadata) or len(embeddings) != len(ids):
+            raise ValueError("Lengths of embeddings, metadata, and ids must match")
+        if len(embeddings) == 0:
+            return
+        # An id repeated within the batch keeps its last row; appending both
+        # would leave the earlier one as an orphan no id maps to
+        latest = {str(id_val): i for i, id_val in enumerate(ids)}
+        if len(latest) < len(ids):
+            keep = sorted(latest.values())
+            embeddings = np.asarray(embeddings)[keep]
+            metadata = [metadata[i] for i in keep]
+            ids = [ids[i] for i in keep]
+
+        self._detach()
+        vectors = self._normalize(np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1))
+        new_positions = []
+        updated_rows, updated_positions = [], []
+        for i, id_val in enumerate(ids):
+            row = self._id_to_row.get(str(id_val))
+            if row is None:
+                new_positions.append(i)
+                continue
+            updated_rows.append(row)
+            updated_positions.append(i)
+            # Existing products are overwritten in place
+            self._matrix[row] = vectors[i]
+            self._prices[row] = self._price_of(metadata[i])
+            self.metadata[row] = metadata[i]
+            self.ids[row] = id_val
+        if updated_rows:
+            for index in self._row_indexes():
+                index.update(np.array(updated_rows, dtype=np.int64), vectors[updated_positions])
+        if new_positions:
+            self.add_embeddings(
+                vectors[new_positions],
+                [metadata[i] for i in new_positions],
+                [ids[i] for i in new_positions],
+            )
+        else:
+            self.catalog_version = fresh_catalog_version()
+        self._category_rows = None
+        self._price_order = None
+
+        logger.info(f"Upserted {len(ids)} embeddings ({len(new_positions)} new)")
+
+    def delete_ids(self, ids: List[Any]):
+        self._detach()
+        removed = 0
+        for id_val in ids:
+            row = self._id_to_row.pop(str(id_val), None)
+            if row is None:
+                continue
+            # Swap-remove: the last row fills the hole so the matrix stays dense
+            last = self._size - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._prices[row] = self._prices[last]
+                self.metadata[row] = self.metadata[last]
+                self.ids[row] = self.ids[last]
+                self._id_to_row[str(self.ids[row])] = row
+            for index in self._row_indexes():
+                index.move(last, row, self._matrix[row])
+            self.metadata.pop()
+            self.ids.pop()
+            self._size -= 1
+            removed += 1
+        if removed:
+            self._category_rows = None
+            self._price_order = None
+            self.catalog_version = fresh_catalog_version()
+
+        logger.info(f"Deleted {removed} embeddings from database")
+
+    def _top_k(self, scores: np.ndarray, top_k: int) -> np.ndarray:
+        k = min(top_k, scores.shape[0])
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+        if k < scores.shape[0]:
+            candidates = np.argpartition(scores, -k)[-k:]
+        else:
+            candidates = np.arange(scores.shape[0])
+        return candidates[np.argsort(scores[candidates])[::-1]]
+
+    def _category_index(self) -> Dict[str, np.ndarray]:
+        if self._category_rows is None:
+            groups: Dict[str, List[int]] = {}
+            for row, md in enumerate(self.metadata):
+                groups.setdefault(str(md.get('category', '')).strip().lower(), []).append(row)
+            self._category_rows = {c: np.array(rows, dtype=np.int64) for c, rows in groups.items()}
+        return self._category_rows
+
+    def _price_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._price_order is None:
+            prices = self._prices[:self._size]
+            # NaN sorts last, so unpriced rows are simply cut off the end
+            order = np.argsort(prices, kind="stable")[:int(np.count_nonzero(~np.isnan(prices)))]
+            self._price_order = (order, prices[order])
+        return self._price_order
+
+    def browse_by_price(self, min_price: Optional[float] = None, max_price: Optional[float] = None,
+                        limit: int = 20, offset: int = 0, descending: bool = False,
+                        after: Optional[Tuple[float, Any]] = None,
+                        with_total: bool = True) -> Tuple[List[Dict], Optional[int]]:
+        """One page of the products priced within [min_price, max_price], in
+        price order, and the total number of matches. The range is two binary
+        searches over the sorted prices, so a page costs O(log N + limit).
+        An ``after`` cursor (the last row's price and id) starts the page
+        right past that row."""
+        order, sorted_prices = self._price_index()
+        lo = 0 if min_price is None else int(np.searchsorted(sorted_prices, min_price, side="left"))
+        hi = len(order) if max_price is None else int(np.searchsorted(sorted_prices, max_price, side="right"))
+        total = max(0, hi - lo)
+        if after is not None:
+            # Equal prices keep row order, so the cursor row is found by a
+            # binary search within its tie run; a cursor row deleted since
+            # skips the whole run
+            tie_lo = int(np.searchsorted(sorted_prices, after[0], side="left"))
+            tie_hi = int(np.searchsorted(sorted_prices, after[0], side="right"))
+            row = self._id_to_row.get(str(after[1]))
+            if descending:
+                cut = tie_lo if row is None else tie_lo + int(np.searchsorted(order[tie_lo:tie_hi], row, side="left"))
+                hi = min(hi, cut)
+            else:
+                cut = tie_hi if row is None else tie_lo + int(np.searchsorted(order[tie_lo:tie_hi], row, side="right"))
+                lo = max(lo, cut)
+        offset, limit = max(0, offset), max(0, limit)
+        if descending:
+            rows = order[max(lo, hi - offset - limit):max(lo, hi - offset)][::-1]
+        else:
+            rows = order[lo + offset:min(hi, lo + offset + limit)]
+        page = [{'id': self.ids[row], 'metadata': self.metadata[row]} for row in rows.tolist()]
+        return page, total if with_total else None
+
+    def _filter_rows(self, search_filter: SearchFilter) -> np.ndarray:
+        if search_filter.categories:
+            index = self._category_index()
+            parts = [index[c] for c in search_filter.categories if c in index]
+            rows = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+        else:
+            rows = None
+        if search_filter.has_price:
+            prices = self._prices[:self._size] if rows is None else self._prices[rows]
+            # NaN prices compare False, so unpriced rows drop out like the Python filter
+            mask = np.ones(len(prices), dtype=bool)
+            if search_filter.min_price is not None:
+                mask &= prices >= search_filter.min_price
+            if search_filter.max_price is not None:
+                mask &= prices <= search_filter.max_price
+            rows = np.flatnonzero(mask) if rows is None else rows[mask]
+        return np.arange(self._size) if rows is None else rows
+
+    def build_indexes(self) -> None:
+        """Build the configured ANN index and compressed codes if they are
+        missing, then log the approximate path's recall. Called at save and
+        at startup/reload; searches only use what is already built and scan
+        exactly until then, so no request pays for a build."""
+        built = False
+        with self._index_lock:
+            if self._ann is None and self.ann_config.enabled and self._size >= self.ann_config.min_rows:
+                try:
+                    self._ann = build_index(self.ann_config, self.embeddings)
+                    built = True
+                except ImportError as e:
+                    logger.warning(f"{e}; falling back to exact search")
+                    self.ann_config.index_type = "exact"
+            if self._codes is None and self.quantization_config.enabled and self._size:
+                self._codes = self.quantization_config.build(self.embeddings)
+                built = True
+        if built:
+            logger.info(f"Approximate recall@10 vs exact: {self.recall():.3f}")
+
+    def _ann_index(self):
+        if not self.ann_config.enabled or self._size < self.ann_config.min_rows:
+            return None
+        return self._ann
+
+    def _quantizer(self):
+        if not self.quantization_config.enabled or self._size == 0:
+            return None
+        return self._codes
+
+    def _row_indexes(self) -> list:
+        return [index for index in (self._ann, self._codes) if index is not None]
+
+    def _rank_rows(self, query: np.ndarray, top_k: int, rows: Optional[np.ndarray] = None,
+                   exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        # Top-k over all rows or a subset: compressed codes pick a shortlist
+        # that is re-ranked with float32 vectors, otherwise scores are exact
+        codes = None if exact else self._quantizer()
+        count = self._size if rows is None else len(rows)
+        if codes is not None and count > top_k:
+            approx = codes.scores(query, rows)
+            shortlist = self._top_k(approx, top_k * self.quantization_config.rerank_depth)
+            rows = shortlist if rows is None else rows[shortlist]
+        if rows is None:
+            scores = self.embeddings @ query
+            top = self._top_k(scores, top_k)
+            return top, scores[top]
+        if len(rows) * 4 < self._size:
+            scores = self._matrix[rows] @ query
+            order = self._top_k(scores, top_k)
+            return rows[order], scores[order]
+        # Broad subsets: one full matvec beats gathering most of the matrix
+        similarities = np.full(self._size, -np.inf, dtype=np.float32)
+        similarities[rows] = (self.embeddings @ query)[rows]
+        top = self._top_k(similarities, min(top_k, len(rows)))
+        return top, similarities[top]
+
+    def _ann_top_k(self, ann, query: np.ndarray, top_k: int,
+                   allowed: Optional[np.ndarray] = None,
+                   fetch: Optional[int] = None) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        # Candidates come from the index; their exact scores decide the order
+        try:
+            candidates = ann.candidates_batch(query.reshape(1, -1), min(fetch or top_k, self._size))[0]
+        except RuntimeError as e:
+            logger.warning(f"ANN query failed, using exact search: {e}")
+            return None
+        if allowed is not None:
+            candidates = candidates[allowed[candidates]]
+        if len(candidates) < top_k:
+            return None
+        return self._rank_rows(query, top_k, candidates)
+
+    def _search_rows(self, query: np.ndarray, top_k: int, filter: Optional[SearchFilter] = None,
+                     exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        ann = None if exact else self._ann_index()
+        approx = None
+        if filter is None or filter.is_empty:
+            if ann is not None:
+                approx = self._ann_top_k(ann, query, min(top_k, self._size))
+            return approx if approx is not None else self._rank_rows(query, top_k, exact=exact)
+
+        rows = self._filter_rows(filter)
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if ann is not None and len(rows) * 4 >= self._size:
+            # Broad filter: over-fetch index candidates in proportion to
+            # how many rows it drops, then keep the allowed ones
+            allowed = np.zeros(self._size, dtype=bool)
+            allowed[rows] = True
+            fetch = 2 * top_k * -(-self._size // len(rows))
+            approx = self._ann_top_k(ann, query, min(top_k, len(rows)), allowed, fetch)
+        # Selective filters score only their surviving rows
+        return approx if approx is not None else self._rank_rows(query, top_k, rows, exact=exact)
+
+    def search(self, query_embedding: np.ndarray, top_k: int = 5,
+               filter: Optional[SearchFilter] = None, exact: bool = False) -> List[Dict]:
+        if self._size == 0:
             return []
         
-        embeddings_array = np.array(self.embeddings)
-        similarities = np.dot(embeddings_array, query_embedding) / (
-            np.linalg.norm(embeddings_array, axis=1) * np.linalg.norm(query_embedding)
-        )
-        
-        top_indices = np.argsort(similarities)[::-1][:top_k]
+        query = self._normalize(np.asarray(query_embedding, dtype=np.float32).ravel())
+        top_indices, top_scores = self._search_rows(query, top_k, filter, exact)
         
         results = []
-        for idx in top_indices:
+        for idx, score in zip(top_indices, top_scores):
             results.append({
                 'id': self.ids[idx],
                 'metadata': self.metadata[idx],
-                'similarity': float(similarities[idx])
+                'similarity': float(score)
             })
         
         return results
     
+    def search_batch(self, query_embeddings: np.ndarray, top_k: int = 5,
+                     chunk_size: int = 256) -> List[List[Dict]]:
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        if self._size == 0:
+            return [[] for _ in range(queries.shape[0])]
+
+        queries = self._normalize(queries)
+        k = min(top_k, self._size)
+        if self._ann_index() is not None or self._quantizer() is not None:
+            return [self.search(query, top_k=k) for query in queries]
+        all_results: List[List[Dict]] = []
+        # Chunk the queries so the score matrix stays bounded at chunk_size x N
+        for start in range(0, queries.shape[0], chunk_size):
+            scores = queries[start:start + chunk_size] @ self.embeddings.T
+            if k < self._size:
+                candidates = np.argpartition(scores, -k, axis=1)[:, -k:]
+            else:
+                candidates = np.tile(np.arange(self._size), (scores.shape[0], 1))
+            candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+            order = np.argsort(-candidate_scores, axis=1)
+            top_indices = np.take_along_axis(candidates, order, axis=1)
+            for row, indices in enumerate(top_indices):
+                all_results.append([
+                    {
+                        'id': self.ids[idx],
+                        'metadata': self.metadata[idx],
+                        'similarity': float(scores[row, idx])
+                    }
+                    for idx in indices
+                ])
+
+        return all_results
+    
+    def recall(self, queries: Optional[np.ndarray] = None, top_k: int = 10, sample: int = 100) -> float:
+        """Mean recall@top_k of the approximate path (ANN and/or quantized
+        scans) against exact search.
+
+        Without explicit queries, a sample of stored rows is used.
+        """
+        if self._size == 0:
+            return 1.0
+        if queries is None:
+            rng = np.random.default_rng(0)
+            queries = self._matrix[rng.choice(self._size, min(sample, self._size), replace=False)]
+        queries = self._normalize(np.asarray(queries, dtype=np.float32).reshape(-1, self.dimension))
+        k = min(top_k, self._size)
+        hits = 0
+        for query in queries:
+            exact = self._search_rows(query, k, exact=True)[0]
+            approx = self._search_rows(query, k)[0]
+            hits += len(set(exact.tolist()).intersection(approx.tolist()))
+        return hits / (k * len(queries))
+
+    def memory_usage(self) -> Dict[str, Any]:
+        """Bytes held by the matrix and side indexes; mapped arrays live in the
+        page cache (shared between workers) rather than this process's heap"""
+        usage: Dict[str, Any] = {
+            'rows': self._size,
+            'mapped': self.is_mapped,
+            'matrix_bytes': 0 if self._matrix is None else int(self._matrix.nbytes),
+            # Snapshot maps and spilled matrices are page cache, not private memory
+            'matrix_file_backed': self._matrix is not None and (self._matrix_file_backed or self.is_mapped),
+            'price_bytes': int(self._prices.nbytes),
+            'category_index_bytes': sum(int(rows.nbytes) for rows in (self._category_rows or {}).values()),
+            'price_index_bytes': sum(int(part.nbytes) for part in (self._price_order or ())),
+        }
+        if self._codes is not None:
+            usage['quantized_bytes'] = self._codes.nbytes
+        return usage
+
+    def set_catalog_version(self, version: str) -> None:
+        self.catalog_version = version
+
+    def get_by_ids(self, ids: List[Any], include_embeddings: bool = False) -> List[Dict]:
+        results = []
+        for id_val in ids:
+            row = self._id_to_row.get(str(id_val))
+            if row is None:
+                continue
+            result = {'id': self.ids[row], 'metadata': self.metadata[row]}
+            if include_embeddings:
+                result['embedding'] = self._matrix[row]
+            results.append(result)
+        return results
+    
     def save(self, filepath: str):
+        if filepath.endswith(".pkl"):
+            self._save_pickle(filepath)
+            return
+        self.build_indexes()
+        write_snapshot(
+            filepath,
+            self.embeddings,
+            self._prices[:self._size],
+            self.ids,
+            self.metadata,
+            self._category_index(),
+            indexes={"ann": self._ann_index(), "quantization": self._quantizer()},
+            catalog_version=self.catalog_version,
+        )
+        logger.info(f"Database snapshot saved to {filepath}")
+
+    def _save_pickle(self, filepath: str):
         data = {
-            'embeddings': self.embeddings,
-            'metadata': self.metadata,
-            'ids': self.ids
+            'embeddings': np.ascontiguousarray(self.embeddings),
+            'metadata': list(self.metadata),
+            'ids': list(self.ids)
         }
         
-        with open(filepath, 'wb') as f:
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, 'wb') as f:
             pickle.dump(data, f)
+        os.replace(tmp_path, filepath)
         
         logger.info(f"Database saved to {filepath}")
     
     def load(self, filepath: str):
+        if is_snapshot(filepath):
+            self._load_snapshot(filepath)
+            return
+
         with open(filepath, 'rb') as f:
             data = pickle.load(f)
         
-        self.embeddings = data['embeddings']
-        self.metadata = data['metadata']
-        self.ids = data['ids']
+        # Older pickles hold a list of per-row arrays; both forms load the same way.
+        self.clear()
+        self.add_embeddings(np.asarray(data['embeddings'], dtype=np.float32), data['metadata'], data['ids'])
         
         logger.info(f"Database loaded from {filepath}")
 
+    def _load_snapshot(self, filepath: str):
+        snapshot = read_snapshot(filepath)
+        # Rows were saved normalized, so the mapped matrix is used as is
+        self.dimension = snapshot.dimension or self.dimension
+        self._matrix = snapshot.embeddings
+        self._prices = snapshot.prices
+        self._size = snapshot.size
+        self.ids = snapshot.ids
+        self.metadata = snapshot.metadata
+        self._id_to_row = snapshot.id_index
+        self._category_rows = snapshot.category_rows
+        self._price_order = snapshot.price_order
+        self._ann = None
+        ann_spec = snapshot.manifest.get("ann")
+        if ann_spec and ann_spec.get("kind") == self.ann_config.index_type:
+            self._ann = self.ann_config.load(snapshot.path, ann_spec, self.dimension)
+        self._codes = None
+        codes_spec = snapshot.manifest.get("quantization")
+        if codes_spec and codes_spec.get("kind") == self.quantization_config.kind:
+            self._codes = self.quantization_config.load(snapshot.path, codes_spec)
+        self.snapshot_path = filepath
+        self.snapshot_generation = snapshot.path.name
+        # The committed digest is content-derived, so every worker mapping this
+        # generation (now or after a restart) shares result-cache entries
+        self.catalog_version = snapshot.manifest.get("catalog_version") or fresh_catalog_version()
+
+        logger.info(f"Database snapshot mapped from {snapshot.path} ({snapshot.size} rows)")
+
+
+_worker_generator: Optional[EmbeddingGenerator] = None
+
+
+def _init_encode_worker(model_name: str, backend: str, threads: int) -> None:
+    global _worker_generator
+    # Split the cores between workers instead of letting each one use all of them
+    os.environ["INFERENCE_THREADS"] = str(threads)
+    _worker_generator = EmbeddingGenerator(model_name, backend=backend)
+
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    return _worker_generator.generate_embeddings(texts)
+
+
+class EmbeddingPipeline:
+    """Encodes a stream of (texts, metadata, ids) chunks in order.
+
+    With ``EMBED_WORKERS`` > 1 chunks are encoded by a pool of processes, each
+    loading its own model with ``cpu_count / workers`` threads; at most two
+    chunks per worker are in flight so memory stays bounded. Progress and
+    throughput are logged per chunk and kept in ``stats``.
+    """
+
+    def __init__(self, generator: EmbeddingGenerator, workers: Optional[int] = None) -> None:
+        self.generator = generator
+        self.workers = max(1, workers or int(os.getenv("EMBED_WORKERS", "1")))
+        self.stats: Dict[str, float] = {}
+
+    def _encode_serial(self, chunks):
+        for texts, metadata, ids in chunks:
+            yield self.generator.generate_embeddings(texts), metadata, ids
+
+    def _encode_parallel(self, chunks):
+        config = self.generator.inference_config
+        threads = config.threads or max(1, (os.cpu_count() or 1) // self.workers)
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=context, initializer=_init_encode_worker,
+            initargs=(self.generator.model_name, config.backend, threads),
+        ) as pool:
+            pending: Deque = deque()
+            for texts, metadata, ids in chunks:
+                pending.append((pool.submit(_encode_in_worker, texts), metadata, ids))
+                if len(pending) >= 2 * self.workers:
+                    future, md, chunk_ids = pending.popleft()
+                    yield future.result(), md, chunk_ids
+            while pending:
+                future, md, chunk_ids = pending.popleft()
+                yield future.result(), md, chunk_ids
+
+    def run(self, chunks: Iterator[Tuple[List[str], List[Dict], List[Any]]], total: Optional[int] = None):
+        start = time.perf_counter()
+        done = 0
+        count = 0
+        encoded = self._encode_parallel(chunks) if self.workers > 1 else self._encode_serial(chunks)
+        for embeddings, metadata, ids in encoded:
+            yield embeddings, metadata, ids
+            done += len(ids)
+            count += 1
+            elapsed = time.perf_counter() - start
+            rate = done / elapsed if elapsed > 0 else 0.0
+            eta = f", ETA {(total - done) / rate:.0f}s" if total and rate else ""
+            progress = f"{done}/{total}" if total else str(done)
+            logger.info(f"Embedded chunk {count}: {progress} products, {rate:.0f} products/s{eta}")
+        elapsed = time.perf_counter() - start
+        self.stats = {
+            "products": done,
+            "chunks": count,
+            "seconds": elapsed,
+            "products_per_second": done / elapsed if elapsed > 0 else 0.0,
+            "workers": self.workers,
+        }
+        logger.info(
+            f"Embedded {done} products in {count} chunks over {elapsed:.1f}s "
+            f"({self.stats['products_per_second']:.0f} products/s, {self.workers} worker(s))"
+        )
+
 
 class ProductEmbedder:
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        self.embedding_generator = EmbeddingGenerator(model_name)
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", lazy_model: bool = False):
+        self.embedding_generator = EmbeddingGenerator(model_name, lazy=lazy_model)
         self.vector_db = None
+        self.bm25_index = BM25Index()
         self.backend_type = os.getenv("VECTOR_BACKEND", "pgvector").lower()
         
         # Initialize the appropriate vector store based on environment variable
@@ -150,39 +809,57 @@ class ProductEmbedder:
         if missing:
             raise ValueError(f"Missing required columns for text creation: {missing}")
 
-        texts: List[str] = []
-        for _, row in df.iterrows():
-            title = str(row["title"]).strip()
-            description = str(row["description"]).strip()
-            category = str(row["category"]).strip()
-            text = f"{title}. {description}. Category: {category}."
-            texts.append(text)
-
-        return texts
+        # Column-wise string ops instead of a Python loop over rows
+        texts = (
+            df["title"].astype(str).str.strip() + ". "
+            + df["description"].astype(str).str.strip() + ". Category: "
+            + df["category"].astype(str).str.strip() + "."
+        )
+        return texts.tolist()
     
-    def embed_products(self, df: pd.DataFrame):
+    def product_records(self, df: pd.DataFrame) -> Tuple[List[str], List[Dict], List[Any]]:
         texts = self.create_product_texts(df)
-        embeddings = self.embedding_generator.generate_embeddings(texts)
         metadata = df[["id", "category", "title", "description", "price", "url"]].to_dict('records')
         ids = df['id'].tolist()
-        
-        # Add embeddings to the vector store
-        self.vector_db.add_embeddings(embeddings, metadata, ids)
+        return texts, metadata, ids
+
+    def record_chunks(self, df: pd.DataFrame, chunk_rows: Optional[int] = None) -> Iterator[Tuple[List[str], List[Dict], List[Any]]]:
+        chunk_rows = chunk_rows or int(os.getenv("EMBED_CHUNK_ROWS", "10000"))
+        for start in range(0, len(df), chunk_rows):
+            yield self.product_records(df.iloc[start:start + chunk_rows])
+
+    def embed_products(self, df: pd.DataFrame):
+        # Chunks are embedded, indexed for BM25 and written to the store as they
+        # complete, so only a few chunks of vectors are in memory at once
+        pipeline = EmbeddingPipeline(self.embedding_generator)
+        chunks = self._index_bm25(pipeline.run(self.record_chunks(df), total=len(df)))
+        if hasattr(self.vector_db, "load_chunks"):
+            self.vector_db.load_chunks(chunks)
+        else:
+            # Upserts so an id repeated across chunks replaces its row instead of duplicating it
+            write = getattr(self.vector_db, "upsert_embeddings", self.vector_db.add_embeddings)
+            for embeddings, metadata, ids in chunks:
+                write(embeddings, metadata, ids)
         
         return self.vector_db
+
+    def _index_bm25(self, chunks: Iterator[Tuple[np.ndarray, List[Dict], List[Any]]]):
+        for embeddings, metadata, ids in chunks:
+            self.bm25_index.add_documents(ids, [BM25Index.document_text(md) for md in metadata])
+            yield embeddings, metadata, ids
     
-    def save_embeddings(self, filepath: str = "data/product_embeddings.pkl"):
+    def save_embeddings(self, filepath: str = "data/product_embeddings.snapshot"):
         if self.backend_type in ["pinecone", "pgvector"]:
-            logger.info(f"{self.backend_type} in use; skipping local pickle save.")
+            logger.info(f"{self.backend_type} in use; skipping local snapshot save.")
             return
         if hasattr(self.vector_db, "save"):
             self.vector_db.save(filepath)
         else:
             logger.info("Active vector store does not support saving; skipping.")
     
-    def load_embeddings(self, filepath: str = "data/product_embeddings.pkl"):
+    def load_embeddings(self, filepath: str = "data/product_embeddings.snapshot"):
         if self.backend_type in ["pinecone", "pgvector"]:
-            logger.info(f"{self.backend_type} in use; loading from pickle not applicable.")
+            logger.info(f"{self.backend_type} in use; loading from snapshot not applicable.")
             return
         if hasattr(self.vector_db, "load"):
             self.vector_db.load(filepath)
@@ -190,22 +867,67 @@ class ProductEmbedder:
             logger.info("Active vector store does not support loading from file; skipping.")
 
 
+    def restore_local_state(self, embeddings_path: str = "data/product_embeddings.snapshot",
+                            bm25_path: str = "data/bm25_index.pkl",
+                            legacy_path: str = "data/product_embeddings.pkl") -> bool:
+        # Load whatever the last run persisted so a sync only has to apply the delta;
+        # a pickle from before the snapshot format is picked up once and re-saved.
+        # Returns whether the in-memory store was restored.
+        restored = False
+        if self.backend_type == "memory":
+            if is_snapshot(embeddings_path):
+                self.load_embeddings(embeddings_path)
+                restored = True
+            elif os.path.exists(legacy_path):
+                logger.info(f"Loading legacy pickle {legacy_path}; it is saved as a snapshot next time")
+                self.load_embeddings(legacy_path)
+                restored = True
+        self.load_bm25_index(bm25_path)
+        return restored
+
+    def save_bm25_index(self, filepath: str = "data/bm25_index.pkl"):
+        # The lexical index is local for every backend, so it is always persisted
+        self.bm25_index.save(filepath)
+
+    def load_bm25_index(self, filepath: str = "data/bm25_index.pkl") -> bool:
+        if not os.path.exists(filepath):
+            logger.info(f"No BM25 index at {filepath}; lexical scores fall back to per-query BM25")
+            return False
+        self.bm25_index = BM25Index.load(filepath)
+        return True
+
+
 def main():
+    import argparse
     from ingest import DataIngester
+    from catalog_sync import CatalogSync
+
+    parser = argparse.ArgumentParser(description="Embed the product catalog and sync it into the vector store")
+    parser.add_argument("--full", action="store_true", help="Re-embed and reload every product instead of syncing changes")
+    args = parser.parse_args()
     
     ingester = DataIngester()
     products_df = ingester.load_products()
     clean_df = ingester.preprocess_data(products_df)
     
     embedder = ProductEmbedder()
-    vector_db = embedder.embed_products(clean_df)
-    
-    embedder.save_embeddings()
+    catalog_sync = CatalogSync(embedder)
+    # Serialized with app workers syncing at startup
+    with catalog_sync.lock():
+        embedder.restore_local_state()
+        stats = catalog_sync.sync(clean_df, full=args.full)
+
+        # The snapshot's CURRENT swap is what serving workers watch, so it goes last
+        embedder.save_bm25_index()
+        embedder.save_embeddings()
     
     print("Embedding generation completed successfully!")
-    print(f"Generated embeddings for {len(clean_df)} products")
+    print(
+        f"Synced {len(clean_df)} products ({stats['mode']}): {stats['added']} added, "
+        f"{stats['updated']} updated, {stats['removed']} removed"
+    )
     
-    return vector_db
+    return embedder.vector_db
 
 
 if __name__ == "__main__":
@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """Store-agnostic filter: inclusive price range and category in-list"""
+
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    categories: Tuple[str, ...] = ()
+
+    @classmethod
+    def create(
+        cls,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        category: Union[str, Iterable[str], None] = None,
+    ) -> "SearchFilter":
+        if category is None:
+            categories: Tuple[str, ...] = ()
+        elif isinstance(category, str):
+            categories = (category,)
+        else:
+            categories = tuple(category)
+        return cls(
+            min_price=float(min_price) if min_price is not None else None,
+            max_price=float(max_price) if max_price is not None else None,
+            categories=tuple(sorted({c.strip().lower() for c in categories if c and c.strip()})),
+        )
+
+    @property
+    def is_empty(self) -> bool:
+        return self.min_price is None and self.max_price is None and not self.categories
+
+    @property
+    def has_price(self) -> bool:
+        return self.min_price is not None or self.max_price is not None
+
+    def matches(self, metadata: Dict[str, Any]) -> bool:
+        if self.categories and str(metadata.get('category', '')).strip().lower() not in self.categories:
+            return False
+        if self.has_price:
+            price = metadata.get('price')
+            if not isinstance(price, (int, float, np.floating)):
+                return False
+            if self.min_price is not None and price < self.min_price:
+                return False
+            if self.max_price is not None and price > self.max_price:
+                return False
+        return True
+
+    def to_sql(
+        self,
+        price_expr: str = "price",
+        category_expr: str = "lower(category)",
+    ) -> Tuple[str, Dict[str, Any]]:
+        clauses = []
+        params: Dict[str, Any] = {}
+        if self.min_price is not None:
+            clauses.append(f"{price_expr} >= :filter_min_price")
+            params['filter_min_price'] = self.min_price
+        if self.max_price is not None:
+            clauses.append(f"{price_expr} <= :filter_max_price")
+            params['filter_max_price'] = self.max_price
+        if self.categories:
+            clauses.append(f"{category_expr} = ANY(:filter_categories)")
+            params['filter_categories'] = list(self.categories)
+        return " AND ".join(clauses), params
+
+    def to_pinecone(self) -> Optional[Dict[str, Any]]:
+        conditions = []
+        if self.has_price:
+            price: Dict[str, float] = {}
+            if self.min_price is not None:
+                price['$gte'] = self.min_price
+            if self.max_price is not None:
+                price['$lte'] = self.max_price
+            conditions.append({'price': price})
+        if self.categories:
+            # Pinecone matches strings exactly; ingest stores categories title-cased
+            values = sorted({v for c in self.categories for v in (c, c.title())})
+            conditions.append({'category': {'$in': values}})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {'$and': conditions}
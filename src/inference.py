@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+try:
+    import onnxruntime as ort  # type: ignore
+except ImportError:
+    ort = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceConfig:
+    """Env-driven settings for the query/catalog encoder"""
+
+    def __init__(self, backend: Optional[str] = None) -> None:
+        # "torch" (default, SentenceTransformer) or "onnx" (onnxruntime)
+        self.backend = (backend or os.getenv("EMBEDDING_BACKEND", "torch")).lower()
+        # Dynamic int8 weight quantization of the exported graph
+        self.quantize = os.getenv("ONNX_QUANTIZE", "1").lower() in ("1", "true", "yes", "y")
+        self.model_dir = os.getenv("ONNX_MODEL_DIR", "data/onnx")
+        # 0 leaves the runtime's own default (all physical cores)
+        self.threads = int(os.getenv("INFERENCE_THREADS", "0"))
+        # Matches SentenceTransformer's max_seq_length for MiniLM
+        self.max_length = int(os.getenv("EMBEDDING_MAX_LENGTH", "256"))
+        self.batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+    @property
+    def variant(self) -> str:
+        """Suffix that keeps differently computed vectors apart in the disk cache"""
+        if self.backend == "onnx":
+            return "onnx-int8" if self.quantize else "onnx"
+        return ""
+
+
+class ONNXEncoder:
+    """MiniLM-style encoder on onnxruntime: the Hugging Face model is exported
+    once (optionally with int8 dynamic quantization) next to its tokenizer,
+    and ``encode`` reproduces SentenceTransformer's mean pooling and L2
+    normalization. Serving an exported model needs only onnxruntime and the
+    tokenizer, not torch.
+    """
+
+    def __init__(self, model_name: str, config: Optional[InferenceConfig] = None) -> None:
+        if ort is None:
+            raise ImportError("EMBEDDING_BACKEND=onnx requires the onnxruntime package: pip install onnxruntime")
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.config = config or InferenceConfig("onnx")
+        self.directory = Path(self.config.model_dir) / model_name.replace("/", "__")
+        model_path = self.export(model_name, self.directory, self.config.quantize)
+
+        # The exported tokenizer is the one the model was trained with
+        self.tokenizer = AutoTokenizer.from_pretrained(str(self.directory))
+        options = ort.SessionOptions()
+        if self.config.threads > 0:
+            options.intra_op_num_threads = self.config.threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+        logger.info(f"ONNX encoder ready: {model_path.name} ({self.config.threads or 'default'} threads)")
+
+    @staticmethod
+    def export(model_name: str, directory: Path, quantize: bool = True) -> Path:
+        fp32_path = directory / "model.onnx"
+        int8_path = directory / "model.int8.onnx"
+        target = int8_path if quantize else fp32_path
+        if target.exists():
+            return target
+
+        directory.mkdir(parents=True, exist_ok=True)
+        # App workers start together; the first one exports and the others wait for it
+        with open(directory / "export.lock", "wb") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if target.exists():
+                return target
+            suffix = f".{os.getpid()}.tmp"
+            if not fp32_path.exists():
+                import torch
+                from transformers import AutoModel, AutoTokenizer
+
+                start = time.perf_counter()
+                tokenizer = AutoTokenizer.from_pretrained(model_name)
+                model = AutoModel.from_pretrained(model_name)
+                model.eval()
+                sample = dict(tokenizer(["export sample"], return_tensors="pt"))
+                axes = {name: {0: "batch", 1: "sequence"} for name in list(sample) + ["last_hidden_state"]}
+                tmp_path = directory / f"model.onnx{suffix}"
+                with torch.no_grad():
+                    torch.onnx.export(
+                        model, (sample,), str(tmp_path),
+                        input_names=list(sample), output_names=["last_hidden_state"],
+                        dynamic_axes=axes, opset_version=14,
+                    )
+                # Tokenizer first: whoever sees model.onnx can also load its tokenizer
+                tokenizer.save_pretrained(str(directory))
+                os.replace(tmp_path, fp32_path)
+                logger.info(f"Exported {model_name} to {fp32_path} in {time.perf_counter() - start:.1f}s")
+
+            if quantize:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                tmp_path = directory / f"model.int8.onnx{suffix}"
+                quantize_dynamic(str(fp32_path), str(tmp_path), weight_type=QuantType.QInt8)
+                os.replace(tmp_path, int8_path)
+                logger.info(f"Quantized weights to int8: {int8_path}")
+        return target
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        tokens = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=self.config.max_length, return_tensors="np"
+        )
+        feeds = {name: np.asarray(value, dtype=np.int64) for name, value in tokens.items() if name in self._input_names}
+        hidden = self.session.run(None, feeds)[0]
+        mask = feeds["attention_mask"][..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (pooled / norms).astype(np.float32)
+
+    def encode(self, texts: List[str], show_progress_bar: bool = False) -> np.ndarray:
+        # Same signature as SentenceTransformer.encode; batches are formed from
+        # length-sorted texts so little compute goes into padding
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out: List[Optional[np.ndarray]] = [None] * len(texts)
+        for start in range(0, len(texts), self.config.batch_size):
+            chunk = order[start:start + self.config.batch_size]
+            for i, row in zip(chunk, self._encode_batch([texts[i] for i in chunk])):
+                out[i] = row
+        return np.stack(out)
+
+
+def load_encoder(model_name: str, config: InferenceConfig):
+    """Return an object with SentenceTransformer's ``encode`` for the configured backend"""
+    if config.backend == "onnx":
+        return ONNXEncoder(model_name, config)
+    if config.backend != "torch":
+        logger.warning(f"Unknown EMBEDDING_BACKEND '{config.backend}', using torch")
+    from sentence_transformers import SentenceTransformer
+
+    if config.threads > 0:
+        import torch
+
+        torch.set_num_threads(config.threads)
+    return SentenceTransformer(model_name)
@@ -0,0 +1,311 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from snapshot import Column, IdIndex, _write_column, current_generation, id_hash, prune_generations
+
+logger = logging.getLogger(__name__)
+
+GRAPH_FORMAT = "item-graph"
+GRAPH_VERSION = 1
+
+# Query rows per task and catalog rows per matmul; a block's score tile is
+# ROW_BLOCK x COL_BLOCK float32 (64 MB at the defaults)
+ROW_BLOCK = 1024
+COL_BLOCK = 16384
+# Bytes per tile cell a worker holds at once: the float32 scores plus the
+# int64 positions argpartition returns for the whole tile
+_TILE_CELL_BYTES = 12
+# Upper bound on the tiles all workers hold together
+MEMORY_BUDGET_MB = int(os.getenv("ITEM_GRAPH_MEMORY_MB", "2048"))
+
+
+def _unit(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _merge_top_k(idx: np.ndarray, scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if idx.shape[1] > k:
+        part = np.argpartition(scores, -k, axis=1)[:, -k:]
+        idx = np.take_along_axis(idx, part, axis=1)
+        scores = np.take_along_axis(scores, part, axis=1)
+    return idx, scores
+
+
+def _top_k(queries: np.ndarray, matrix: np.ndarray, k: int,
+           self_rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Best ``k`` rows of ``matrix`` for each query, scanning column blocks and
+    keeping a running top-k so the full score matrix never exists"""
+    best_idx = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(matrix), COL_BLOCK):
+        sims = queries @ matrix[start:start + COL_BLOCK].T
+        if self_rows is not None:
+            local = self_rows - start
+            inside = (local >= 0) & (local < sims.shape[1])
+            sims[np.nonzero(inside)[0], local[inside]] = -np.inf
+        kk = min(k, sims.shape[1])
+        part = np.argpartition(sims, -kk, axis=1)[:, -kk:]
+        best_idx = np.concatenate([best_idx, part + start], axis=1)
+        best_scores = np.concatenate([best_scores, np.take_along_axis(sims, part, axis=1)], axis=1)
+        best_idx, best_scores = _merge_top_k(best_idx, best_scores, k)
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return np.take_along_axis(best_idx, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+class ItemGraph:
+    """k-nearest-neighbor graph over the catalog for "similar items".
+
+    Row ``r`` holds the ``k`` most similar products of ``ids[r]`` as int32 row
+    numbers with float16 cosine scores, best first (-1 pads catalogs smaller
+    than ``k + 1``). A per-row content hash lets ``refresh`` recompute only
+    the rows a catalog change can affect.
+    """
+
+    def __init__(self, ids: Sequence[Any], neighbors: np.ndarray, scores: np.ndarray,
+                 hashes: Optional[Sequence[str]] = None, id_index: Any = None) -> None:
+        self.ids = ids
+        self.neighbors = neighbors
+        self.scores = scores
+        self.hashes = hashes if hashes is not None else [""] * len(ids)
+        self._id_to_row = id_index if id_index is not None else {str(i): row for row, i in enumerate(ids)}
+        # Set by ``load``; the app's watcher compares it with CURRENT
+        self.generation: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def k(self) -> int:
+        return int(self.neighbors.shape[1]) if self.neighbors.ndim == 2 else 0
+
+    @staticmethod
+    def _compute_rows(matrix: np.ndarray, rows: np.ndarray, k: int,
+                      workers: int) -> Tuple[np.ndarray, np.ndarray]:
+        neighbors = np.full((len(rows), k), -1, dtype=np.int32)
+        scores = np.zeros((len(rows), k), dtype=np.float16)
+        kk = min(k, len(matrix) - 1)
+        if kk <= 0 or len(rows) == 0:
+            return neighbors, scores
+
+        def run(start: int) -> None:
+            block = rows[start:start + ROW_BLOCK]
+            idx, sims = _top_k(matrix[block], matrix, kk, self_rows=block)
+            neighbors[start:start + len(block), :kk] = idx
+            scores[start:start + len(block), :kk] = sims
+
+        # BLAS releases the GIL, so row blocks run in parallel on threads, as
+        # many as the memory budget has room for
+        tile_bytes = min(ROW_BLOCK, len(rows)) * min(COL_BLOCK, len(matrix)) * _TILE_CELL_BYTES
+        workers = max(1, min(workers, MEMORY_BUDGET_MB * 2 ** 20 // tile_bytes))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run, range(0, len(rows), ROW_BLOCK)))
+        return neighbors, scores
+
+    @classmethod
+    def build(cls, ids: Sequence[Any], matrix: np.ndarray, k: int = 20,
+              hashes: Optional[Sequence[str]] = None, workers: Optional[int] = None) -> "ItemGraph":
+        start = time.perf_counter()
+        matrix = _unit(matrix)
+        workers = workers or os.cpu_count() or 1
+        neighbors, scores = cls._compute_rows(matrix, np.arange(len(matrix)), k, workers)
+        logger.info(f"Built {k}-NN item graph over {len(ids)} products in {time.perf_counter() - start:.1f}s")
+        return cls(list(ids), neighbors, scores, list(hashes) if hashes is not None else None)
+
+    def refresh(self, ids: Sequence[Any], matrix: np.ndarray, hashes: Sequence[str],
+                workers: Optional[int] = None) -> "ItemGraph":
+        """Graph for the current catalog, recomputing only what changed.
+
+        New and changed products get fresh neighbor lists. Unchanged products
+        keep theirs unless one of their neighbors changed or disappeared (then
+        they are recomputed too); otherwise the changed products are merged
+        into their lists, which is exact because nothing else moved.
+        """
+        start = time.perf_counter()
+        matrix = _unit(matrix)
+        workers = workers or os.cpu_count() or 1
+        k = self.k
+        ids = list(ids)
+        hashes = list(hashes)
+
+        old_rows = np.array([self._id_to_row.get(str(i), -1) for i in ids], dtype=np.int64)
+        old_hashes = np.array([self.hashes[r] if r >= 0 else None for r in old_rows], dtype=object)
+        unchanged = (old_rows >= 0) & (old_hashes == np.array(hashes, dtype=object))
+
+        # Old row -> new row for every product that kept its vector
+        remap = np.full(len(self), -1, dtype=np.int64)
+        remap[old_rows[unchanged]] = np.nonzero(unchanged)[0]
+
+        neighbors = np.full((len(ids), k), -1, dtype=np.int32)
+        scores = np.zeros((len(ids), k), dtype=np.float16)
+        carried = np.nonzero(unchanged)[0]
+        old_neighbors = np.asarray(self.neighbors[old_rows[carried]], dtype=np.int64)
+        mapped = np.where(old_neighbors >= 0, remap[np.maximum(old_neighbors, 0)], -1)
+        lost = ((old_neighbors >= 0) & (mapped < 0)).any(axis=1)
+        # Lists that were short because the catalog was small can grow now
+        short = (old_neighbors < 0).any(axis=1) & (min(k, len(ids) - 1) > (old_neighbors >= 0).sum(axis=1))
+        keep = carried[~(lost | short)]
+        neighbors[keep] = mapped[~(lost | short)]
+        scores[keep] = self.scores[old_rows[keep]]
+
+        dirty = np.setdiff1d(np.arange(len(ids)), keep)
+        neighbors[dirty], scores[dirty] = self._compute_rows(matrix, dirty, k, workers)
+
+        changed = np.nonzero(~unchanged)[0]
+        if len(changed) and len(keep):
+            changed_vectors = matrix[changed]
+            for block_start in range(0, len(keep), ROW_BLOCK):
+                block = keep[block_start:block_start + ROW_BLOCK]
+                sims = matrix[block] @ changed_vectors.T
+                idx = np.concatenate([neighbors[block].astype(np.int64), np.tile(changed, (len(block), 1))], axis=1)
+                merged_scores = np.concatenate([scores[block].astype(np.float32), sims], axis=1)
+                merged_scores[idx < 0] = -np.inf
+                idx, merged_scores = _merge_top_k(idx, merged_scores, k)
+                order = np.argsort(-merged_scores, axis=1, kind="stable")
+                neighbors[block] = np.take_along_axis(idx, order, axis=1)
+                scores[block] = np.take_along_axis(merged_scores, order, axis=1)
+
+        logger.info(
+            f"Refreshed item graph: {len(changed)} new/changed, {len(dirty) - len(changed)} rows recomputed "
+            f"for lost neighbors, {len(keep)} carried over, in {time.perf_counter() - start:.1f}s"
+        )
+        return ItemGraph(ids, neighbors, scores, hashes)
+
+    def similar(self, id_val: Any, top_k: int = 5) -> Optional[List[Tuple[Any, float]]]:
+        """Neighbors of a product, or None when it is not in the graph"""
+        row = self._id_to_row.get(str(id_val))
+        if row is None:
+            return None
+        neighbors = self.neighbors[row, :top_k]
+        scores = self.scores[row, :top_k]
+        return [(self.ids[int(n)], float(s)) for n, s in zip(neighbors, scores) if n >= 0]
+
+    def save(self, path: str) -> Path:
+        """Write a new generation under ``path`` and atomically point CURRENT at it"""
+        root = Path(path)
+        root.mkdir(parents=True, exist_ok=True)
+        previous = current_generation(root)
+        generation = f"v{int(previous[1:]) + 1 if previous else 1}"
+        target = root / generation
+        if target.exists():
+            shutil.rmtree(target)
+        target.mkdir()
+
+        np.save(target / "neighbors.npy", np.ascontiguousarray(self.neighbors, dtype=np.int32))
+        np.save(target / "scores.npy", np.ascontiguousarray(self.scores, dtype=np.float16))
+        ids = list(self.ids)
+        hashed = np.fromiter((id_hash(i) for i in ids), dtype=np.uint64, count=len(ids))
+        order = np.argsort(hashed, kind="stable")
+        np.save(target / "id_hash.npy", hashed[order])
+        np.save(target / "id_rows.npy", order.astype(np.int64))
+        manifest = {
+            "format": GRAPH_FORMAT,
+            "version": GRAPH_VERSION,
+            "count": len(ids),
+            "k": self.k,
+            "ids": _write_column(target, "ids", "id", ids),
+            "hashes": _write_column(target, "hashes", "hash", list(self.hashes)),
+        }
+        with open(target / "manifest.json", "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+
+        pointer = root / "CURRENT.tmp"
+        pointer.write_text(generation, encoding="utf-8")
+        os.replace(pointer, root / "CURRENT")
+        prune_generations(root, generation)
+        logger.info(f"Item graph saved to {target}")
+        return target
+
+    @classmethod
+    def load(cls, path: str) -> "ItemGraph":
+        root = Path(path)
+        for attempt in range(3):
+            generation = current_generation(root)
+            if generation is None:
+                raise FileNotFoundError(f"No item graph at {path}")
+            try:
+                graph = cls._load_generation(root / generation)
+                graph.generation = generation
+                return graph
+            except FileNotFoundError:
+                # Pruned by a writer after CURRENT was read; follow the new pointer
+                if attempt == 2 or current_generation(root) == generation:
+                    raise
+        raise FileNotFoundError(f"No item graph at {path}")
+
+    @classmethod
+    def _load_generation(cls, target: Path) -> "ItemGraph":
+        with open(target / "manifest.json", "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format") != GRAPH_FORMAT or manifest.get("version") != GRAPH_VERSION:
+            raise ValueError(f"Unsupported item graph {manifest.get('format')!r} v{manifest.get('version')} at {target}")
+        size = int(manifest["count"])
+        # Lookups read straight from the mapped arrays
+        ids = Column(target, manifest["ids"], size)
+        id_index = IdIndex(
+            np.load(target / "id_hash.npy", mmap_mode="r"), np.load(target / "id_rows.npy", mmap_mode="r"), ids
+        )
+        return cls(
+            ids,
+            np.load(target / "neighbors.npy", mmap_mode="r"),
+            np.load(target / "scores.npy", mmap_mode="r"),
+            Column(target, manifest["hashes"], size),
+            id_index,
+        )
+
+    @classmethod
+    def load_if_exists(cls, path: str) -> Optional["ItemGraph"]:
+        if current_generation(Path(path)) is None:
+            return None
+        try:
+            graph = cls.load(path)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable item graph at {path}: {e}")
+            return None
+        logger.info(f"Item graph loaded from {path} ({len(graph)} products, k={graph.k})")
+        return graph
+
+
+def main():
+    import argparse
+    from ingest import DataIngester
+    from embed_and_load import ProductEmbedder
+    from catalog_sync import CatalogSync
+
+    parser = argparse.ArgumentParser(description="Build or refresh the item-to-item similarity graph")
+    parser.add_argument("--path", default=os.getenv("ITEM_GRAPH_PATH", "data/item_graph"))
+    parser.add_argument("--k", type=int, default=int(os.getenv("ITEM_GRAPH_K", "20")))
+    parser.add_argument("--full", action="store_true", help="Rebuild every row instead of refreshing changes")
+    args = parser.parse_args()
+
+    ingester = DataIngester()
+    df = ingester.preprocess_data(ingester.load_products())
+    embedder = ProductEmbedder(lazy_model=True)
+    texts, metadata, ids = embedder.product_records(df)
+    hashes = [CatalogSync.content_hash(t, md) for t, md in zip(texts, metadata)]
+    # Catalog vectors come from the embedding cache the ingest filled
+    matrix = embedder.embedding_generator.generate_embeddings(texts)
+
+    previous = None if args.full else ItemGraph.load_if_exists(args.path)
+    if previous is not None and previous.k == args.k:
+        graph = previous.refresh(ids, matrix, hashes)
+    else:
+        graph = ItemGraph.build(ids, matrix, k=args.k, hashes=hashes)
+    graph.save(args.path)
+    print(f"Item graph: {len(graph)} products, {graph.k} neighbors each -> {args.path}")
+
+
+if __name__ == "__main__":
+    main()
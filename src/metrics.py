@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a cached lookup (sub-ms) up to a cold model load
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ENABLED = os.getenv("METRICS_ENABLED", "1").lower() in ("1", "true", "yes", "y")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def state(self) -> Dict[str, Any]:
+        with self._lock:
+            values = [[list(key), self._copy(value)] for key, value in self._values.items()]
+        return {"kind": self.kind, "help": self.help, "labelnames": list(self.labelnames), "values": values}
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        return value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; per label set it keeps bucket counts, sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (not cumulative) counts plus a +Inf slot, then sum and count
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][slot] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels: Any) -> "_Timer":
+        return _Timer(self, labels)
+
+    @staticmethod
+    def _copy(value: Any) -> Any:
+        return [list(value[0]), value[1], value[2]]
+
+    def state(self) -> Dict[str, Any]:
+        state = super().state()
+        state["buckets"] = list(self.buckets)
+        return state
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, Any]) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> Any:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        return {name: metric.state() for name, metric in self._metrics.items()}
+
+
+REGISTRY = Registry()
+
+SEARCH_STAGE_SECONDS = REGISTRY.histogram(
+    "search_stage_seconds", "Time spent in each stage of a search request", ("stage", "backend")
+)
+SEARCH_REQUEST_SECONDS = REGISTRY.histogram(
+    "search_request_seconds", "End-to-end search latency, result cache hits included", ("backend", "mode")
+)
+SEARCH_REJECTED = REGISTRY.counter(
+    "search_rejected_total", "Searches shed because the encode queue was full", ("backend",)
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "search_cache_lookups_total", "Query-embedding and result cache lookups", ("cache", "result")
+)
+SEARCH_CANDIDATES = REGISTRY.counter(
+    "search_candidates_total", "Candidates produced by each retrieval arm", ("backend", "arm")
+)
+FILTER_DROPPED = REGISTRY.counter(
+    "search_filter_dropped_total", "Candidates removed after retrieval by price filters or the similarity floor",
+    ("backend", "reason"),
+)
+FILTERED_QUERIES = REGISTRY.counter(
+    "search_filtered_queries_total", "Searches whose query text carried a price constraint", ("backend",)
+)
+
+
+def stage(name: str, backend: str) -> _Timer:
+    """``with stage("encode", backend):`` records the block in search_stage_seconds"""
+    return SEARCH_STAGE_SECONDS.time(stage=name, backend=backend)
+
+
+def merge(states: List[Dict[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Sum the collected states of several processes, series by series"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for state in states:
+        for name, metric in state.items():
+            target = merged.get(name)
+            if target is None:
+                merged[name] = {**metric, "values": [[list(k), v] for k, v in metric["values"]]}
+                continue
+            if target.get("buckets") != metric.get("buckets"):
+                continue
+            index = {tuple(k): v for k, v in target["values"]}
+            for key, value in metric["values"]:
+                key = tuple(key)
+                current = index.get(key)
+                if current is None:
+                    index[key] = value
+                elif metric["kind"] == "histogram":
+                    index[key] = [[a + b for a, b in zip(current[0], value[0])], current[1] + value[1],
+                                  current[2] + value[2]]
+                else:
+                    index[key] = current + value
+            target["values"] = [[list(k), v] for k, v in index.items()]
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(state: Dict[str, Dict[str, Any]]) -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines: List[str] = []
+    for name, metric in state.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labelnames"]
+        for key, value in sorted(metric["values"], key=lambda item: item[0]):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(names, key)} {_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(metric["buckets"]) + ["+Inf"], counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else _number(float(bound))
+                lines.append(f"{name}_bucket{_labels(names, key, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, key)} {_number(float(total))}")
+            lines.append(f"{name}_count{_labels(names, key)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+class MultiprocessCollector:
+    """Shares metrics between app workers through one JSON file per process.
+
+    Each worker periodically writes its own state into ``directory``; the
+    worker that answers a scrape writes a fresh copy of its own and merges
+    every file, so /metrics covers all workers whichever one Prometheus hits.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.path = self.directory / f"worker-{os.getpid()}.json"
+
+    @staticmethod
+    def clear(directory: str) -> None:
+        # Called once before workers start so counters from a previous run are not summed in
+        for entry in Path(directory).glob("worker-*.json"):
+            entry.unlink(missing_ok=True)
+
+    def flush(self) -> None:
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(REGISTRY.collect(), f)
+        os.replace(tmp_path, self.path)
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        self.flush()
+        states = []
+        for entry in sorted(self.directory.glob("worker-*.json")):
+            try:
+                with open(entry, "r", encoding="utf-8") as f:
+                    states.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics file {entry}: {e}")
+        return merge(states)
+
+
+def exposition(collector: Optional[MultiprocessCollector] = None) -> str:
+    return render(collector.collect() if collector is not None else REGISTRY.collect())
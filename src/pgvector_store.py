@@ -1,12 +1,19 @@
 from __future__ import annotations
 
+import asyncio
+import io
 import os
+import re
+import time
 import logging
-from typing import List, Dict, Any, Optional
+from decimal import Decimal
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
 import json
 
 import numpy as np
 
+from filters import SearchFilter
+
 try:
     import psycopg2
     from psycopg2.extras import execute_values
@@ -19,11 +26,23 @@ except ImportError as import_error:
     create_engine = None
     sessionmaker = None
 
+try:
+    import asyncpg  # type: ignore
+    from pgvector.asyncpg import register_vector  # type: ignore
+except ImportError:
+    asyncpg = None
+    register_vector = None
+
 logger = logging.getLogger(__name__)
 
 
 class PgVectorStore:
     """PostgreSQL vector store using pgvector extension"""
+
+    backend_name = "pgvector"
+    supports_projection = True
+    TYPED_COLUMNS = {"title": "TEXT", "category": "TEXT", "price": "NUMERIC", "url": "TEXT"}
+    COPY_COLUMNS = "(id, embedding, title, category, price, url, metadata)"
     
     def __init__(
         self,
@@ -54,6 +73,19 @@ class PgVectorStore:
         self.ivf_probes = int(os.getenv("PGVECTOR_PROBES", str(self.ivf_lists)))
         # exact mode forces sequential scan (useful for tiny datasets)
         self.exact_mode = os.getenv("PGVECTOR_EXACT", "0").lower() in ("1", "true", "yes", "y")
+        # "copy" streams rows into a staging table and swaps it in; "insert" is the per-row path
+        self.load_method = os.getenv("PGVECTOR_LOAD_METHOD", "copy").lower()
+        self.copy_chunk_rows = int(os.getenv("PGVECTOR_COPY_CHUNK", "10000"))
+        # catalog version lives in the database so every worker sees reloads;
+        # it is re-read at most once per refresh interval
+        self.catalog_table = f"{table_name}_catalog"
+        self.version_refresh_seconds = float(os.getenv("PGVECTOR_VERSION_REFRESH", "5"))
+        self._catalog_version = 0
+        self._version_checked_at = 0.0
+        # asearch() opens its asyncpg pool lazily inside the serving event loop
+        self.async_pool_size = int(os.getenv("PGVECTOR_ASYNC_POOL_SIZE", "10"))
+        self._async_pool = None
+        self._async_pool_lock = asyncio.Lock()
         
         # Build connection string
         self.connection_string = f"postgresql://{self.user}:{self.password}@{self.host}:{self.port}/{self.database}"
@@ -74,33 +106,32 @@ class PgVectorStore:
                 conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector;"))
                 conn.commit()
                 
-                create_table_sql = f"""
-                CREATE TABLE IF NOT EXISTS {self.table_name} (
-                    id INTEGER PRIMARY KEY,
-                    embedding vector({self.dimension}),
-                    metadata JSONB,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                );
-                """
-                conn.execute(text(create_table_sql))
+                conn.execute(text(self._create_table_sql(self.table_name)))
                 conn.commit()
-                
-                if self.index_type == "hnsw":
-                    index_sql = f"""
-                    CREATE INDEX IF NOT EXISTS {self.table_name}_embedding_hnsw 
-                    ON {self.table_name} USING hnsw (embedding vector_cosine_ops);
-                    """
-                else:
-                    index_sql = f"""
-                    CREATE INDEX IF NOT EXISTS {self.table_name}_embedding_idx 
-                    ON {self.table_name} USING ivfflat (embedding vector_cosine_ops) 
-                    WITH (lists = {self.ivf_lists});
-                    """
-                conn.execute(text(index_sql))
+
+                # Tables created before the typed columns existed are migrated in place
+                self._migrate_typed_columns(conn)
+
+                for index_sql in self._index_statements(self.table_name):
+                    conn.execute(text(index_sql))
+                # The (price, id) index covers everything the single-column one did
+                conn.execute(text(f"DROP INDEX IF EXISTS {self.table_name}_price_idx;"))
                 conn.commit()
 
                 conn.execute(text(f"ANALYZE {self.table_name};"))
                 conn.commit()
+
+                conn.execute(text(f"""
+                CREATE TABLE IF NOT EXISTS {self.catalog_table} (
+                    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                    version BIGINT NOT NULL DEFAULT 0,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                );
+                """))
+                conn.execute(text(
+                    f"INSERT INTO {self.catalog_table} (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING"
+                ))
+                conn.commit()
                 
             logger.info(f"Database setup completed. Table '{self.table_name}' ready with pgvector extension.")
             
@@ -108,6 +139,306 @@ class PgVectorStore:
             logger.error(f"Failed to setup database: {e}")
             raise
     
+    def _create_table_sql(self, table_name: str) -> str:
+        return f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            id INTEGER PRIMARY KEY,
+            embedding vector({self.dimension}),
+            title TEXT,
+            category TEXT,
+            price NUMERIC,
+            url TEXT,
+            metadata JSONB,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+
+    def _index_names(self, table_name: str) -> List[str]:
+        ann_name = f"{table_name}_embedding_hnsw" if self.index_type == "hnsw" else f"{table_name}_embedding_idx"
+        return [ann_name, f"{table_name}_price_id_idx", f"{table_name}_category_idx", f"{table_name}_title_idx"]
+
+    def _index_statements(self, table_name: str) -> List[str]:
+        if self.index_type == "hnsw":
+            ann_sql = f"""
+            CREATE INDEX IF NOT EXISTS {table_name}_embedding_hnsw 
+            ON {table_name} USING hnsw (embedding vector_cosine_ops);
+            """
+        else:
+            ann_sql = f"""
+            CREATE INDEX IF NOT EXISTS {table_name}_embedding_idx 
+            ON {table_name} USING ivfflat (embedding vector_cosine_ops) 
+            WITH (lists = {self.ivf_lists});
+            """
+        return [
+            ann_sql,
+            # (price, id) serves both price filters and price-ordered browsing; it has
+            # its own name so tables that only have the older single-column
+            # {table}_price_idx get it created instead of skipped
+            f"CREATE INDEX IF NOT EXISTS {table_name}_price_id_idx ON {table_name} (price, id);",
+            f"CREATE INDEX IF NOT EXISTS {table_name}_category_idx ON {table_name} (lower(category));",
+            f"CREATE INDEX IF NOT EXISTS {table_name}_title_idx ON {table_name} (title);",
+        ]
+
+    def _migrate_typed_columns(self, conn) -> None:
+        for column, column_type in self.TYPED_COLUMNS.items():
+            conn.execute(text(
+                f"ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS {column} {column_type}"
+            ))
+        result = conn.execute(text(f"""
+        UPDATE {self.table_name} SET
+            title = metadata->>'title',
+            category = metadata->>'category',
+            price = NULLIF(metadata->>'price', '')::numeric,
+            url = metadata->>'url'
+        WHERE metadata IS NOT NULL AND title IS NULL AND category IS NULL AND price IS NULL
+        """))
+        conn.commit()
+        if result.rowcount:
+            logger.info(f"Backfilled typed columns for {result.rowcount} rows in {self.table_name}")
+
+    @staticmethod
+    def _typed_values(md: Dict[str, Any]) -> Dict[str, Any]:
+        price = md.get('price')
+        return {
+            'title': md.get('title'),
+            'category': md.get('category'),
+            'price': float(price) if isinstance(price, (int, float, np.floating)) else None,
+            'url': md.get('url'),
+        }
+
+    @property
+    def catalog_version(self) -> int:
+        now = time.monotonic()
+        if now - self._version_checked_at >= self.version_refresh_seconds:
+            try:
+                with self.engine.connect() as conn:
+                    row = conn.execute(
+                        text(f"SELECT version FROM {self.catalog_table} WHERE id = 1")
+                    ).fetchone()
+                self._catalog_version = int(row[0]) if row else 0
+                self._version_checked_at = now
+            except Exception as e:
+                logger.warning(f"Failed to read catalog version: {e}")
+        return self._catalog_version
+
+    def _bump_catalog_version(self, conn) -> None:
+        row = conn.execute(text(
+            f"UPDATE {self.catalog_table} SET version = version + 1, updated_at = CURRENT_TIMESTAMP "
+            f"WHERE id = 1 RETURNING version"
+        )).fetchone()
+        if row:
+            self._catalog_version = int(row[0])
+            self._version_checked_at = time.monotonic()
+
+    @staticmethod
+    def _copy_field(value: Any) -> str:
+        if value is None:
+            return "\\N"
+        return (
+            str(value)
+            .replace("\\", "\\\\")
+            .replace("\t", "\\t")
+            .replace("\n", "\\n")
+            .replace("\r", "\\r")
+        )
+
+    def _copy_rows(self, embeddings: np.ndarray, metadata: List[Dict[str, Any]], ids: List[Any]) -> io.StringIO:
+        buf = io.StringIO()
+        for emb, md, id_val in zip(embeddings, metadata, ids):
+            typed = self._typed_values(md)
+            fields = [
+                str(int(id_val)),
+                "[" + ",".join(map(str, np.asarray(emb, dtype=np.float32).tolist())) + "]",
+                self._copy_field(typed['title']),
+                self._copy_field(typed['category']),
+                self._copy_field(typed['price']),
+                self._copy_field(typed['url']),
+                self._copy_field(json.dumps(md, default=str)),
+            ]
+            buf.write("\t".join(fields))
+            buf.write("\n")
+        buf.seek(0)
+        return buf
+
+    def _copy_into(self, cur, table_name: str, embeddings: np.ndarray,
+                   metadata: List[Dict[str, Any]], ids: List[Any]) -> None:
+        # Stream in bounded chunks so the whole catalog is never buffered as text
+        start_time = time.perf_counter()
+        for start in range(0, len(ids), self.copy_chunk_rows):
+            end = start + self.copy_chunk_rows
+            buf = self._copy_rows(embeddings[start:end], metadata[start:end], ids[start:end])
+            cur.copy_expert(f"COPY {table_name} {self.COPY_COLUMNS} FROM STDIN", buf)
+        logger.info(f"Copied {len(ids)} rows into {table_name} in {time.perf_counter() - start_time:.2f}s")
+
+    @staticmethod
+    def _last_per_id(embeddings: np.ndarray, metadata: List[Dict[str, Any]],
+                     ids: List[Any]) -> Tuple[np.ndarray, List[Dict[str, Any]], List[Any]]:
+        # One row per id, the last one in the batch winning: COPY would hit the
+        # primary key and ON CONFLICT cannot update a row twice in one statement
+        latest = {str(id_val): i for i, id_val in enumerate(ids)}
+        if len(latest) == len(ids):
+            return embeddings, metadata, ids
+        keep = sorted(latest.values())
+        return np.asarray(embeddings)[keep], [metadata[i] for i in keep], [ids[i] for i in keep]
+
+    def _merge_into(self, cur, table_name: str, embeddings: np.ndarray,
+                    metadata: List[Dict[str, Any]], ids: List[Any]) -> None:
+        # COPY into a temp table, then insert-or-update the target from it
+        temp_table = f"{table_name}_upsert"
+        cur.execute(f"CREATE TEMP TABLE IF NOT EXISTS {temp_table} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP")
+        cur.execute(f"TRUNCATE {temp_table}")
+        self._copy_into(cur, temp_table, embeddings, metadata, ids)
+        cur.execute(f"""
+        INSERT INTO {table_name} {self.COPY_COLUMNS}
+        SELECT id, embedding, title, category, price, url, metadata FROM {temp_table}
+        ON CONFLICT (id) DO UPDATE SET
+            embedding = EXCLUDED.embedding,
+            title = EXCLUDED.title,
+            category = EXCLUDED.category,
+            price = EXCLUDED.price,
+            url = EXCLUDED.url,
+            metadata = EXCLUDED.metadata,
+            created_at = CURRENT_TIMESTAMP
+        """)
+
+    def bulk_load(
+        self,
+        embeddings: np.ndarray,
+        metadata: List[Dict[str, Any]],
+        ids: List[Any],
+    ) -> None:
+        """Replace the table contents via COPY into a staging table and an atomic swap"""
+        
+        if len(embeddings) != len(metadata) or len(embeddings) != len(ids):
+            raise ValueError("Lengths of embeddings, metadata, and ids must match")
+        self.load_chunks([(embeddings, metadata, ids)])
+
+    def load_chunks(self, chunks: Iterable[Tuple[np.ndarray, List[Dict[str, Any]], List[Any]]]) -> None:
+        """Replace the table contents from a stream of (embeddings, metadata, ids)
+        chunks; each chunk is copied into the staging table as it arrives and
+        the table is swapped in once the stream ends. An id repeated within or
+        across chunks keeps its last row"""
+
+        if self.load_method != "copy":
+            # Per-row path: the first chunk replaces the table, later ones upsert
+            for i, (embeddings, metadata, ids) in enumerate(chunks):
+                if i == 0:
+                    self.add_embeddings(embeddings, metadata, ids)
+                else:
+                    self.upsert_embeddings(embeddings, metadata, ids)
+            return
+
+        staging = f"{self.table_name}_staging"
+        raw = self.engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            cur.execute(f"DROP TABLE IF EXISTS {staging}")
+            cur.execute(self._create_table_sql(staging))
+            
+            # Indexes are built once the data is in
+            total = 0
+            seen = set()
+            for embeddings, metadata, ids in chunks:
+                if len(embeddings) != len(metadata) or len(embeddings) != len(ids):
+                    raise ValueError("Lengths of embeddings, metadata, and ids must match")
+                embeddings, metadata, ids = self._last_per_id(embeddings, metadata, ids)
+                # Ids already copied by an earlier chunk are merged over their row
+                repeated = [i for i, id_val in enumerate(ids) if str(id_val) in seen]
+                if repeated:
+                    fresh = sorted(set(range(len(ids))) - set(repeated))
+                    self._copy_into(cur, staging, np.asarray(embeddings)[fresh],
+                                    [metadata[i] for i in fresh], [ids[i] for i in fresh])
+                    self._merge_into(cur, staging, np.asarray(embeddings)[repeated],
+                                     [metadata[i] for i in repeated], [ids[i] for i in repeated])
+                else:
+                    self._copy_into(cur, staging, embeddings, metadata, ids)
+                seen.update(str(id_val) for id_val in ids)
+                total += len(ids) - len(repeated)
+
+            for index_sql in self._index_statements(staging):
+                cur.execute(index_sql)
+            cur.execute(f"ANALYZE {staging}")
+            raw.commit()
+
+            # Readers block only for the swap itself and never see an empty table
+            cur.execute(f"LOCK TABLE {self.table_name} IN ACCESS EXCLUSIVE MODE")
+            cur.execute(f"DROP TABLE {self.table_name}")
+            cur.execute(f"ALTER TABLE {staging} RENAME TO {self.table_name}")
+            cur.execute(f"ALTER TABLE {self.table_name} RENAME CONSTRAINT {staging}_pkey TO {self.table_name}_pkey")
+            for staging_index, final_index in zip(self._index_names(staging), self._index_names(self.table_name)):
+                cur.execute(f"ALTER INDEX IF EXISTS {staging_index} RENAME TO {final_index}")
+            self._bump_catalog_version_raw(cur)
+            raw.commit()
+
+            logger.info(f"Bulk loaded {total} embeddings into {self.table_name}")
+
+        except Exception as e:
+            raw.rollback()
+            logger.error(f"Bulk load failed: {e}")
+            raise
+        finally:
+            raw.close()
+
+    def upsert_embeddings(
+        self,
+        embeddings: np.ndarray,
+        metadata: List[Dict[str, Any]],
+        ids: List[Any],
+    ) -> None:
+        """Insert or update only the given rows, leaving the rest of the table untouched"""
+
+        if len(embeddings) != len(metadata) or len(embeddings) != len(ids):
+            raise ValueError("Lengths of embeddings, metadata, and ids must match")
+        if len(ids) == 0:
+            return
+        embeddings, metadata, ids = self._last_per_id(embeddings, metadata, ids)
+
+        raw = self.engine.raw_connection()
+        try:
+            cur = raw.cursor()
+            self._merge_into(cur, self.table_name, embeddings, metadata, ids)
+            self._bump_catalog_version_raw(cur)
+            raw.commit()
+
+            logger.info(f"Upserted {len(ids)} embeddings into {self.table_name}")
+
+        except Exception as e:
+            raw.rollback()
+            logger.error(f"Upsert failed: {e}")
+            raise
+        finally:
+            raw.close()
+
+    def delete_ids(self, ids: List[Any]) -> None:
+        if not ids:
+            return
+        try:
+            with self.engine.connect() as conn:
+                result = conn.execute(
+                    text(f"DELETE FROM {self.table_name} WHERE id = ANY(:ids)"),
+                    {'ids': [int(i) for i in ids]},
+                )
+                self._bump_catalog_version(conn)
+                conn.commit()
+            logger.info(f"Deleted {result.rowcount} rows from {self.table_name}")
+        except Exception as e:
+            logger.error(f"Failed to delete ids: {e}")
+            raise
+
+    def count(self) -> int:
+        with self.engine.connect() as conn:
+            return int(conn.execute(text(f"SELECT count(*) FROM {self.table_name}")).scalar() or 0)
+
+    def _bump_catalog_version_raw(self, cur) -> None:
+        cur.execute(
+            f"UPDATE {self.catalog_table} SET version = version + 1, updated_at = CURRENT_TIMESTAMP "
+            f"WHERE id = 1 RETURNING version"
+        )
+        row = cur.fetchone()
+        if row:
+            self._catalog_version = int(row[0])
+            self._version_checked_at = time.monotonic()
+
     def add_embeddings(
         self,
         embeddings: np.ndarray,
@@ -118,6 +449,10 @@ class PgVectorStore:
         
         if len(embeddings) != len(metadata) or len(embeddings) != len(ids):
             raise ValueError("Lengths of embeddings, metadata, and ids must match")
+
+        if self.load_method == "copy":
+            self.bulk_load(embeddings, metadata, ids)
+            return
         
         try:
             with self.engine.connect() as conn:
@@ -129,7 +464,8 @@ class PgVectorStore:
                 data_to_insert.append({
                     'id': int(id_val),
                     'embedding': emb.tolist(),  # Convert numpy array to list
-                    'metadata': json.dumps(md)  # Convert dict to JSON string
+                    'metadata': json.dumps(md),  # Convert dict to JSON string
+                    **self._typed_values(md),
                 })
             
             for i in range(0, len(data_to_insert), batch_size):
@@ -138,20 +474,28 @@ class PgVectorStore:
                 with self.engine.connect() as conn:
                     for item in batch:
                         insert_sql = """
-                        INSERT INTO {} (id, embedding, metadata) 
-                        VALUES (:id, CAST(:embedding AS vector), CAST(:metadata AS jsonb))
+                        INSERT INTO {} (id, embedding, title, category, price, url, metadata) 
+                        VALUES (:id, CAST(:embedding AS vector), :title, :category, :price, :url,
+                                CAST(:metadata AS jsonb))
                         ON CONFLICT (id) DO UPDATE SET 
                             embedding = EXCLUDED.embedding,
+                            title = EXCLUDED.title,
+                            category = EXCLUDED.category,
+                            price = EXCLUDED.price,
+                            url = EXCLUDED.url,
                             metadata = EXCLUDED.metadata,
                             created_at = CURRENT_TIMESTAMP
                         """.format(self.table_name)
                         
                         conn.execute(text(insert_sql), {
-                            'id': item['id'],
+                            **item,
                             'embedding': str(item['embedding']),
-                            'metadata': item['metadata']
                         })
                     conn.commit()
+
+            with self.engine.connect() as conn:
+                self._bump_catalog_version(conn)
+                conn.commit()
             
             logger.info(f"Successfully added {len(embeddings)} embeddings to {self.table_name}")
             
@@ -159,77 +503,352 @@ class PgVectorStore:
             logger.error(f"Failed to add embeddings: {e}")
             raise
     
+    def _apply_search_settings(self, conn) -> None:
+        if self.index_type == "ivfflat":
+            try:
+                conn.execute(text("SET LOCAL ivfflat.probes = :p"), {"p": self.ivf_probes})
+            except Exception:
+                pass
+        if self.exact_mode:
+            try:
+                conn.execute(text("SET LOCAL enable_indexscan = off"))
+                conn.execute(text("SET LOCAL enable_bitmapscan = off"))
+            except Exception:
+                pass
+
+    @staticmethod
+    def _parse_metadata(md_raw: Any) -> Dict[str, Any]:
+        if isinstance(md_raw, dict):
+            return md_raw
+        try:
+            return json.loads(md_raw) if md_raw is not None else {}
+        except Exception:
+            return {}
+
+    def _apply_filter_settings(self, conn) -> None:
+        # pgvector >= 0.8 keeps scanning the ANN index until LIMIT rows pass the
+        # WHERE clause; older versions simply ignore these settings
+        for setting in ("SET LOCAL hnsw.iterative_scan = relaxed_order",
+                        "SET LOCAL ivfflat.iterative_scan = relaxed_order"):
+            try:
+                with conn.begin_nested():
+                    conn.execute(text(setting))
+            except Exception:
+                pass
+
+    def _projection(self, fields: Optional[Sequence[str]]) -> Tuple[str, List[str]]:
+        # Without an explicit field list the full JSONB record is returned
+        if fields is None:
+            return "metadata", []
+        columns = [f for f in fields if f in self.TYPED_COLUMNS]
+        return ", ".join(columns) if columns else "NULL", columns
+
+    @staticmethod
+    def _projected_metadata(row: Any, columns: List[str], offset: int) -> Dict[str, Any]:
+        md: Dict[str, Any] = {}
+        for i, column in enumerate(columns):
+            value = row[offset + i]
+            md[column] = float(value) if column == "price" and value is not None else value
+        return md
+
+    def _search_statement(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int,
+        filter: Optional[SearchFilter],
+        fields: Optional[Sequence[str]],
+    ) -> Tuple[str, Dict[str, Any], List[str], bool]:
+        where_sql, filter_params = ("", {})
+        if filter is not None and not filter.is_empty:
+            where_sql, filter_params = filter.to_sql()
+        select_sql, columns = self._projection(fields)
+
+        search_sql = """
+        SELECT 
+            id,
+            1 - (embedding <=> CAST(:query_vector AS vector)) as similarity,
+            {}
+        FROM {}
+        {}
+        ORDER BY embedding <=> CAST(:query_vector AS vector)
+        LIMIT :top_k
+        """.format(select_sql, self.table_name, f"WHERE {where_sql}" if where_sql else "")
+        params = {
+            'query_vector': str(np.asarray(query_embedding).tolist()),
+            'top_k': top_k,
+            **filter_params,
+        }
+        return search_sql, params, columns, bool(where_sql)
+
+    def _search_results(self, rows: Sequence[Any], columns: List[str],
+                        fields: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+        results = []
+        for row in rows:
+            if columns:
+                md = self._projected_metadata(row, columns, 2)
+            else:
+                md = self._parse_metadata(row[2]) if fields is None else {}
+            results.append({
+                "id": str(row[0]),
+                "metadata": md,
+                "similarity": float(row[1]),
+            })
+        return results
+
     def search(
         self,
         query_embedding: np.ndarray,
         top_k: int = 5,
-        filter: Optional[Dict[str, Any]] = None,
+        filter: Optional[SearchFilter] = None,
+        fields: Optional[Sequence[str]] = None,
     ) -> List[Dict[str, Any]]:
         
         try:
-            query_vector = query_embedding.tolist()
+            search_sql, params, columns, filtered = self._search_statement(query_embedding, top_k, filter, fields)
             
+            with self.engine.connect() as conn:
+                self._apply_search_settings(conn)
+                if filtered:
+                    self._apply_filter_settings(conn)
+
+                result = conn.execute(text(search_sql), params)
+                rows = result.fetchall()
+            
+            results = self._search_results(rows, columns, fields)
+            
+            logger.info(f"Found {len(results)} results for vector search")
+            return results
+            
+        except Exception as e:
+            logger.error(f"Search failed: {e}")
+            raise
+
+    async def _get_async_pool(self):
+        async with self._async_pool_lock:
+            if self._async_pool is None:
+                self._async_pool = await asyncpg.create_pool(
+                    host=self.host,
+                    port=self.port,
+                    user=self.user,
+                    password=self.password,
+                    database=self.database,
+                    min_size=1,
+                    max_size=self.async_pool_size,
+                    init=register_vector,
+                )
+                logger.info(f"Opened asyncpg pool (max {self.async_pool_size} connections)")
+        return self._async_pool
+
+    @staticmethod
+    def _positional(sql: str, params: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        # asyncpg takes $n placeholders; NUMERIC comparisons want Decimal, and
+        # the vector codec wants the array rather than its text form
+        names: List[str] = []
+
+        def placeholder(match: "re.Match[str]") -> str:
+            name = match.group(1)
+            if name not in names:
+                names.append(name)
+            return f"${names.index(name) + 1}"
+
+        positional_sql = re.sub(r"(?<!:):(\w+)", placeholder, sql)
+        values: List[Any] = []
+        for name in names:
+            value = params[name]
+            if name == "query_vector":
+                value = np.asarray(json.loads(value), dtype=np.float32)
+            elif isinstance(value, float):
+                value = Decimal(str(value))
+            values.append(value)
+        return positional_sql, values
+
+    async def asearch(
+        self,
+        query_embedding: np.ndarray,
+        top_k: int = 5,
+        filter: Optional[SearchFilter] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Async variant of ``search`` on an asyncpg pool; without asyncpg the
+        sync query runs on a worker thread."""
+        if asyncpg is None:
+            return await asyncio.to_thread(self.search, query_embedding, top_k, filter, fields)
+
+        try:
+            search_sql, params, columns, filtered = self._search_statement(query_embedding, top_k, filter, fields)
+            positional_sql, values = self._positional(search_sql, params)
+            pool = await self._get_async_pool()
+            async with pool.acquire() as conn:
+                async with conn.transaction():
+                    if self.index_type == "ivfflat":
+                        await conn.execute(f"SET LOCAL ivfflat.probes = {int(self.ivf_probes)}")
+                    if self.exact_mode:
+                        await conn.execute("SET LOCAL enable_indexscan = off")
+                        await conn.execute("SET LOCAL enable_bitmapscan = off")
+                    if filtered:
+                        for setting in ("SET LOCAL hnsw.iterative_scan = relaxed_order",
+                                        "SET LOCAL ivfflat.iterative_scan = relaxed_order"):
+                            try:
+                                async with conn.transaction():
+                                    await conn.execute(setting)
+                            except Exception:
+                                pass
+                    rows = await conn.fetch(positional_sql, *values)
+
+            results = self._search_results(rows, columns, fields)
+            logger.info(f"Found {len(results)} results for async vector search")
+            return results
+
+        except Exception as e:
+            logger.error(f"Async search failed: {e}")
+            raise
+
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+    ) -> List[List[Dict[str, Any]]]:
+        
+        query_embeddings = np.asarray(query_embeddings)
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings.reshape(1, -1)
+        if query_embeddings.shape[0] == 0:
+            return []
+
+        try:
+            # One round trip: unnest the query vectors and run a LATERAL top-k per row
             search_sql = """
-            SELECT 
-                id,
-                metadata,
-                1 - (embedding <=> CAST(:query_vector AS vector)) as similarity
-            FROM {}
-            ORDER BY embedding <=> CAST(:query_vector AS vector)
-            LIMIT :top_k
+            SELECT q.ord, r.id, r.metadata, r.similarity
+            FROM unnest(CAST(:query_vectors AS text[])) WITH ORDINALITY AS q(vec, ord)
+            CROSS JOIN LATERAL (
+                SELECT
+                    id,
+                    metadata,
+                    1 - (embedding <=> CAST(q.vec AS vector)) AS similarity
+                FROM {}
+                ORDER BY embedding <=> CAST(q.vec AS vector)
+                LIMIT :top_k
+            ) r
+            ORDER BY q.ord, r.similarity DESC
             """.format(self.table_name)
-            
+
             with self.engine.connect() as conn:
-                if self.index_type == "ivfflat":
-                    try:
-                        conn.execute(text("SET LOCAL ivfflat.probes = :p"), {"p": self.ivf_probes})
-                    except Exception:
-                        pass
-                if self.exact_mode:
-                    try:
-                        conn.execute(text("SET LOCAL enable_indexscan = off"))
-                        conn.execute(text("SET LOCAL enable_bitmapscan = off"))
-                    except Exception:
-                        pass
+                self._apply_search_settings(conn)
 
                 result = conn.execute(
-                    text(search_sql), 
+                    text(search_sql),
                     {
-                        'query_vector': str(query_vector),
+                        'query_vectors': [str(vec.tolist()) for vec in query_embeddings],
                         'top_k': top_k
                     }
                 )
                 rows = result.fetchall()
-            
-            results = []
+
+            results: List[List[Dict[str, Any]]] = [[] for _ in range(query_embeddings.shape[0])]
             for row in rows:
-                md_raw = row[1]
-                if isinstance(md_raw, (str, bytes, bytearray)):
-                    try:
-                        md = json.loads(md_raw)
-                    except Exception:
-                        md = {}
-                elif isinstance(md_raw, dict):
-                    md = md_raw
-                else:
-                    try:
-                        md = json.loads(md_raw) if md_raw is not None else {}
-                    except Exception:
-                        md = {}
-
-                results.append({
-                    "id": str(row[0]),
-                    "metadata": md,
-                    "similarity": float(row[2]),
+                results[int(row[0]) - 1].append({
+                    "id": str(row[1]),
+                    "metadata": self._parse_metadata(row[2]),
+                    "similarity": float(row[3]),
                 })
-            
-            logger.info(f"Found {len(results)} results for vector search")
+
+            logger.info(f"Batch vector search completed for {len(results)} queries")
             return results
-            
+
         except Exception as e:
-            logger.error(f"Search failed: {e}")
+            logger.error(f"Batch search failed: {e}")
             raise
     
+    def get_by_ids(self, ids: List[Any], include_embeddings: bool = False) -> List[Dict[str, Any]]:
+        """Primary-key lookup; results follow the order of ``ids`` and unknown ids are skipped"""
+        keys = []
+        for id_val in ids:
+            try:
+                keys.append(int(id_val))
+            except (TypeError, ValueError):
+                continue
+        if not keys:
+            return []
+
+        columns = "id, metadata, embedding::text" if include_embeddings else "id, metadata"
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    text(f"SELECT {columns} FROM {self.table_name} WHERE id = ANY(:ids)"), {"ids": keys}
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Lookup by id failed: {e}")
+            raise
+
+        found: Dict[int, Dict[str, Any]] = {}
+        for row in rows:
+            result = {"id": str(row[0]), "metadata": self._parse_metadata(row[1])}
+            if include_embeddings:
+                # vector's text form is a JSON array
+                result["embedding"] = np.asarray(json.loads(row[2]), dtype=np.float32)
+            found[int(row[0])] = result
+        return [found[key] for key in dict.fromkeys(keys) if key in found]
+
+    def browse_by_price(
+        self,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        limit: int = 20,
+        offset: int = 0,
+        descending: bool = False,
+        after: Optional[Tuple[float, Any]] = None,
+        with_total: bool = True,
+    ) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """One price-ordered page of the products in [min_price, max_price] and the match count.
+
+        The range and the ORDER BY both run on the (price, id) btree, so a page
+        is an index range scan rather than a sort of the filtered table. With
+        an ``after`` cursor (the last row's price and id) the page starts right
+        past it through a row comparison on the same btree, so deep pages cost
+        the same as the first instead of walking ``offset`` rows. The count
+        scans the whole range; ``with_total=False`` skips it and returns None.
+        """
+        conditions = ["price IS NOT NULL"]
+        bounds: Dict[str, Any] = {}
+        if min_price is not None:
+            conditions.append("price >= :min_price")
+            bounds["min_price"] = min_price
+        if max_price is not None:
+            conditions.append("price <= :max_price")
+            bounds["max_price"] = max_price
+        where_sql = " AND ".join(conditions)
+        page_conditions = list(conditions)
+        page_params: Dict[str, Any] = {**bounds, "limit": max(0, limit), "offset": max(0, offset)}
+        if after is not None:
+            page_conditions.append(f"(price, id) {'<' if descending else '>'} (:after_price, :after_id)")
+            page_params.update(after_price=float(after[0]), after_id=int(after[1]))
+        direction = "DESC" if descending else "ASC"
+        page_sql = f"""
+        SELECT id, metadata FROM {self.table_name}
+        WHERE {" AND ".join(page_conditions)}
+        ORDER BY price {direction}, id {direction}
+        LIMIT :limit OFFSET :offset
+        """
+        total = None
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(text(page_sql), page_params).fetchall()
+                if with_total:
+                    total = conn.execute(
+                        text(f"SELECT count(*) FROM {self.table_name} WHERE {where_sql}"), bounds
+                    ).scalar()
+        except Exception as e:
+            logger.error(f"Browse by price failed: {e}")
+            raise
+
+        page = [{"id": str(row[0]), "metadata": self._parse_metadata(row[1])} for row in rows]
+        return page, None if total is None else int(total)
+
+    async def aclose(self) -> None:
+        if self._async_pool is not None:
+            await self._async_pool.close()
+            self._async_pool = None
+
     def close(self) -> None:
         """Close database connections"""
         if hasattr(self, 'session'):
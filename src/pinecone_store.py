@@ -2,10 +2,14 @@ from __future__ import annotations
 
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any
 
 import numpy as np
 
+from cache import fresh_catalog_version
+from filters import SearchFilter
+
 try:
     from pinecone import Pinecone, ServerlessSpec  # type: ignore
 except Exception as import_error:
@@ -18,6 +22,8 @@ logger = logging.getLogger(__name__)
 
 class PineconeVectorStore:
 
+    backend_name = "pinecone"
+
     def __init__(
         self,
         api_key: str | None = None,
@@ -41,6 +47,9 @@ class PineconeVectorStore:
         self.metric = metric
         self.cloud = cloud or os.getenv("PINECONE_CLOUD", "aws")
         self.region = region or os.getenv("PINECONE_REGION", "us-east-1")
+        self.query_concurrency = int(os.getenv("PINECONE_QUERY_CONCURRENCY", "8"))
+        # Unique until CatalogSync commits (or restores) the catalog digest
+        self.catalog_version = fresh_catalog_version()
 
         # Init client and ensure index exists (serverless)
         self.pc = Pinecone(api_key=self.api_key)
@@ -68,6 +77,17 @@ class PineconeVectorStore:
         ids: List[Any],
         namespace: str | None = None,
         batch_size: int = 100,
+    ) -> None:
+        # Pinecone writes are upserts already
+        self.upsert_embeddings(embeddings, metadata, ids, namespace=namespace, batch_size=batch_size)
+
+    def upsert_embeddings(
+        self,
+        embeddings: np.ndarray,
+        metadata: List[Dict[str, Any]],
+        ids: List[Any],
+        namespace: str | None = None,
+        batch_size: int = 100,
     ) -> None:
         if len(embeddings) != len(metadata) or len(embeddings) != len(ids):
             raise ValueError("Lengths of embeddings, metadata, and ids must match")
@@ -83,16 +103,45 @@ class PineconeVectorStore:
         for start in range(0, len(items), batch_size):
             batch = items[start:start + batch_size]
             self.index.upsert(vectors=batch, namespace=namespace)
+        self.catalog_version = fresh_catalog_version()
 
         logger.info(f"Upserted {len(items)} vectors into Pinecone index '{self.index_name}'")
 
+    def delete_ids(
+        self,
+        ids: List[Any],
+        namespace: str | None = None,
+        batch_size: int = 1000,
+    ) -> None:
+        ids = [str(i) for i in ids]
+        for start in range(0, len(ids), batch_size):
+            self.index.delete(ids=ids[start:start + batch_size], namespace=namespace)
+        if ids:
+            self.catalog_version = fresh_catalog_version()
+        logger.info(f"Deleted {len(ids)} vectors from Pinecone index '{self.index_name}'")
+
+    def set_catalog_version(self, version: str) -> None:
+        self.catalog_version = version
+
+    def count(self, namespace: str | None = None) -> int:
+        stats = self.index.describe_index_stats()
+        if namespace:
+            namespaces = stats.get("namespaces", {}) if isinstance(stats, dict) else getattr(stats, "namespaces", {})
+            ns = namespaces.get(namespace) or {}
+            return int(ns.get("vector_count", 0) if isinstance(ns, dict) else getattr(ns, "vector_count", 0))
+        if isinstance(stats, dict):
+            return int(stats.get("total_vector_count", 0))
+        return int(getattr(stats, "total_vector_count", 0))
+
     def search(
         self,
         query_embedding: np.ndarray,
         top_k: int = 5,
         namespace: str | None = None,
-        filter: Dict[str, Any] | None = None,
+        filter: SearchFilter | Dict[str, Any] | None = None,
     ) -> List[Dict[str, Any]]:
+        if isinstance(filter, SearchFilter):
+            filter = filter.to_pinecone()
         res = self.index.query(
             vector=query_embedding.tolist(),
             top_k=top_k,
@@ -110,4 +159,45 @@ class PineconeVectorStore:
             })
         return results
 
-
+    def get_by_ids(
+        self,
+        ids: List[Any],
+        include_embeddings: bool = False,
+        namespace: str | None = None,
+        batch_size: int = 100,
+    ) -> List[Dict[str, Any]]:
+        """Fetch records by id; results follow the order of ``ids`` and unknown ids are skipped"""
+        keys = list(dict.fromkeys(str(id_val) for id_val in ids))
+        found: Dict[str, Dict[str, Any]] = {}
+        for start in range(0, len(keys), batch_size):
+            res = self.index.fetch(ids=keys[start:start + batch_size], namespace=namespace)
+            vectors = res.get("vectors", {}) if isinstance(res, dict) else getattr(res, "vectors", {}) or {}
+            for key, vec in vectors.items():
+                metadata = vec.get("metadata") if isinstance(vec, dict) else getattr(vec, "metadata", None)
+                result: Dict[str, Any] = {"id": key, "metadata": metadata or {}}
+                if include_embeddings:
+                    values = vec.get("values") if isinstance(vec, dict) else getattr(vec, "values", None)
+                    result["embedding"] = np.asarray(values or [], dtype=np.float32)
+                found[key] = result
+        return [found[key] for key in keys if key in found]
+
+    def search_batch(
+        self,
+        query_embeddings: np.ndarray,
+        top_k: int = 5,
+        namespace: str | None = None,
+        filter: SearchFilter | Dict[str, Any] | None = None,
+    ) -> List[List[Dict[str, Any]]]:
+        query_embeddings = np.asarray(query_embeddings)
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings.reshape(1, -1)
+        if query_embeddings.shape[0] == 0:
+            return []
+
+        # Pinecone has no multi-vector query; overlap the round trips instead
+        workers = max(1, min(self.query_concurrency, query_embeddings.shape[0]))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(
+                lambda vec: self.search(vec, top_k=top_k, namespace=namespace, filter=filter),
+                query_embeddings,
+            ))
@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import cProfile
+import hmac
+import io
+import itertools
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_sequence = itertools.count(1)
+
+
+class ProfilingConfig:
+    """Env-driven switches for the on-demand profiling endpoints; all off by default"""
+
+    def __init__(self) -> None:
+        # Per-request profiles (?profile= / X-Profile) and the /admin/profile endpoints
+        self.enabled = os.getenv("PROFILING_ENABLED", "0").lower() in ("1", "true", "yes", "y")
+        # Requests must send it in X-Profile-Token; profiling stays off without one
+        self.token = os.getenv("PROFILING_TOKEN") or None
+        if self.enabled and self.token is None:
+            logger.warning("PROFILING_ENABLED is set but PROFILING_TOKEN is not; profiling stays disabled")
+            self.enabled = False
+        self.directory = Path(os.getenv("PROFILE_DIR", "data/profiles"))
+        # Older profile files beyond this many are deleted as new ones are written
+        self.keep_files = max(1, int(os.getenv("PROFILING_KEEP_FILES", "50")))
+        self.max_seconds = float(os.getenv("PROFILING_MAX_SECONDS", "60"))
+        self.sample_interval_ms = float(os.getenv("PROFILING_SAMPLE_MS", "5"))
+        # tracemalloc only sees allocations made after it starts, so it has to
+        # be switched on before the store loads; 0 leaves it off
+        self.tracemalloc_frames = int(os.getenv("PROFILING_TRACEMALLOC_FRAMES", "0"))
+
+    def authorized(self, token: Optional[str]) -> bool:
+        if not self.enabled or self.token is None or token is None:
+            return False
+        return hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+    def output_path(self, prefix: str, suffix: str) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._prune(self.keep_files - 1)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return self.directory / f"{prefix}-{stamp}-{os.getpid()}-{next(_sequence)}{suffix}"
+
+    def _prune(self, keep: int) -> None:
+        entries = []
+        for entry in self.directory.iterdir():
+            try:
+                if entry.is_file():
+                    entries.append((entry.stat().st_mtime, entry))
+            except FileNotFoundError:
+                # Pruned by another worker
+                continue
+        entries.sort(reverse=True)
+        for _, entry in entries[keep:]:
+            entry.unlink(missing_ok=True)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    # Collapsed-stack lines run root first, leaf last, frames separated by ';'
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """Statistical profiler: a background thread reads every thread's stack
+    (``sys._current_frames``) at a fixed interval and counts identical stacks.
+
+    ``collapsed()`` is the input format of flamegraph.pl and speedscope. Only
+    the sampled threads pay anything, and only while the sampler runs.
+    """
+
+    def __init__(self, interval_ms: float = 5.0, thread_ids: Optional[Iterable[int]] = None) -> None:
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.thread_ids = set(thread_ids) if thread_ids is not None else None
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                self.stacks[f"{names.get(ident, ident)};{_collapse(frame)}"] += 1
+            self.samples += 1
+
+    def start(self) -> "StackSampler":
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> "StackSampler":
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def save(self, path: Path) -> Path:
+        path.write_text(self.collapsed(), encoding="utf-8")
+        return path
+
+    def top(self, limit: int = 20) -> List[Tuple[str, int]]:
+        """Leaf functions by sample count (self time)"""
+        leaves: Counter = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(limit)
+
+
+def profile_call(kind: str, fn: Callable[[], Any], config: ProfilingConfig,
+                 limit: int = 30) -> Tuple[Any, Dict[str, Any]]:
+    """Run ``fn`` on the calling thread under cProfile (``kind="cprofile"``) or
+    the stack sampler (``"sample"``); the profile is written to PROFILE_DIR and
+    a text summary is returned next to ``fn``'s result"""
+    if kind == "sample":
+        sampler = StackSampler(config.sample_interval_ms, thread_ids=[threading.get_ident()]).start()
+        try:
+            result = fn()
+        finally:
+            sampler.stop()
+        path = sampler.save(config.output_path("search", ".collapsed"))
+        summary = "\n".join(f"{count:6d}  {leaf}" for leaf, count in sampler.top(limit))
+        return result, {"kind": kind, "path": str(path), "samples": sampler.samples, "summary": summary}
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = fn()
+    finally:
+        profiler.disable()
+    path = config.output_path("search", ".prof")
+    profiler.dump_stats(str(path))
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+    return result, {"kind": "cprofile", "path": str(path), "summary": out.getvalue()}
+
+
+class MemoryTracker:
+    """tracemalloc snapshots with the change since the previous one"""
+
+    def __init__(self, frames: int) -> None:
+        self.frames = frames
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        if self.frames > 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            logger.info(f"tracemalloc tracing with {self.frames} frames per allocation")
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def snapshot(self, config: ProfilingConfig, limit: int = 25, group_by: str = "lineno") -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running; set PROFILING_TRACEMALLOC_FRAMES before startup")
+        with self._lock:
+            current = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            previous, self._previous = self._previous, current
+        path = config.output_path("memory", ".tracemalloc")
+        current.dump(str(path))
+        traced, peak = tracemalloc.get_traced_memory()
+        report: Dict[str, Any] = {
+            "path": str(path),
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "top": [
+                {"where": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                for stat in current.statistics(group_by)[:limit]
+            ],
+        }
+        if previous is not None:
+            report["growth"] = [
+                {"where": str(stat.traceback), "bytes": stat.size_diff, "count": stat.count_diff}
+                for stat in current.compare_to(previous, group_by)[:limit]
+                if stat.size_diff
+            ]
+        return report
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 65536
+# Scans decode codes to float32 in small blocks so the temporary stays in cache
+SCAN_ROWS = 4096
+
+
+def file_backed_empty(shape: Tuple[int, ...], dtype: Any, directory: str) -> np.ndarray:
+    """Uninitialized array mapped from an unlinked file in ``directory``.
+
+    Its pages belong to the page cache rather than the process heap, so the
+    OS can write them back and drop them; the file disappears with the last
+    reference to the array.
+    """
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix="matrix-", suffix=".f32", dir=directory)
+    try:
+        os.close(fd)
+        mapped = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+    finally:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return mapped.view(np.ndarray)
+
+
+class Quantizer(ABC):
+    """Row-aligned compressed copy of the store matrix.
+
+    Full scans run over the codes; the store re-ranks the best rows with their
+    float32 vectors. Writes are applied to the codes the same way the store
+    applies them to its matrix. Codes grow in a capacity-doubling buffer so
+    chunked ingest appends in amortized O(1) per row.
+    """
+
+    kind = ""
+
+    def __init__(self) -> None:
+        self.codes = np.empty((0, 0), dtype=np.uint8)
+        # Backing storage when ``codes`` is a prefix view of it
+        self._buffer: Optional[np.ndarray] = None
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes)
+
+    @abstractmethod
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Codes for ``vectors`` under the trained parameters"""
+
+    @abstractmethod
+    def build(self, matrix: np.ndarray) -> None:
+        """Train on ``matrix`` and encode all of it"""
+
+    @abstractmethod
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Approximate similarities of ``query`` to every row, or to ``rows``"""
+
+    @abstractmethod
+    def save(self, directory: Path) -> Dict[str, Any]:
+        """Write the codes into a snapshot generation and return their manifest entry"""
+
+    @abstractmethod
+    def load(self, directory: Path, spec: Dict[str, Any]) -> None:
+        """Map the codes written by ``save``"""
+
+    def _encode_all(self, matrix: np.ndarray) -> np.ndarray:
+        return np.concatenate([self._encode(matrix[s:s + CHUNK_ROWS]) for s in range(0, len(matrix), CHUNK_ROWS)])
+
+    def add(self, vectors: np.ndarray, start_row: int) -> None:
+        new = self._encode(vectors)
+        needed = start_row + len(new)
+        buffer = self._buffer
+        if buffer is None or self.codes.base is not buffer or needed > len(buffer):
+            buffer = np.empty((max(needed, 2 * len(self.codes), 1024),) + new.shape[1:], dtype=new.dtype)
+            buffer[:start_row] = self.codes[:start_row]
+            self._buffer = buffer
+        buffer[start_row:needed] = new
+        self.codes = buffer[:needed]
+
+    def update(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        self.codes[rows] = self._encode(vectors)
+
+    def move(self, src: int, dst: int, vector: np.ndarray) -> None:
+        self.codes[dst] = self.codes[src]
+        self.codes = self.codes[:src]
+
+    def detach(self) -> None:
+        self.codes = np.array(self.codes)
+        self._buffer = None
+
+
+class Int8Quantizer(Quantizer):
+    """Symmetric per-dimension int8 codes; scores are computed in float32 blocks"""
+
+    kind = "int8"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.scale: Optional[np.ndarray] = None
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.clip(np.rint(vectors / self.scale), -127, 127).astype(np.int8)
+
+    def build(self, matrix: np.ndarray) -> None:
+        scale = np.abs(matrix).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        self.scale = scale.astype(np.float32)
+        self.codes = self._encode_all(matrix)
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        scaled = query * self.scale
+        count = len(self.codes) if rows is None else len(rows)
+        out = np.empty(count, dtype=np.float32)
+        for start in range(0, count, SCAN_ROWS):
+            block = self.codes[start:start + SCAN_ROWS] if rows is None else self.codes[rows[start:start + SCAN_ROWS]]
+            out[start:start + len(block)] = block.astype(np.float32) @ scaled
+        return out
+
+    def save(self, directory: Path) -> Dict[str, Any]:
+        np.save(directory / "int8_scale.npy", self.scale)
+        np.save(directory / "int8_codes.npy", self.codes)
+        return {"kind": self.kind}
+
+    def load(self, directory: Path, spec: Dict[str, Any]) -> None:
+        self.scale = np.asarray(np.load(directory / "int8_scale.npy"))
+        self.codes = np.asarray(np.load(directory / "int8_codes.npy", mmap_mode="r"))
+
+
+class PQQuantizer(Quantizer):
+    """Product quantization: ``subspaces`` uint8 codes per row, scored by
+    asymmetric distance (float query against per-subspace lookup tables)"""
+
+    kind = "pq"
+
+    def __init__(self, subspaces: int = 48, iterations: int = 10) -> None:
+        super().__init__()
+        self.subspaces = subspaces
+        self.iterations = iterations
+        self.centroids: Optional[np.ndarray] = None  # (subspaces, codebook, sub_dim)
+
+    @staticmethod
+    def _kmeans(sample: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+        centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=k)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            filled = counts > 0
+            sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+            centroids[filled] = sums / counts[filled, None]
+        return centroids
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        sub_dim = self.centroids.shape[2]
+        codes = np.empty((len(vectors), self.subspaces), dtype=np.uint8)
+        half_norms = 0.5 * (self.centroids ** 2).sum(axis=2)
+        for j in range(self.subspaces):
+            part = vectors[:, j * sub_dim:(j + 1) * sub_dim]
+            codes[:, j] = np.argmax(part @ self.centroids[j].T - half_norms[j], axis=1)
+        return codes
+
+    def build(self, matrix: np.ndarray, seed: int = 0) -> None:
+        dimension = matrix.shape[1]
+        # Subspaces must split the vector evenly; take the nearest divisor below the request
+        self.subspaces = max(m for m in range(1, min(self.subspaces, dimension) + 1) if dimension % m == 0)
+        sub_dim = dimension // self.subspaces
+        rng = np.random.default_rng(seed)
+        codebook = min(256, len(matrix))
+        sample = np.asarray(matrix[np.sort(rng.choice(len(matrix), min(len(matrix), 256 * 40), replace=False))])
+        self.centroids = np.stack([
+            self._kmeans(sample[:, j * sub_dim:(j + 1) * sub_dim], codebook, self.iterations, rng)
+            for j in range(self.subspaces)
+        ]).astype(np.float32)
+        self.codes = self._encode_all(matrix)
+
+    def scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        sub_dim = self.centroids.shape[2]
+        table = np.einsum("jd,jkd->jk", query.reshape(self.subspaces, sub_dim), self.centroids)
+        offsets = (np.arange(self.subspaces) * table.shape[1]).astype(np.int64)
+        flat = table.ravel()
+        count = len(self.codes) if rows is None else len(rows)
+        out = np.empty(count, dtype=np.float32)
+        for start in range(0, count, CHUNK_ROWS):
+            block = self.codes[start:start + CHUNK_ROWS] if rows is None else self.codes[rows[start:start + CHUNK_ROWS]]
+            out[start:start + len(block)] = flat[block + offsets].sum(axis=1)
+        return out
+
+    def save(self, directory: Path) -> Dict[str, Any]:
+        np.save(directory / "pq_centroids.npy", self.centroids)
+        np.save(directory / "pq_codes.npy", self.codes)
+        return {"kind": self.kind, "subspaces": self.subspaces}
+
+    def load(self, directory: Path, spec: Dict[str, Any]) -> None:
+        self.subspaces = int(spec["subspaces"])
+        self.centroids = np.asarray(np.load(directory / "pq_centroids.npy"))
+        self.codes = np.asarray(np.load(directory / "pq_codes.npy", mmap_mode="r"))
+
+
+class QuantizationConfig:
+    """Env-driven compression settings for the in-memory store"""
+
+    def __init__(self, kind: Optional[str] = None) -> None:
+        # "none" (default), "int8" (codes 4x smaller than float32) or "pq" (dimension / subspaces * 4x)
+        self.kind = (kind or os.getenv("MEMORY_QUANTIZATION", "none")).lower()
+        self.pq_subspaces = int(os.getenv("MEMORY_PQ_SUBSPACES", "48"))
+        # float32 re-rank depth as a multiple of top_k
+        self.rerank_depth = max(1, int(os.getenv("MEMORY_RERANK_DEPTH", "10")))
+        # With codes on, the float32 rows only re-rank shortlists, so a store
+        # that builds its matrix in process keeps it in a file mapped from
+        # here instead of private memory (keep it off tmpfs)
+        self.spill_dir = os.getenv("MEMORY_SPILL_DIR", "data/spill")
+
+    def allocate_matrix(self, shape: Tuple[int, int]) -> np.ndarray:
+        return file_backed_empty(shape, np.float32, self.spill_dir)
+
+    @property
+    def enabled(self) -> bool:
+        return self.kind in ("int8", "pq")
+
+    def _quantizer(self):
+        return PQQuantizer(self.pq_subspaces) if self.kind == "pq" else Int8Quantizer()
+
+    def build(self, matrix: np.ndarray) -> Quantizer:
+        start = time.perf_counter()
+        compressed = self._quantizer()
+        compressed.build(matrix)
+        logger.info(
+            f"Built {compressed.kind} codes for {len(matrix)} rows in {time.perf_counter() - start:.1f}s "
+            f"({compressed.nbytes / 2**20:.1f} MB resident vs {matrix.nbytes / 2**20:.1f} MB float32 kept file-backed)"
+        )
+        return compressed
+
+    def load(self, directory: Path, spec: Dict[str, Any]) -> Quantizer:
+        quantizer = PQQuantizer() if spec.get("kind") == "pq" else Int8Quantizer()
+        quantizer.load(directory, spec)
+        return quantizer
@@ -1,8 +1,21 @@
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Callable, Iterator, NamedTuple, Optional, Tuple
+import asyncio
+import contextvars
+import functools
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from embed_and_load import EmbeddingGenerator, VectorDatabase
+from cache import QueryEmbeddingCache, ResultCache
+from bm25_index import BM25Index
+from batching import MicroBatcher
+from item_graph import ItemGraph
+from filters import SearchFilter
+import metrics
 import re
 from rank_bm25 import BM25Okapi
 
@@ -10,28 +23,288 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class SearchOverloaded(RuntimeError):
+    """Raised by the async search path when the encode queue is full"""
+
+
+class SearchStores(NamedTuple):
+    """Everything a search reads from the catalog, swapped as one object"""
+    vector_db: Any
+    bm25_index: Optional[BM25Index]
+    item_graph: Optional[ItemGraph]
+
+
+# (searcher, stores) pinned for the request running in this context; copied
+# into asyncio tasks and to_thread calls, and explicitly into the hybrid pool
+_pinned_stores: contextvars.ContextVar[Optional[Tuple[Any, SearchStores]]] = contextvars.ContextVar(
+    "search_stores", default=None
+)
+
+
+def _pinned(method: Callable) -> Callable:
+    """Run a public search method on the stores current when it started"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._pin_stores():
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class ProductSearcher:
+    RESULT_FIELDS = ("title", "price", "url", "category")
+
     def __init__(self, vector_db = None, 
-                 embedding_generator: Optional[EmbeddingGenerator] = None):
-        self.vector_db = vector_db
+                 embedding_generator: Optional[EmbeddingGenerator] = None,
+                 query_cache: Optional[QueryEmbeddingCache] = None,
+                 result_cache: Optional[ResultCache] = None,
+                 bm25_index: Optional[BM25Index] = None,
+                 item_graph: Optional[ItemGraph] = None):
+        # Precomputed neighbors (item_graph.py) answer recommendations by lookup
+        self._stores = SearchStores(vector_db, self._usable_bm25(bm25_index), item_graph)
         self.embedding_generator = embedding_generator or EmbeddingGenerator("sentence-transformers/all-MiniLM-L6-v2")
+        self.query_cache = query_cache if query_cache is not None else QueryEmbeddingCache.from_env()
+        self.result_cache = result_cache if result_cache is not None else ResultCache.from_env()
+        self.alpha = 0.7
+        # "rerank": BM25 re-scores dense candidates; "hybrid": sparse and dense arms are fused
+        self.retrieval_mode = os.getenv("SEARCH_MODE", "rerank").lower()
+        self.fusion = os.getenv("HYBRID_FUSION", "rrf").lower()
+        self.dense_depth = int(os.getenv("HYBRID_DENSE_DEPTH", "20"))
+        self.sparse_depth = int(os.getenv("HYBRID_SPARSE_DEPTH", "20"))
+        self.rrf_k = int(os.getenv("HYBRID_RRF_K", "60"))
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Async path: model calls run on a small dedicated pool so they never
+        # block the event loop, and requests beyond the queue limit are shed
+        self.encode_workers = max(1, int(os.getenv("ENCODE_WORKERS", "2")))
+        self.encode_queue_limit = max(1, int(os.getenv("ENCODE_QUEUE_LIMIT", "64")))
+        self._encoder: Optional[ThreadPoolExecutor] = None
+        self._encode_pending = 0
+        self._encode_lock = threading.Lock()
+        # Concurrent async queries arriving within the window share one model
+        # call; a 0 ms window sends each query to the encode pool on its own
+        self.encode_batch_window_ms = float(os.getenv("ENCODE_BATCH_WINDOW_MS", "3"))
+        self.encode_batch_size = int(os.getenv("ENCODE_BATCH_SIZE", "32"))
+        self._batcher: Optional[MicroBatcher] = None
+
+    @staticmethod
+    def _usable_bm25(bm25_index: Optional[BM25Index]) -> Optional[BM25Index]:
+        return bm25_index if bm25_index is not None and len(bm25_index) else None
+
+    def swap_stores(self, vector_db, bm25_index: Optional[BM25Index],
+                    item_graph: Optional[ItemGraph] = None) -> None:
+        # One attribute assignment; in-flight searches pinned the previous
+        # holder and finish on a consistent store/BM25/graph triple
+        self._stores = SearchStores(vector_db, self._usable_bm25(bm25_index), item_graph)
+
+    @property
+    def stores(self) -> SearchStores:
+        pinned = _pinned_stores.get()
+        if pinned is not None and pinned[0] is self:
+            return pinned[1]
+        return self._stores
+
+    @contextmanager
+    def _pin_stores(self) -> Iterator[SearchStores]:
+        pinned = _pinned_stores.get()
+        if pinned is not None and pinned[0] is self:
+            yield pinned[1]
+            return
+        stores = self._stores
+        token = _pinned_stores.set((self, stores))
+        try:
+            yield stores
+        finally:
+            _pinned_stores.reset(token)
+
+    @property
+    def vector_db(self) -> Any:
+        return self.stores.vector_db
+
+    @property
+    def bm25_index(self) -> Optional[BM25Index]:
+        return self.stores.bm25_index
+
+    @property
+    def item_graph(self) -> Optional[ItemGraph]:
+        return self.stores.item_graph
+
+    @property
+    def _encode_executor(self) -> ThreadPoolExecutor:
+        if self._encoder is None:
+            self._encoder = ThreadPoolExecutor(max_workers=self.encode_workers, thread_name_prefix="encode")
+        return self._encoder
+
+    @property
+    def _encode_batcher(self) -> MicroBatcher:
+        if self._batcher is None:
+            self._batcher = MicroBatcher(
+                lambda texts: self.embedding_generator.generate_embeddings(texts, use_cache=False),
+                max_batch=self.encode_batch_size,
+                max_wait_ms=self.encode_batch_window_ms,
+                # Collected batches run on the encode pool, so ENCODE_WORKERS
+                # batches can be in the model at once
+                executor=self._encode_executor,
+                max_in_flight=self.encode_workers,
+            )
+        return self._batcher
+
+    @property
+    def _hybrid_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("HYBRID_WORKERS", "4")), thread_name_prefix="hybrid"
+            )
+        return self._executor
+
+    @property
+    def backend_name(self) -> str:
+        return getattr(self.vector_db, 'backend_name', type(self.vector_db).__name__)
+
+    @property
+    def _cache_namespace(self) -> str:
+        if self.retrieval_mode == "hybrid":
+            return f"{self.backend_name}:hybrid:{self.fusion}"
+        return self.backend_name
+
+    @property
+    def catalog_version(self) -> Any:
+        return getattr(self.vector_db, 'catalog_version', None)
+
+    def _cached_query_embedding(self, query: str) -> Optional[np.ndarray]:
+        cached = self.query_cache.get(self.embedding_generator.model_name, query)
+        metrics.CACHE_LOOKUPS.inc(cache="query", result="miss" if cached is None else "hit")
+        return cached
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        with metrics.stage("encode", self.backend_name):
+            cached = self._cached_query_embedding(query)
+            if cached is not None:
+                return cached
+            embedding = self.embedding_generator.generate_single_embedding(query)
+        self.query_cache.put(self.embedding_generator.model_name, query, embedding)
+        return embedding
+
+    async def _aembed_query(self, query: str) -> np.ndarray:
+        # Encode time includes waiting for the pool or the batch window
+        with metrics.stage("encode", self.backend_name):
+            return await self._aencode_query(query)
+
+    async def _aencode_query(self, query: str) -> np.ndarray:
+        model_name = self.embedding_generator.model_name
+        cached = self._cached_query_embedding(query)
+        if cached is not None:
+            return cached
+        with self._encode_lock:
+            if self._encode_pending >= self.encode_queue_limit:
+                metrics.SEARCH_REJECTED.inc(backend=self.backend_name)
+                raise SearchOverloaded(f"{self._encode_pending} queries already waiting for the encoder")
+            self._encode_pending += 1
+        try:
+            if self.encode_batch_window_ms > 0:
+                embedding = await asyncio.wrap_future(self._encode_batcher.submit(query))
+            else:
+                loop = asyncio.get_running_loop()
+                embedding = await loop.run_in_executor(
+                    self._encode_executor, self.embedding_generator.generate_single_embedding, query
+                )
+        finally:
+            with self._encode_lock:
+                self._encode_pending -= 1
+        self.query_cache.put(model_name, query, embedding)
+        return embedding
+
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        model_name = self.embedding_generator.model_name
+        cached = [self.query_cache.get(model_name, q) for q in queries]
+        missing = [i for i, emb in enumerate(cached) if emb is None]
+        if missing:
+            # Encode only the misses, still in a single model call
+            encoded = self.embedding_generator.generate_embeddings([queries[i] for i in missing], use_cache=False)
+            for i, emb in zip(missing, encoded):
+                self.query_cache.put(model_name, queries[i], emb)
+                cached[i] = emb
+        return np.stack(cached)
     
+    @_pinned
     def search_products(self, query: str, top_k: int = 5, 
-                       min_similarity: float = 0.0) -> List[Dict]:
+                       min_similarity: float = 0.0,
+                       search_filter: Optional[SearchFilter] = None,
+                       fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
         if not self.vector_db:
             raise ValueError("Vector database not initialized")
         
-        query_embedding = self.embedding_generator.generate_single_embedding(query)
-        results = self.vector_db.search(query_embedding, top_k=top_k)
-        filtered_results = [
-            result for result in results 
-            if result['similarity'] >= min_similarity
-        ]
+        query_embedding = self._embed_query(query)
+        results = self._store_search(query_embedding, top_k, search_filter, fields)
+        filtered_results = self._above_similarity(results, min_similarity)
         
         logger.info(f"Search completed. Found {len(filtered_results)} results for query: '{query}'")
         
         return filtered_results
 
+    def _above_similarity(self, results: List[Dict], min_similarity: float) -> List[Dict]:
+        kept = [result for result in results if result['similarity'] >= min_similarity]
+        metrics.FILTER_DROPPED.inc(len(results) - len(kept), backend=self.backend_name, reason="similarity")
+        return kept
+
+    def _store_kwargs(self, search_filter: Optional[SearchFilter],
+                      fields: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+        kwargs: Dict[str, Any] = {}
+        if search_filter is not None and not search_filter.is_empty:
+            kwargs['filter'] = search_filter
+        if fields is not None and getattr(self.vector_db, 'supports_projection', False):
+            kwargs['fields'] = fields
+        return kwargs
+
+    def _store_search(self, query_embedding: np.ndarray, top_k: int,
+                      search_filter: Optional[SearchFilter] = None,
+                      fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
+        with metrics.stage("retrieve", self.backend_name):
+            results = self.vector_db.search(query_embedding, top_k=top_k, **self._store_kwargs(search_filter, fields))
+        metrics.SEARCH_CANDIDATES.inc(len(results), backend=self.backend_name, arm="dense")
+        return results
+
+    async def _astore_search(self, query_embedding: np.ndarray, top_k: int,
+                             search_filter: Optional[SearchFilter] = None,
+                             fields: Optional[Tuple[str, ...]] = None) -> List[Dict]:
+        # Stores with native async I/O (pgvector) are awaited; in-process scans
+        # run on a worker thread
+        kwargs = self._store_kwargs(search_filter, fields)
+        with metrics.stage("retrieve", self.backend_name):
+            if hasattr(self.vector_db, 'asearch'):
+                results = await self.vector_db.asearch(query_embedding, top_k=top_k, **kwargs)
+            else:
+                results = await asyncio.to_thread(self.vector_db.search, query_embedding, top_k=top_k, **kwargs)
+        metrics.SEARCH_CANDIDATES.inc(len(results), backend=self.backend_name, arm="dense")
+        return results
+
+    @property
+    def _result_fields(self) -> Optional[Tuple[str, ...]]:
+        # Descriptions are only needed when BM25 has to re-tokenize candidates
+        return self.RESULT_FIELDS if self.bm25_index is not None else None
+
+    @_pinned
+    def search_batch(self, queries: List[str], top_k: int = 5,
+                     min_similarity: float = 0.0) -> List[List[Dict]]:
+        if not self.vector_db:
+            raise ValueError("Vector database not initialized")
+        if not queries:
+            return []
+
+        # One encode call for the whole batch, then one store round trip where supported
+        query_embeddings = self._embed_queries(list(queries))
+        if hasattr(self.vector_db, 'search_batch'):
+            batch_results = self.vector_db.search_batch(query_embeddings, top_k=top_k)
+        else:
+            batch_results = [self.vector_db.search(emb, top_k=top_k) for emb in query_embeddings]
+
+        filtered = [
+            [result for result in results if result['similarity'] >= min_similarity]
+            for results in batch_results
+        ]
+
+        logger.info(f"Batch search completed for {len(queries)} queries")
+
+        return filtered
+
     @staticmethod
     def _parse_price_constraints(query: str) -> Tuple[Optional[float], Optional[float]]:
         q = query.lower().replace(',', ' ')
@@ -51,52 +324,122 @@ class ProductSearcher:
             return (min(a, b), max(a, b))
         return (None, None)
 
-    def simple_search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
-        min_price, max_price = self._parse_price_constraints(query)
+    def _lexical_scores(self, query: str, raw_results: List[Dict]) -> List[float]:
+        with metrics.stage("lexical", self.backend_name):
+            return self._bm25_scores(query, raw_results)
 
-        raw_results = self.search_products(query, top_k=max(top_k * 10, 50))
+    def _bm25_scores(self, query: str, raw_results: List[Dict]) -> List[float]:
+        if self.bm25_index is not None:
+            return self.bm25_index.score(query, [r['id'] for r in raw_results]).tolist()
 
-        def price_ok(md: Dict[str, Any]) -> bool:
-            price = md.get('price')
-            if not isinstance(price, (int, float, np.floating)):
-                return False
-            if min_price is not None and price < min_price:
-                return False
-            if max_price is not None and price > max_price:
-                return False
-            return True
+        # No catalog index loaded: score against the candidates alone
+        tokenized_corpus = [
+            BM25Index.document_text(r['metadata']).lower().split() for r in raw_results
+        ]
+        if not tokenized_corpus:
+            return []
+        bm25 = BM25Okapi(tokenized_corpus)
+        return list(bm25.get_scores(query.lower().split()))
 
-        if min_price is not None or max_price is not None:
-            raw_results = [r for r in raw_results if price_ok(r['metadata'])]
+    @property
+    def _effective_mode(self) -> str:
+        return "hybrid" if self._use_hybrid else "rerank"
 
-        corpus = [
-            (i, (r['metadata'].get('title') or '') + ' ' + (r['metadata'].get('description') or ''))
-            for i, r in enumerate(raw_results)
-        ]
-        tokenized_corpus = [c.lower().split() for _, c in corpus]
-        bm25 = BM25Okapi(tokenized_corpus) if tokenized_corpus else None
-        bm25_scores = []
-        if bm25:
-            tokenized_query = query.lower().split()
-            bm25_scores = list(bm25.get_scores(tokenized_query))
+    def _cache_lookup(self, query: str, top_k: int,
+                      use_cache: bool = True) -> Tuple[Optional[Tuple[str, Any]], Optional[List[Dict[str, Any]]]]:
+        """Result-cache key of this request (None when caching is off) and its cached results, if any"""
+        if self.result_cache is None or not use_cache:
+            return None, None
+        # Read once, before searching, so results are filed under the catalog they came from
+        key = (self._cache_namespace, self.catalog_version)
+        cached = self.result_cache.get(query, top_k, *key)
+        metrics.CACHE_LOOKUPS.inc(cache="result", result="miss" if cached is None else "hit")
+        return key, cached
+
+    def _cache_store(self, key: Optional[Tuple[str, Any]], query: str, top_k: int,
+                     results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if key is not None:
+            self.result_cache.put(query, top_k, *key, results)
+        return results
+
+    @_pinned
+    def simple_search(self, query: str, top_k: int = 5, use_cache: bool = True) -> List[Dict[str, Any]]:
+        with metrics.SEARCH_REQUEST_SECONDS.time(backend=self.backend_name, mode=self._effective_mode):
+            key, cached = self._cache_lookup(query, top_k, use_cache)
+            if cached is not None:
+                return cached
+            return self._cache_store(key, query, top_k, self._simple_search(query, top_k))
+
+    async def asimple_search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """``simple_search`` for the event loop: encoding runs on the bounded
+        encode pool, store I/O is awaited, and CPU-bound fusion runs on a thread.
+        Raises ``SearchOverloaded`` when the encode queue is full."""
+        with self._pin_stores() as stores:
+            if not stores.vector_db:
+                raise ValueError("Vector database not initialized")
+
+            with metrics.SEARCH_REQUEST_SECONDS.time(backend=self.backend_name, mode=self._effective_mode):
+                return await self._asimple_search(query, top_k)
+
+    async def _asimple_search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        key, cached = self._cache_lookup(query, top_k)
+        if cached is not None:
+            return cached
+
+        search_filter = self._query_filter(query)
+        query_embedding = await self._aembed_query(query)
+        if self._use_hybrid:
+            dense_depth, sparse_depth = self._hybrid_depths(top_k, search_filter)
+            dense, sparse = await asyncio.gather(
+                self._astore_search(query_embedding, dense_depth, search_filter, self._result_fields),
+                asyncio.to_thread(self._sparse_arm, query, sparse_depth),
+            )
+            top = await asyncio.to_thread(
+                self._hybrid_search, query, top_k, search_filter, (query_embedding, dense, sparse)
+            )
         else:
-            bm25_scores = [0.0] * len(raw_results)
+            candidates = await self._astore_search(
+                query_embedding, self._rerank_depth(top_k), search_filter, self._result_fields
+            )
+            raw_results = self._above_similarity(candidates, 0.0)
+            top = await asyncio.to_thread(self._alpha_fuse, query, raw_results, top_k)
 
-        if len(bm25_scores) > 0:
-            bm_min, bm_max = float(min(bm25_scores)), float(max(bm25_scores))
-            denom = (bm_max - bm_min) or 1.0
-            bm25_norm = [(s - bm_min) / denom for s in bm25_scores]
+        return self._cache_store(key, query, top_k, self._format_results(top))
+
+    async def aclose(self) -> None:
+        # The batcher first: it hands batches to the encode pool
+        if self._batcher is not None:
+            self._batcher.close()
+            self._batcher = None
+        if self._encoder is not None:
+            self._encoder.shutdown(wait=False)
+            self._encoder = None
+        if hasattr(self.vector_db, 'aclose'):
+            await self.vector_db.aclose()
+
+    @property
+    def _use_hybrid(self) -> bool:
+        return self.retrieval_mode == "hybrid" and self.bm25_index is not None
+
+    def _query_filter(self, query: str) -> SearchFilter:
+        with metrics.stage("parse", self.backend_name):
+            min_price, max_price = self._parse_price_constraints(query)
+            search_filter = SearchFilter.create(min_price=min_price, max_price=max_price)
+        if not search_filter.is_empty:
+            metrics.FILTERED_QUERIES.inc(backend=self.backend_name)
+        return search_filter
+
+    def _simple_search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        search_filter = self._query_filter(query)
+
+        if self._use_hybrid:
+            top = self._hybrid_search(query, top_k, search_filter)
         else:
-            bm25_norm = [0.0] * len(raw_results)
+            top = self._rerank_search(query, top_k, search_filter)
+        return self._format_results(top)
 
-        alpha = 0.7
-        combined = [
-            (i, alpha * raw_results[i]['similarity'] + (1 - alpha) * bm25_norm[i])
-            for i in range(len(raw_results))
-        ]
-        combined.sort(key=lambda x: x[1], reverse=True)
-        top_indices = [i for i, _ in combined[:top_k]]
-        top = [raw_results[i] for i in top_indices]
+    @staticmethod
+    def _format_results(top: List[Dict]) -> List[Dict[str, Any]]:
         formatted: List[Dict[str, Any]] = []
         for r in top:
             md = r['metadata']
@@ -107,87 +450,210 @@ class ProductSearcher:
                 'url': md.get('url')
             })
         return formatted
+
+    def _alpha_fuse(self, query: str, results: List[Dict], top_k: int) -> List[Dict]:
+        bm25_scores = self._lexical_scores(query, results)
+        with metrics.stage("fuse", self.backend_name):
+            return self._alpha_combine(results, bm25_scores, top_k)
+
+    def _alpha_combine(self, results: List[Dict], bm25_scores: List[float], top_k: int) -> List[Dict]:
+        if len(bm25_scores) > 0:
+            bm_min, bm_max = float(min(bm25_scores)), float(max(bm25_scores))
+            denom = (bm_max - bm_min) or 1.0
+            bm25_norm = [(s - bm_min) / denom for s in bm25_scores]
+        else:
+            bm25_norm = [0.0] * len(results)
+
+        alpha = self.alpha
+        combined = [
+            (i, alpha * results[i]['similarity'] + (1 - alpha) * bm25_norm[i])
+            for i in range(len(results))
+        ]
+        combined.sort(key=lambda x: x[1], reverse=True)
+        return [results[i] for i, _ in combined[:top_k]]
+
+    @staticmethod
+    def _rerank_depth(top_k: int) -> int:
+        return max(top_k * 10, 50)
+
+    def _rerank_search(self, query: str, top_k: int, search_filter: SearchFilter) -> List[Dict]:
+        # Filters are applied inside the store, so the candidate pool is never short
+        raw_results = self.search_products(query, top_k=self._rerank_depth(top_k), search_filter=search_filter,
+                                           fields=self._result_fields)
+
+        return self._alpha_fuse(query, raw_results, top_k)
+
+    def _dense_arm(self, query: str, depth: int,
+                   search_filter: SearchFilter) -> Tuple[np.ndarray, List[Dict]]:
+        query_embedding = self._embed_query(query)
+        return query_embedding, self._store_search(query_embedding, depth, search_filter, self._result_fields)
+
+    def _sparse_arm(self, query: str, depth: int) -> List[Tuple[Any, float]]:
+        with metrics.stage("lexical", self.backend_name):
+            sparse = self.bm25_index.search(query, depth)
+        metrics.SEARCH_CANDIDATES.inc(len(sparse), backend=self.backend_name, arm="sparse")
+        return sparse
+
+    def _hybrid_depths(self, top_k: int, search_filter: SearchFilter) -> Tuple[int, int]:
+        dense_depth = max(self.dense_depth, top_k)
+        sparse_depth = max(self.sparse_depth, top_k)
+        if not search_filter.is_empty:
+            # The lexical index has no filter columns, so over-fetch that arm instead
+            sparse_depth *= 5
+        return dense_depth, sparse_depth
+
+    def _hybrid_search(self, query: str, top_k: int, search_filter: SearchFilter,
+                       arms: Optional[Tuple[np.ndarray, List[Dict], List[Tuple[Any, float]]]] = None) -> List[Dict]:
+        if not self.vector_db:
+            raise ValueError("Vector database not initialized")
+
+        if arms is not None:
+            # Candidates already generated by the async path
+            query_embedding, dense, sparse = arms
+        else:
+            dense_depth, sparse_depth = self._hybrid_depths(top_k, search_filter)
+            # Dense and sparse candidate generation run side by side
+            # Both arms run in copies of this context so they read the pinned stores
+            dense_future = self._hybrid_executor.submit(
+                contextvars.copy_context().run, self._dense_arm, query, dense_depth, search_filter
+            )
+            sparse_future = self._hybrid_executor.submit(
+                contextvars.copy_context().run, self._sparse_arm, query, sparse_depth
+            )
+            query_embedding, dense = dense_future.result()
+            sparse = sparse_future.result()
+
+        candidates: Dict[str, Dict] = {str(r['id']): r for r in dense}
+        missing = [id_val for id_val, _ in sparse if str(id_val) not in candidates]
+        if missing and hasattr(self.vector_db, 'get_by_ids'):
+            # Lexical-only hits have no dense score yet; hydrate them from the store
+            with_embeddings = self.fusion == "alpha"
+            query_unit = query_embedding / (np.linalg.norm(query_embedding) or 1.0)
+            with metrics.stage("retrieve", self.backend_name):
+                hydrated = self.vector_db.get_by_ids(missing, include_embeddings=with_embeddings)
+            metrics.SEARCH_CANDIDATES.inc(len(hydrated), backend=self.backend_name, arm="hydrated")
+            for r in hydrated:
+                emb = r.get('embedding')
+                similarity = 0.0
+                if emb is not None:
+                    similarity = float(np.dot(emb, query_unit) / (np.linalg.norm(emb) or 1.0))
+                candidates[str(r['id'])] = {'id': r['id'], 'metadata': r['metadata'], 'similarity': similarity}
+
+        if not search_filter.is_empty:
+            before = len(candidates)
+            candidates = {key: r for key, r in candidates.items() if search_filter.matches(r['metadata'])}
+            metrics.FILTER_DROPPED.inc(before - len(candidates), backend=self.backend_name, reason="price")
+
+        logger.info(f"Hybrid retrieval: {len(dense)} dense + {len(sparse)} sparse -> {len(candidates)} candidates")
+
+        if self.fusion == "alpha":
+            return self._alpha_fuse(query, list(candidates.values()), top_k)
+
+        with metrics.stage("fuse", self.backend_name):
+            return self._rrf_fuse(dense, sparse, candidates, top_k)
+
+    def _rrf_fuse(self, dense: List[Dict], sparse: List[Tuple[Any, float]],
+                  candidates: Dict[str, Dict], top_k: int) -> List[Dict]:
+        # Reciprocal-rank fusion over the two ranked lists
+        fused: Dict[str, float] = {}
+        for rank, r in enumerate(dense):
+            key = str(r['id'])
+            if key in candidates:
+                fused[key] = fused.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        for rank, (id_val, _) in enumerate(sparse):
+            key = str(id_val)
+            if key in candidates:
+                fused[key] = fused.get(key, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        ranked = sorted(fused.items(), key=lambda x: x[1], reverse=True)[:top_k]
+        return [candidates[key] for key, _ in ranked]
     
+    @_pinned
     def search_by_category(self, category: str, top_k: int = 5) -> List[Dict]:
         if not self.vector_db:
             raise ValueError("Vector database not initialized")
         
-        category_embedding = self.embedding_generator.generate_single_embedding(category)
-        # Get more results to filter by category
-        search_limit = 100 if hasattr(self.vector_db, 'embeddings') else top_k * 5
-        if hasattr(self.vector_db, 'embeddings'):
-            search_limit = len(self.vector_db.embeddings)
-        results = self.vector_db.search(category_embedding, top_k=search_limit)
-        category_results = [
-            result for result in results
-            if str(result['metadata'].get('category', '')).lower() == category.lower()
-        ][:top_k]
+        category_embedding = self._embed_query(category)
+        category_results = self._store_search(
+            category_embedding, top_k, SearchFilter.create(category=category)
+        )
         
         logger.info(f"Category search completed. Found {len(category_results)} results for category: '{category}'")
         
         return category_results
     
-    def search_by_price_range(self, min_price: float, max_price: float, 
-                             top_k: int = 5) -> List[Dict]:
+    @_pinned
+    def browse_by_price(self, min_price: Optional[float] = None, max_price: Optional[float] = None,
+                        limit: int = 20, offset: int = 0, descending: bool = False,
+                        after: Optional[Tuple[float, Any]] = None,
+                        with_total: bool = True) -> Tuple[List[Dict], Optional[int]]:
+        """One price-ordered page of products within the range and the total
+        number of matches (None when the store cannot count them or
+        ``with_total`` is off). ``after`` is the (price, id) of the previous
+        page's last product; pages continue right past it."""
         if not self.vector_db:
             raise ValueError("Vector database not initialized")
-        
-        # For in-memory database, use direct metadata access
-        if hasattr(self.vector_db, 'metadata'):
-            price_filtered = [
-                (i, metadata) for i, metadata in enumerate(self.vector_db.metadata)
-                if isinstance(metadata.get('price'), (int, float)) and min_price <= metadata['price'] <= max_price
-            ]
-            
-            if not price_filtered:
-                return []
-            
-            price_filtered.sort(key=lambda x: x[1]['price'])
-            
-            results = []
-            for i, metadata in price_filtered[:top_k]:
-                results.append({
-                    'id': self.vector_db.ids[i],
-                    'metadata': metadata,
-                    'similarity': 1.0
-                })
+
+        if hasattr(self.vector_db, 'browse_by_price'):
+            # Memory (sorted price index) and pgvector (btree range scan) return complete pages
+            page, total = self.vector_db.browse_by_price(
+                min_price, max_price, limit, offset, descending, after=after, with_total=with_total
+            )
         else:
-            # For external databases (Pinecone, pgvector), do a general search and filter
-            # This is less efficient but works with any vector store
-            general_query = f"products between ${min_price} and ${max_price}"
-            query_embedding = self.embedding_generator.generate_single_embedding(general_query)
-            all_results = self.vector_db.search(query_embedding, top_k=100)
-            
-            results = [
-                result for result in all_results
-                if isinstance(result['metadata'].get('price'), (int, float)) 
-                and min_price <= result['metadata']['price'] <= max_price
-            ][:top_k]
-        
+            # Stores without range scans (Pinecone) can only filter a vector
+            # search, so pages are drawn from its top results
+            if after is not None:
+                if descending:
+                    max_price = after[0] if max_price is None else min(max_price, after[0])
+                else:
+                    min_price = after[0] if min_price is None else max(min_price, after[0])
+            general_query = f"products priced from ${min_price or 0}" + (f" to ${max_price}" if max_price is not None else "")
+            query_embedding = self._embed_query(general_query)
+            found = self._store_search(
+                query_embedding, offset + limit, SearchFilter.create(min_price=min_price, max_price=max_price)
+            )
+            # Unpriced products have no place in a price order
+            priced = [(float(r['metadata']['price']), str(r['id']), r) for r in found
+                      if isinstance(r['metadata'].get('price'), (int, float))]
+            if after is not None:
+                cursor = (float(after[0]), str(after[1]))
+                priced = [p for p in priced if (p[:2] < cursor if descending else p[:2] > cursor)]
+            priced.sort(key=lambda p: p[:2], reverse=descending)
+            page, total = [p[2] for p in priced[offset:offset + limit]], None
+        results = [{**r, 'similarity': 1.0} for r in page]
+
         logger.info(f"Price range search completed. Found {len(results)} results for price range: ${min_price}-${max_price}")
-        
-        return results
+
+        return results, total
+
+    def search_by_price_range(self, min_price: float, max_price: float, 
+                             top_k: int = 5, offset: int = 0) -> List[Dict]:
+        return self.browse_by_price(min_price, max_price, limit=top_k, offset=offset)[0]
     
+    @_pinned
     def get_recommendations(self, product_id: int, top_k: int = 5) -> List[Dict]:
         if not self.vector_db:
             raise ValueError("Vector database not initialized")
         
-        # For in-memory database, use direct access
-        if hasattr(self.vector_db, 'ids') and hasattr(self.vector_db, 'embeddings'):
-            try:
-                product_idx = self.vector_db.ids.index(product_id)
-            except ValueError:
-                logger.error(f"Product with ID {product_id} not found")
-                return []
-            
-            product_embedding = self.vector_db.embeddings[product_idx]
-            all_results = self.vector_db.search(product_embedding, top_k=len(self.vector_db.embeddings))
-        else:
-            # For external databases, search for similar products using a generic query
-            # This is less ideal but works as a fallback
-            similarity_query = f"product similar to ID {product_id}"
-            query_embedding = self.embedding_generator.generate_single_embedding(similarity_query)
-            all_results = self.vector_db.search(query_embedding, top_k=top_k + 10)
+        if self.item_graph is not None:
+            neighbors = self.item_graph.similar(product_id, top_k)
+            if neighbors is not None:
+                scores = {str(id_val): score for id_val, score in neighbors}
+                # Products deleted since the graph was built are skipped by the lookup
+                recommendations = [
+                    {'id': r['id'], 'metadata': r['metadata'], 'similarity': scores[str(r['id'])]}
+                    for r in self.vector_db.get_by_ids([id_val for id_val, _ in neighbors])
+                ]
+                logger.info(f"Served {len(recommendations)} recommendations for product {product_id} from the item graph")
+                return recommendations
+
+        # Every store resolves ids directly, so the product's own vector seeds the search
+        rows = self.vector_db.get_by_ids([product_id], include_embeddings=True)
+        if not rows:
+            logger.error(f"Product with ID {product_id} not found")
+            return []
+        
+        # One extra result covers the product itself
+        all_results = self._store_search(rows[0]['embedding'], top_k + 1)
         
         recommendations = [
             result for result in all_results
@@ -237,25 +703,8 @@ class SearchAPI:
         if not self.searcher.vector_db:
             return None
         
-        # For in-memory database, use direct access
-        if hasattr(self.searcher.vector_db, 'ids') and hasattr(self.searcher.vector_db, 'metadata'):
-            try:
-                product_idx = self.searcher.vector_db.ids.index(product_id)
-                return self.searcher.vector_db.metadata[product_idx]
-            except ValueError:
-                return None
-        else:
-            # For external databases, search for the specific product
-            # This is less efficient but works as a fallback
-            product_query = f"product ID {product_id}"
-            query_embedding = self.searcher.embedding_generator.generate_single_embedding(product_query)
-            results = self.searcher.vector_db.search(query_embedding, top_k=10)
-            
-            # Look for exact product ID match
-            for result in results:
-                if str(result['id']) == str(product_id):
-                    return result['metadata']
-            return None
+        rows = self.searcher.vector_db.get_by_ids([product_id])
+        return rows[0]['metadata'] if rows else None
 
 
 def main():
@@ -272,8 +721,11 @@ def main():
         vector_db = embedder.embed_products(clean_df)
     else:
         vector_db = embedder.vector_db
+        embedder.load_bm25_index()
 
-    searcher = ProductSearcher(vector_db)
+    searcher = ProductSearcher(
+        vector_db, embedding_generator=embedder.embedding_generator, bm25_index=embedder.bm25_index
+    )
 
     query = " ".join(sys.argv[1:]).strip()
     if not query:
@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = "product-snapshot"
+SNAPSHOT_VERSION = 1
+
+# Generations kept on disk after a save: the current one plus the previous one
+KEEP_GENERATIONS = max(2, int(os.getenv("SNAPSHOT_KEEP_GENERATIONS", "2")))
+
+_MISSING = object()
+
+
+def id_hash(id_val: Any) -> int:
+    return int.from_bytes(hashlib.blake2b(str(id_val).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _column_kind(values: Sequence[Any]) -> str:
+    present = [v for v in values if v is not _MISSING and v is not None]
+    if present and all(isinstance(v, (int, np.integer)) and not isinstance(v, (bool, np.bool_)) for v in present):
+        return "int64" if len(present) == len(values) else "json"
+    if present and all(isinstance(v, (int, float, np.integer, np.floating)) and not isinstance(v, (bool, np.bool_))
+                       for v in present):
+        return "float64" if len(present) == len(values) else "json"
+    if all(isinstance(v, str) for v in present):
+        return "str"
+    return "json"
+
+
+def _write_column(directory: Path, stem: str, name: str, values: Sequence[Any]) -> Dict[str, Any]:
+    kind = _column_kind(values)
+    missing = np.fromiter((v is _MISSING for v in values), dtype=bool, count=len(values))
+    spec: Dict[str, Any] = {"name": name, "kind": kind, "file": stem, "sparse": bool(missing.any())}
+    if spec["sparse"]:
+        np.save(directory / f"{stem}.missing.npy", missing)
+
+    if kind in ("int64", "float64"):
+        np.save(directory / f"{stem}.npy", np.array(values, dtype=kind))
+        return spec
+
+    # Variable-width values live in one UTF-8 heap addressed by an offsets array
+    if kind == "str":
+        nulls = np.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        if nulls.any():
+            np.save(directory / f"{stem}.null.npy", nulls)
+        spec["nullable"] = bool(nulls.any())
+        encoded = [v.encode("utf-8") if isinstance(v, str) else b"" for v in values]
+    else:
+        encoded = [b"" if v is _MISSING else json.dumps(v, default=str).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(directory / f"{stem}.offsets.npy", offsets)
+    with open(directory / f"{stem}.heap", "wb") as f:
+        for b in encoded:
+            f.write(b)
+    return spec
+
+
+class Column(Sequence):
+    """Read-only view over one snapshot column; values are decoded on access"""
+
+    def __init__(self, directory: Path, spec: Dict[str, Any], size: int) -> None:
+        self.name = spec["name"]
+        self.kind = spec["kind"]
+        self._size = size
+        stem = directory / spec["file"]
+        self._missing = np.load(f"{stem}.missing.npy", mmap_mode="r") if spec.get("sparse") else None
+        self._nulls = np.load(f"{stem}.null.npy", mmap_mode="r") if spec.get("nullable") else None
+        if self.kind in ("int64", "float64"):
+            self._values = np.load(f"{stem}.npy", mmap_mode="r")
+        else:
+            self._offsets = np.load(f"{stem}.offsets.npy", mmap_mode="r")
+            heap_path = f"{stem}.heap"
+            # np.memmap refuses empty files; an all-empty column needs no heap
+            self._heap = np.memmap(heap_path, dtype=np.uint8, mode="r") if os.path.getsize(heap_path) else b""
+
+    def __len__(self) -> int:
+        return self._size
+
+    def is_missing(self, row: int) -> bool:
+        return self._missing is not None and bool(self._missing[row])
+
+    def __getitem__(self, row: Any) -> Any:
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(self._size))]
+        row = int(row)
+        if row < 0:
+            row += self._size
+        if not 0 <= row < self._size:
+            raise IndexError("snapshot column index out of range")
+        if self.kind in ("int64", "float64"):
+            return self._values[row].item()
+        if self._nulls is not None and self._nulls[row]:
+            return None
+        raw = bytes(self._heap[self._offsets[row]:self._offsets[row + 1]])
+        if self.kind == "str":
+            return raw.decode("utf-8")
+        return json.loads(raw) if raw else None
+
+    def __iter__(self) -> Iterator[Any]:
+        for row in range(self._size):
+            yield self[row]
+
+    def index(self, value: Any, start: int = 0, stop: Optional[int] = None) -> int:
+        for row in range(start, self._size if stop is None else min(stop, self._size)):
+            if self[row] == value:
+                return row
+        raise ValueError(f"{value!r} is not in snapshot column {self.name!r}")
+
+
+class ColumnarMetadata(Sequence):
+    """Per-row metadata dicts assembled on demand from snapshot columns"""
+
+    def __init__(self, columns: List[Column], size: int) -> None:
+        self.columns = columns
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, row: Any) -> Any:
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(self._size))]
+        row = int(row)
+        return {c.name: c[row] for c in self.columns if not c.is_missing(row)}
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for row in range(self._size):
+            yield self[row]
+
+
+class IdIndex:
+    """id -> row lookup over a sorted hash array, without building a dict"""
+
+    def __init__(self, hashes: np.ndarray, rows: np.ndarray, ids: Column) -> None:
+        self._hashes = hashes
+        self._rows = rows
+        self._ids = ids
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        h = np.uint64(id_hash(key))
+        start = int(np.searchsorted(self._hashes, h, side="left"))
+        end = int(np.searchsorted(self._hashes, h, side="right"))
+        for row in self._rows[start:end]:
+            if str(self._ids[row]) == str(key):
+                return int(row)
+        return default
+
+    def __contains__(self, key: Any) -> bool:
+        return self.get(key) is not None
+
+
+class Snapshot:
+    def __init__(self, path: Path, manifest: Dict[str, Any]) -> None:
+        self.path = path
+        self.manifest = manifest
+        self.size = int(manifest["count"])
+        self.dimension = int(manifest["dimension"])
+        self.embeddings = np.asarray(np.load(path / "embeddings.npy", mmap_mode="r"))
+        self.prices = np.asarray(np.load(path / "prices.npy", mmap_mode="r"))
+        self.ids = Column(path, manifest["ids"], self.size)
+        self.metadata = ColumnarMetadata([Column(path, spec, self.size) for spec in manifest["columns"]], self.size)
+        self.id_index = IdIndex(
+            np.load(path / "id_hash.npy", mmap_mode="r"), np.load(path / "id_rows.npy", mmap_mode="r"), self.ids
+        )
+        category_rows = np.load(path / "category_rows.npy", mmap_mode="r")
+        category_offsets = manifest["category_offsets"]
+        self.category_rows = {
+            name: category_rows[category_offsets[i]:category_offsets[i + 1]]
+            for i, name in enumerate(manifest["categories"])
+        }
+        # Generations written before the price index existed rebuild it on demand
+        self.price_order: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        if (path / "price_order.npy").is_file():
+            self.price_order = (
+                np.asarray(np.load(path / "price_order.npy", mmap_mode="r")),
+                np.asarray(np.load(path / "price_sorted.npy", mmap_mode="r")),
+            )
+
+
+def is_snapshot(path: str) -> bool:
+    return (Path(path) / "CURRENT").is_file()
+
+
+def write_snapshot(
+    path: str,
+    embeddings: np.ndarray,
+    prices: np.ndarray,
+    ids: Sequence[Any],
+    metadata: Sequence[Dict[str, Any]],
+    category_rows: Dict[str, np.ndarray],
+    indexes: Optional[Dict[str, Any]] = None,
+    catalog_version: Any = None,
+) -> Path:
+    """Write a new snapshot generation under ``path`` and atomically make it current.
+
+    Each generation is a directory of ``.npy`` arrays and string heaps; the
+    ``CURRENT`` pointer is swapped with ``os.replace`` so readers that already
+    mapped the previous generation keep a consistent view. Optional side
+    indexes are saved into the generation under their manifest key.
+    """
+    root = Path(path)
+    root.mkdir(parents=True, exist_ok=True)
+    previous = current_generation(root)
+    generation = f"v{int(previous[1:]) + 1 if previous else 1}"
+    target = root / generation
+    if target.exists():
+        shutil.rmtree(target)
+    target.mkdir()
+
+    size = len(ids)
+    np.save(target / "embeddings.npy", np.ascontiguousarray(embeddings, dtype=np.float32))
+    np.save(target / "prices.npy", np.ascontiguousarray(prices, dtype=np.float64))
+
+    ids_spec = _write_column(target, "ids", "id", list(ids))
+    names: List[str] = []
+    for md in metadata:
+        for name in md:
+            if name not in names:
+                names.append(name)
+    columns = [
+        _write_column(target, f"col_{i}", name, [md.get(name, _MISSING) for md in metadata])
+        for i, name in enumerate(names)
+    ]
+
+    hashes = np.fromiter((id_hash(i) for i in ids), dtype=np.uint64, count=size)
+    order = np.argsort(hashes, kind="stable")
+    np.save(target / "id_hash.npy", hashes[order])
+    np.save(target / "id_rows.npy", order.astype(np.int64))
+
+    categories = sorted(category_rows)
+    parts = [np.asarray(category_rows[c], dtype=np.int64) for c in categories]
+    np.save(target / "category_rows.npy", np.concatenate(parts) if parts else np.empty(0, dtype=np.int64))
+    category_offsets = np.concatenate([[0], np.cumsum([len(p) for p in parts])]).astype(int).tolist()
+
+    # Priced rows in price order; NaN (unpriced) sorts last and is cut off
+    prices = np.asarray(prices, dtype=np.float64)
+    price_order = np.argsort(prices, kind="stable")[:int(np.count_nonzero(~np.isnan(prices)))]
+    np.save(target / "price_order.npy", price_order.astype(np.int64))
+    np.save(target / "price_sorted.npy", prices[price_order])
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "count": size,
+        "dimension": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        "ids": ids_spec,
+        "columns": columns,
+        "categories": categories,
+        "category_offsets": category_offsets,
+        "catalog_version": catalog_version if isinstance(catalog_version, str) else None,
+    }
+    # Side indexes (ANN, compressed codes) write their own files and describe them
+    for name, index in (indexes or {}).items():
+        if index is not None:
+            manifest[name] = index.save(target)
+    with open(target / "manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    pointer = root / "CURRENT.tmp"
+    pointer.write_text(generation, encoding="utf-8")
+    os.replace(pointer, root / "CURRENT")
+
+    prune_generations(root, generation)
+    return target
+
+
+def current_generation(root: Path) -> Optional[str]:
+    pointer = root / "CURRENT"
+    if not pointer.is_file():
+        return None
+    return pointer.read_text(encoding="utf-8").strip() or None
+
+
+def prune_generations(root: Path, current: str, keep: int = KEEP_GENERATIONS) -> None:
+    """Remove generation directories older than the newest ``keep`` (current included).
+
+    The previous generation stays on disk so a reader that read ``CURRENT``
+    just before the swap can still open its files; processes already mapping
+    a pruned generation keep their pages.
+    """
+    newest = int(current[1:])
+    for entry in root.iterdir():
+        if not entry.is_dir() or not entry.name.startswith("v") or not entry.name[1:].isdigit():
+            continue
+        if int(entry.name[1:]) <= newest - max(keep, 1):
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def read_snapshot(path: str) -> Snapshot:
+    root = Path(path)
+    for attempt in range(3):
+        generation = current_generation(root)
+        if generation is None:
+            raise FileNotFoundError(f"No snapshot at {path}")
+        target = root / generation
+        try:
+            with open(target / "manifest.json", "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("version") != SNAPSHOT_VERSION:
+                raise ValueError(
+                    f"Unsupported snapshot {manifest.get('format')!r} v{manifest.get('version')} at {target}"
+                )
+            return Snapshot(target, manifest)
+        except FileNotFoundError:
+            # Pruned by writers between reading CURRENT and opening the files; follow the new pointer
+            if attempt == 2 or current_generation(root) == generation:
+                raise
+    raise FileNotFoundError(f"No snapshot at {path}")
@@ -30,7 +30,7 @@ def get_default_config() -> Dict[str, Any]:
     return {
         "embedding_model": "sentence-transformers/all-MiniLM-L6-v2",
         "data_dir": "data",
-        "embeddings_file": "data/product_embeddings.pkl",
+        "embeddings_file": "data/product_embeddings.snapshot",
         "max_search_results": 10,
         "min_similarity_threshold": 0.3,
         "logging_level": "INFO"
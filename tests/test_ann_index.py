@@ -0,0 +1,70 @@
+import numpy as np
+
+from ann_index import IVFIndex
+from embed_and_load import VectorDatabase
+
+
+def _clustered(rows, dimension=32, clusters=40, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(clusters, size=rows)
+    vectors = centers[labels] + 0.4 * rng.standard_normal((rows, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _ivf_store(matrix, monkeypatch):
+    monkeypatch.setenv("MEMORY_INDEX", "ivf")
+    monkeypatch.setenv("MEMORY_INDEX_MIN_ROWS", "100")
+    db = VectorDatabase()
+    ids = list(range(len(matrix)))
+    db.add_embeddings(matrix, [{"title": str(i)} for i in ids], ids)
+    db.build_indexes()
+    return db
+
+
+def test_ivf_recall_at_10(monkeypatch):
+    db = _ivf_store(_clustered(4000), monkeypatch)
+    assert isinstance(db._ann, IVFIndex)
+    assert db.recall(_clustered(100, seed=1), top_k=10) >= 0.9
+
+
+def test_ivf_recall_holds_through_appends(monkeypatch):
+    matrix = _clustered(6000)
+    db = _ivf_store(matrix[:2000], monkeypatch)
+    for start in range(2000, 6000, 250):
+        ids = list(range(start, start + 250))
+        db.add_embeddings(matrix[start:start + 250], [{"title": str(i)} for i in ids], ids)
+    assert db.count() == 6000
+    assert len(db._ann.assignments) == 6000
+    assert db.recall(_clustered(100, seed=1), top_k=10) >= 0.9
+
+
+def test_appends_grow_assignments_amortized():
+    matrix = _clustered(5000)
+    index = IVFIndex(lists=16, probes=4)
+    index.build(matrix[:100])
+    reallocations, buffer = 0, None
+    for start in range(100, 5000, 100):
+        index.add(matrix[start:start + 100], start)
+        if index._buffer is not buffer:
+            reallocations += 1
+            buffer = index._buffer
+    # 1024 -> 2048 -> 4096 -> 8192
+    assert reallocations == 4
+    np.testing.assert_array_equal(index.assignments, index._assign(matrix))
+
+
+def test_candidates_include_unsorted_tail():
+    matrix = _clustered(2000)
+    index = IVFIndex(lists=16, probes=16)
+    index.build(matrix[:1000])
+    index.candidates_batch(matrix[:1], 10)
+    index.add(matrix[1000:1100], 1000)
+    # The tail is below TAIL_RATIO, so the sorted lists are not rebuilt
+    candidates = index.candidates_batch(matrix[:1], 10)[0]
+    assert index._sorted_rows == 1000
+    assert sorted(candidates.tolist()) == list(range(1100))
+    index.add(matrix[1100:2000], 1100)
+    candidates = index.candidates_batch(matrix[:1], 10)[0]
+    assert index._sorted_rows == 2000
+    assert sorted(candidates.tolist()) == list(range(2000))
@@ -0,0 +1,66 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from batching import MicroBatcher
+
+
+def _encode(texts):
+    return np.array([[float(len(text)), float(text.count("a"))] for text in texts], dtype=np.float32)
+
+
+def test_rows_match_their_texts_and_duplicates_encode_once():
+    calls = []
+    batcher = MicroBatcher(lambda texts: calls.append(list(texts)) or _encode(texts), max_wait_ms=50)
+    texts = ["a", "bb", "a", "cccc"]
+    futures = [batcher.submit(text) for text in texts]
+    for text, future in zip(texts, futures):
+        np.testing.assert_array_equal(future.result(timeout=5), _encode([text])[0])
+    assert sum(len(batch) for batch in calls) == 3
+    batcher.close()
+
+
+def test_batches_encode_concurrently_on_the_executor():
+    started = threading.Barrier(3, timeout=5)
+    threads = set()
+
+    def encode(texts):
+        threads.add(threading.current_thread().name)
+        # Both workers have to be inside the model at the same time to pass
+        started.wait()
+        return _encode(texts)
+
+    executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="encode")
+    batcher = MicroBatcher(encode, max_batch=1, max_wait_ms=0, executor=executor, max_in_flight=2)
+    futures = [batcher.submit(text) for text in ("first", "second")]
+    started.wait()
+    assert [f.result(timeout=5)[0] for f in futures] == [5.0, 6.0]
+    assert all(name.startswith("encode") for name in threads) and len(threads) == 2
+    batcher.close()
+    executor.shutdown()
+
+
+def test_busy_pool_grows_the_next_batch():
+    release = threading.Event()
+    sizes = []
+
+    def encode(texts):
+        sizes.append(len(texts))
+        if len(sizes) == 1:
+            release.wait(timeout=5)
+        return _encode(texts)
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    batcher = MicroBatcher(encode, max_batch=32, max_wait_ms=0, executor=executor, max_in_flight=1)
+    first = batcher.submit("first")
+    while not sizes:
+        threading.Event().wait(0.001)
+    # Queued while the only worker is busy, then encoded together
+    rest = [batcher.submit(f"query {i}") for i in range(5)]
+    release.set()
+    first.result(timeout=5)
+    assert [f.result(timeout=5)[0] for f in rest] == [7.0] * 5
+    assert sizes == [1, 5]
+    batcher.close()
+    executor.shutdown()
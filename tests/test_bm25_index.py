@@ -0,0 +1,109 @@
+import math
+
+import numpy as np
+
+from bm25_index import BM25Index
+
+IDS = ["a", "b", "c", "d"]
+TEXTS = [
+    "red linen dress",
+    "blue denim jacket",
+    "red wool scarf red",
+    "linen shirt",
+]
+
+
+def _reference_score(query, texts, doc, k1=1.5, b=0.75):
+    docs = [t.lower().split() for t in texts]
+    avgdl = sum(len(d) for d in docs) / len(docs)
+    score = 0.0
+    for term in query.lower().split():
+        df = sum(1 for d in docs if term in d)
+        if not df:
+            continue
+        idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+        tf = docs[doc].count(term)
+        score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * len(docs[doc]) / avgdl))
+    return score
+
+
+def test_scores_match_reference_formula():
+    index = BM25Index.build(IDS, TEXTS)
+    scores = index.score("red linen", IDS)
+    expected = [_reference_score("red linen", TEXTS, i) for i in range(len(IDS))]
+    np.testing.assert_allclose(scores, expected, rtol=1e-5)
+
+
+def test_search_ranks_matches_and_skips_non_matches():
+    index = BM25Index.build(IDS, TEXTS)
+    results = index.search("red", top_k=10)
+    assert [id_val for id_val, _ in results] == ["c", "a"]
+    assert results[0][1] > results[1][1] > 0
+    assert index.search("unknown words", top_k=10) == []
+
+
+def test_chunked_build_equals_single_build():
+    whole = BM25Index.build(IDS, TEXTS)
+    chunked = BM25Index()
+    for start in range(0, len(IDS), 3):
+        chunked.add_documents(IDS[start:start + 3], TEXTS[start:start + 3])
+    np.testing.assert_allclose(chunked.score("red linen shirt", IDS), whole.score("red linen shirt", IDS))
+    assert chunked.search("linen", 10) == whole.search("linen", 10)
+
+
+def test_remove_and_readd_keep_statistics_exact():
+    index = BM25Index.build(IDS, TEXTS)
+    index.remove_documents(["a"])
+    assert len(index) == 3
+    assert [id_val for id_val, _ in index.search("linen", 10)] == ["d"]
+    assert index.score("red", ["a"])[0] == 0.0
+
+    rebuilt = BM25Index.build(IDS[1:], TEXTS[1:])
+    np.testing.assert_allclose(index.score("red linen", IDS[1:]), rebuilt.score("red linen", IDS[1:]), rtol=1e-6)
+
+    # Re-adding an id replaces its text
+    index.add_documents(["b"], ["red denim jacket"])
+    assert len(index) == 3
+    assert "b" in [id_val for id_val, _ in index.search("red", 10)]
+
+
+def test_save_load_round_trip(tmp_path):
+    index = BM25Index.build(IDS, TEXTS)
+    path = tmp_path / "bm25.pkl"
+    index.save(str(path))
+    loaded = BM25Index.load(str(path))
+    assert loaded.search("red linen", 10) == index.search("red linen", 10)
+    # A loaded index keeps accepting documents
+    loaded.add_documents(["e"], ["red linen trousers"])
+    assert len(loaded) == 5
+    assert "e" in [id_val for id_val, _ in loaded.search("trousers", 10)]
+
+
+def test_repeated_id_in_one_batch_keeps_last_text():
+    index = BM25Index.build(["a", "b", "a"], ["red dress", "blue jacket", "green scarf"])
+    assert len(index) == 2
+    assert index.search("red", 10) == []
+    assert [id_val for id_val, _ in index.search("green", 10)] == ["a"]
+    rebuilt = BM25Index.build(["b", "a"], ["blue jacket", "green scarf"])
+    np.testing.assert_allclose(index.score("green jacket", ["a", "b"]), rebuilt.score("green jacket", ["a", "b"]))
+
+
+def test_compaction_drops_tombstones_and_matches_fresh_build():
+    index = BM25Index.build(IDS, TEXTS)
+    for round_ in range(10):
+        # Delta syncs that keep replacing the same products
+        index.add_documents(["a", "c"], [f"red linen dress v{round_}", f"red wool scarf v{round_}"])
+    assert len(index.ids) <= len(IDS) / (1 - BM25Index.COMPACT_RATIO) + 2
+    assert len(index._doc_len) == len(index.ids) == len(index._alive)
+
+    texts = ["red linen dress v9", TEXTS[1], "red wool scarf v9", TEXTS[3]]
+    rebuilt = BM25Index.build(IDS, texts)
+    index.compact()
+    assert index.ids == ["b", "d", "a", "c"]
+    assert index._total_len == rebuilt._total_len
+    np.testing.assert_allclose(index.score("red linen v9", IDS), rebuilt.score("red linen v9", IDS), rtol=1e-6)
+    assert sorted(index.search("red", 10)) == sorted(rebuilt.search("red", 10))
+
+    index.remove_documents(["a", "b"])
+    assert index.ids == ["d", "c"]
+    assert [id_val for id_val, _ in index.search("linen", 10)] == ["d"]
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from embed_and_load import VectorDatabase
+
+PRICES = [30.0, 10.0, None, 20.0, 10.0, 50.0, 40.0]
+
+
+@pytest.fixture
+def store():
+    db = VectorDatabase()
+    ids = list(range(len(PRICES)))
+    metadata = [{"title": f"item {i}", "category": "c"} if p is None else {"title": f"item {i}", "category": "c", "price": p}
+                for i, p in enumerate(PRICES)]
+    db.upsert_embeddings(np.random.default_rng(0).random((len(ids), 4)).astype(np.float32), metadata, ids)
+    return db
+
+
+def _browse(db, *args, **kwargs):
+    page, total = db.browse_by_price(*args, **kwargs)
+    return [r["id"] for r in page], total
+
+
+def test_pages_in_price_order(store):
+    # Ties keep insertion order; unpriced products are never listed
+    assert _browse(store, limit=3) == ([1, 4, 3], 6)
+    assert _browse(store, limit=3, offset=3) == ([0, 6, 5], 6)
+    assert _browse(store, limit=3, offset=6) == ([], 6)
+
+
+def test_range_is_inclusive(store):
+    assert _browse(store, 10, 30, limit=10) == ([1, 4, 3, 0], 4)
+    assert _browse(store, min_price=40, limit=10) == ([6, 5], 2)
+    assert _browse(store, max_price=5, limit=10) == ([], 0)
+
+
+def test_descending_pages(store):
+    assert _browse(store, 10, 40, limit=2, descending=True) == ([6, 0], 5)
+    assert _browse(store, 10, 40, limit=2, offset=2, descending=True) == ([3, 4], 5)
+    assert _browse(store, 10, 40, limit=2, offset=4, descending=True) == ([1], 5)
+
+
+def test_writes_update_the_price_index(store):
+    store.upsert_embeddings(np.ones((1, 4), dtype=np.float32), [{"title": "now cheap", "price": 1.0}], [5])
+    store.delete_ids([1])
+    assert _browse(store, limit=3) == ([5, 4, 3], 5)
+
+
+def test_mapped_snapshot_pages_the_same(store, tmp_path):
+    store.save(str(tmp_path / "snapshot"))
+    mapped = VectorDatabase()
+    mapped.load(str(tmp_path / "snapshot"))
+    assert mapped.is_mapped
+    for kwargs in ({"limit": 4}, {"min_price": 20, "limit": 10}, {"limit": 2, "offset": 1, "descending": True}):
+        assert _browse(mapped, **kwargs) == _browse(store, **kwargs)
+
+
+def _walk(db, limit, **kwargs):
+    ids, after = [], None
+    while True:
+        page, _ = db.browse_by_price(limit=limit, after=after, with_total=False, **kwargs)
+        ids += [r["id"] for r in page]
+        if len(page) < limit:
+            return ids
+        after = (page[-1]["metadata"]["price"], page[-1]["id"])
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"descending": True}, {"min_price": 10, "max_price": 40}])
+def test_cursor_pages_match_offset_pages(store, kwargs):
+    expected, total = _browse(store, limit=10, **kwargs)
+    for limit in (1, 2, 3):
+        assert _walk(store, limit, **kwargs) == expected
+    assert store.browse_by_price(limit=2, with_total=False, **kwargs)[1] is None
+    assert total == len(expected)
+
+
+def test_cursor_past_a_deleted_row_skips_its_price(store):
+    store.delete_ids([4])
+    assert _browse(store, after=(10.0, 4), limit=10) == ([3, 0, 6, 5], 5)
+    assert _browse(store, after=(10.0, 4), limit=10, descending=True) == ([], 5)
+
+
+class _UnrangedStore:
+    """Stands in for Pinecone: filtered vector search, no price index"""
+
+    def __init__(self, results):
+        self.results = results
+
+    def search(self, query_embedding, top_k=5, filter=None):
+        return [r for r in self.results if filter is None or filter.matches(r["metadata"])][:top_k]
+
+
+def test_fallback_drops_unpriced_products(monkeypatch):
+    from embed_and_load import EmbeddingGenerator
+    from search import ProductSearcher
+
+    results = [{"id": str(i), "metadata": {"title": str(i)} if p is None else {"title": str(i), "price": p},
+                "similarity": 0.5} for i, p in enumerate(PRICES)]
+    searcher = ProductSearcher(_UnrangedStore(results), EmbeddingGenerator(lazy=True))
+    monkeypatch.setattr(searcher, "_embed_query", lambda query: np.zeros(4, dtype=np.float32))
+    page, total = searcher.browse_by_price(limit=10)
+    assert [r["id"] for r in page] == ["1", "4", "3", "0", "6", "5"] and total is None
+    page, _ = searcher.browse_by_price(limit=10, after=(10.0, "4"))
+    assert [r["id"] for r in page] == ["3", "0", "6", "5"]
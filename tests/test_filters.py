@@ -0,0 +1,42 @@
+from filters import SearchFilter
+
+
+def test_create_normalizes_categories_and_prices():
+    search_filter = SearchFilter.create(min_price="10", max_price=20, category=[" Dresses", "dresses", "", "Shoes"])
+    assert search_filter.min_price == 10.0
+    assert search_filter.max_price == 20.0
+    assert search_filter.categories == ("dresses", "shoes")
+    assert SearchFilter.create(category="Bags").categories == ("bags",)
+
+
+def test_empty_filter():
+    search_filter = SearchFilter.create()
+    assert search_filter.is_empty
+    assert not search_filter.has_price
+    assert search_filter.matches({"price": None, "category": "anything"})
+    assert search_filter.to_sql() == ("", {})
+    assert search_filter.to_pinecone() is None
+
+
+def test_matches_price_bounds_inclusive_and_category():
+    search_filter = SearchFilter.create(min_price=10, max_price=20, category="Dresses")
+    assert search_filter.matches({"price": 10, "category": "dresses"})
+    assert search_filter.matches({"price": 20.0, "category": " DRESSES "})
+    assert not search_filter.matches({"price": 20.5, "category": "dresses"})
+    assert not search_filter.matches({"price": 15, "category": "shoes"})
+    # Unpriced products never satisfy a price constraint
+    assert not search_filter.matches({"category": "dresses"})
+    assert not search_filter.matches({"price": "15", "category": "dresses"})
+
+
+def test_to_sql():
+    clause, params = SearchFilter.create(max_price=50, category="Shoes").to_sql()
+    assert clause == "price <= :filter_max_price AND lower(category) = ANY(:filter_categories)"
+    assert params == {"filter_max_price": 50.0, "filter_categories": ["shoes"]}
+
+
+def test_to_pinecone():
+    assert SearchFilter.create(min_price=5).to_pinecone() == {"price": {"$gte": 5.0}}
+    assert SearchFilter.create(min_price=5, max_price=9, category="shoes").to_pinecone() == {
+        "$and": [{"price": {"$gte": 5.0, "$lte": 9.0}}, {"category": {"$in": ["Shoes", "shoes"]}}]
+    }
@@ -0,0 +1,101 @@
+import numpy as np
+
+from item_graph import ItemGraph
+
+
+def _neighbor_sets(graph):
+    return {
+        str(id_val): {str(n) for n, _ in graph.similar(id_val, graph.k)}
+        for id_val in graph.ids
+    }
+
+
+def _catalog(rng, n, dim=8):
+    return [f"p{i}" for i in range(n)], rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def test_build_finds_exact_neighbors():
+    rng = np.random.default_rng(0)
+    ids, matrix = _catalog(rng, 60)
+    graph = ItemGraph.build(ids, matrix, k=5, workers=2)
+
+    unit = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    sims = unit @ unit.T
+    np.fill_diagonal(sims, -np.inf)
+    for row, id_val in enumerate(ids):
+        expected = [ids[i] for i in np.argsort(-sims[row])[:5]]
+        assert [n for n, _ in graph.similar(id_val, 5)] == expected
+    assert graph.similar("missing") is None
+
+
+def test_refresh_matches_full_build():
+    rng = np.random.default_rng(1)
+    ids, matrix = _catalog(rng, 80)
+    hashes = [f"h{i}" for i in range(len(ids))]
+    graph = ItemGraph.build(ids, matrix, k=6, hashes=hashes, workers=2)
+
+    # Change some vectors, drop some products and add new ones
+    new_ids = ids[5:] + [f"new{i}" for i in range(10)]
+    new_matrix = np.concatenate([matrix[5:], rng.standard_normal((10, 8)).astype(np.float32)])
+    new_hashes = hashes[5:] + [f"n{i}" for i in range(10)]
+    for row in (0, 17, 40):
+        new_matrix[row] = rng.standard_normal(8)
+        new_hashes[row] += "-changed"
+
+    refreshed = graph.refresh(new_ids, new_matrix, new_hashes, workers=2)
+    rebuilt = ItemGraph.build(new_ids, new_matrix, k=6, hashes=new_hashes, workers=2)
+    assert _neighbor_sets(refreshed) == _neighbor_sets(rebuilt)
+
+
+def test_small_catalog_pads_and_grows():
+    rng = np.random.default_rng(2)
+    ids, matrix = _catalog(rng, 3)
+    graph = ItemGraph.build(ids, matrix, k=4, hashes=["a", "b", "c"])
+    assert all(len(graph.similar(i, 4)) == 2 for i in ids)
+
+    more_ids, more = _catalog(rng, 3)
+    grown = graph.refresh(ids + ["x", "y"], np.concatenate([matrix, more[:2]]), ["a", "b", "c", "x", "y"])
+    assert all(len(grown.similar(i, 4)) == 4 for i in grown.ids)
+
+
+def test_save_load_round_trip(tmp_path):
+    rng = np.random.default_rng(3)
+    ids, matrix = _catalog(rng, 30)
+    graph = ItemGraph.build(ids, matrix, k=4, hashes=[str(i) for i in range(30)])
+    graph.save(str(tmp_path))
+    loaded = ItemGraph.load(str(tmp_path))
+    assert loaded.generation == "v1"
+    assert loaded.k == 4
+    assert _neighbor_sets(loaded) == _neighbor_sets(graph)
+    assert list(loaded.hashes) == list(graph.hashes)
+    assert ItemGraph.load_if_exists(str(tmp_path / "absent")) is None
+
+
+def test_graph_reloads_without_remapping_the_snapshot(tmp_path, monkeypatch):
+    import app
+    from embed_and_load import EmbeddingGenerator, VectorDatabase
+    from search import ProductSearcher
+
+    rng = np.random.default_rng(4)
+    ids, matrix = _catalog(rng, 20)
+    writer = VectorDatabase()
+    writer.add_embeddings(matrix, [{"title": i} for i in ids], ids)
+    writer.save(str(tmp_path / "snapshot"))
+    served = VectorDatabase()
+    served.load(str(tmp_path / "snapshot"))
+    # A newer store generation and a first item graph are both published
+    writer.save(str(tmp_path / "snapshot"))
+    ItemGraph.build(ids, matrix, k=3).save(str(tmp_path / "graph"))
+
+    monkeypatch.setattr(app, "ITEM_GRAPH_PATH", str(tmp_path / "graph"))
+    monkeypatch.setattr(app.app.state, "searcher",
+                        ProductSearcher(served, EmbeddingGenerator(lazy=True)), raising=False)
+    searcher = app.app.state.searcher
+    assert app._reload_snapshot(remap_snapshot=False)
+    assert searcher.item_graph.generation == "v1"
+    assert searcher.vector_db is served
+    assert not app._reload_snapshot(remap_snapshot=False)
+
+    assert app._reload_snapshot()
+    assert searcher.vector_db is not served
+    assert searcher.vector_db.snapshot_generation != served.snapshot_generation
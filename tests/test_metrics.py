@@ -0,0 +1,58 @@
+import metrics
+
+
+def _registry():
+    registry = metrics.Registry()
+    counter = registry.counter("requests_total", "Requests", ("backend",))
+    histogram = registry.histogram("latency_seconds", "Latency", ("backend",), buckets=(0.1, 1.0))
+    return registry, counter, histogram
+
+
+def test_merge_sums_series_across_processes():
+    first, first_counter, first_histogram = _registry()
+    second, second_counter, second_histogram = _registry()
+    first_counter.inc(backend="memory")
+    first_counter.inc(2, backend="pgvector")
+    second_counter.inc(3, backend="memory")
+    first_histogram.observe(0.05, backend="memory")
+    second_histogram.observe(0.5, backend="memory")
+    second_histogram.observe(5.0, backend="memory")
+
+    merged = metrics.merge([first.collect(), second.collect()])
+    counts = {tuple(k): v for k, v in merged["requests_total"]["values"]}
+    assert counts == {("memory",): 4.0, ("pgvector",): 2.0}
+    (key, (buckets, total, count)), = merged["latency_seconds"]["values"]
+    assert key == ["memory"]
+    assert buckets == [1, 1, 1]
+    assert total == 5.55
+    assert count == 3
+
+
+def test_merge_skips_histograms_with_other_buckets():
+    first, _, first_histogram = _registry()
+    other = metrics.Registry()
+    other.histogram("latency_seconds", "Latency", ("backend",), buckets=(0.5,)).observe(0.2, backend="memory")
+    first_histogram.observe(0.05, backend="memory")
+    merged = metrics.merge([first.collect(), other.collect()])
+    assert merged["latency_seconds"]["values"] == [[["memory"], [[1, 0, 0], 0.05, 1]]]
+
+
+def test_render_prometheus_text():
+    registry, counter, histogram = _registry()
+    counter.inc(backend='mem"ory')
+    histogram.observe(0.05, backend="memory")
+    histogram.observe(0.5, backend="memory")
+    text = metrics.render(registry.collect())
+    assert text.splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{backend="mem\\"ory"} 1.0',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{backend="memory",le="0.1"} 1',
+        'latency_seconds_bucket{backend="memory",le="1.0"} 2',
+        'latency_seconds_bucket{backend="memory",le="+Inf"} 2',
+        'latency_seconds_sum{backend="memory"} 0.55',
+        'latency_seconds_count{backend="memory"} 2',
+    ]
+    assert text.endswith("\n")
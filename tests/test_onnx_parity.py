@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+
+from inference import InferenceConfig
+
+MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SCRIPTS = Path(__file__).resolve().parents[1] / "scripts"
+
+
+@pytest.fixture(scope="module")
+def parity():
+    config = InferenceConfig("onnx")
+    directory = Path(config.model_dir) / MODEL.replace("/", "__")
+    model_file = "model.int8.onnx" if config.quantize else "model.onnx"
+    if not (directory / model_file).exists():
+        pytest.skip(f"no exported ONNX model at {directory / model_file}; run scripts/onnx_parity.py first")
+    sys.path.insert(0, str(SCRIPTS))
+    import onnx_parity
+    from embed_and_load import EmbeddingGenerator
+
+    texts = onnx_parity.catalog_texts(MODEL, 300)
+    torch_gen = EmbeddingGenerator(MODEL, backend="torch")
+    onnx_gen = EmbeddingGenerator(MODEL, backend="onnx")
+    return onnx_parity, onnx_parity.compare(torch_gen, onnx_gen, texts, onnx_parity.QUERIES)
+
+
+def test_embeddings_agree_with_torch(parity):
+    module, stats = parity
+    assert stats["cosines"].mean() >= module.MIN_COSINE
+    assert stats["query_cosines"].mean() >= module.MIN_COSINE
+
+
+def test_top_10_results_overlap(parity):
+    module, stats = parity
+    assert stats["k"] == 10
+    assert stats["overlap"] >= module.MIN_OVERLAP
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from embed_and_load import VectorDatabase
+from quantization import Int8Quantizer
+
+
+def _clustered(rows=3000, dimension=64, clusters=30, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    labels = rng.integers(clusters, size=rows)
+    return centers[labels] + 0.5 * rng.standard_normal((rows, dimension)).astype(np.float32)
+
+
+def _store(matrix, quantization, monkeypatch, tmp_path):
+    monkeypatch.setenv("MEMORY_PQ_SUBSPACES", "16")
+    monkeypatch.setenv("MEMORY_SPILL_DIR", str(tmp_path / "spill"))
+    db = VectorDatabase(quantization=quantization)
+    ids = list(range(len(matrix)))
+    db.add_embeddings(matrix, [{"title": str(i)} for i in ids], ids)
+    db.build_indexes()
+    return db
+
+
+@pytest.mark.parametrize("quantization, threshold", [("int8", 0.97), ("pq", 0.9)])
+def test_recall_at_10_against_exact(quantization, threshold, monkeypatch, tmp_path):
+    matrix = _clustered()
+    db = _store(matrix, quantization, monkeypatch, tmp_path)
+    assert db._codes is not None
+    queries = _clustered(rows=50, seed=1)
+    assert db.recall(queries, top_k=10) >= threshold
+
+
+def test_quantized_matrix_is_file_backed(monkeypatch, tmp_path):
+    matrix = _clustered(rows=500)
+    db = _store(matrix, "int8", monkeypatch, tmp_path)
+    assert db.memory_usage()["matrix_file_backed"]
+    # The backing file is unlinked as soon as it is mapped
+    assert list((tmp_path / "spill").iterdir()) == []
+    expected = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.testing.assert_allclose(db.embeddings, expected, rtol=1e-5, atol=1e-6)
+
+    rows, scores = db._search_rows(expected[7], 1, exact=True)
+    assert rows[0] == 7 and scores[0] == pytest.approx(1.0, abs=1e-5)
+
+
+def test_unquantized_matrix_stays_private():
+    db = VectorDatabase()
+    db.add_embeddings(np.ones((3, 4), dtype=np.float32), [{}] * 3, [0, 1, 2])
+    assert not db.memory_usage()["matrix_file_backed"]
+
+
+def test_chunked_codes_grow_amortized():
+    matrix = _clustered(rows=5000, dimension=16)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    whole = Int8Quantizer()
+    whole.build(matrix)
+
+    chunked = Int8Quantizer()
+    chunked.build(matrix[:100])
+    chunked.scale = whole.scale
+    reallocations, buffer = 0, None
+    for start in range(0, len(matrix), 100):
+        chunked.add(matrix[start:start + 100], start)
+        if chunked._buffer is not buffer:
+            reallocations += 1
+            buffer = chunked._buffer
+    np.testing.assert_array_equal(chunked.codes, whole.codes)
+    # 1024 -> 2048 -> 4096 -> 8192
+    assert reallocations == 4
@@ -0,0 +1,42 @@
+from cache import InProcessResultBackend, ResultCache
+
+
+def _cache(ttl=300.0):
+    return ResultCache(InProcessResultBackend(max_size=16), ttl_seconds=ttl)
+
+
+def test_key_normalizes_query_whitespace_and_case():
+    assert ResultCache.make_key("Red  Dress ", 5, "memory", "v1") == ResultCache.make_key("red dress", 5, "memory", "v1")
+
+
+def test_key_separates_k_backend_and_catalog_version():
+    base = ResultCache.make_key("red dress", 5, "memory", "v1")
+    assert base != ResultCache.make_key("red dress", 10, "memory", "v1")
+    assert base != ResultCache.make_key("red dress", 5, "memory:hybrid:rrf", "v1")
+    assert base != ResultCache.make_key("red dress", 5, "memory", "v2")
+
+
+def test_results_are_served_only_for_the_same_catalog_version():
+    cache = _cache()
+    results = [{"id": 1, "title": "Red dress"}]
+    cache.put("red dress", 5, "memory", "v1", results)
+    assert cache.get("RED dress", 5, "memory", "v1") == results
+    assert cache.get("red dress", 5, "memory", "v2") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_cached_results_are_copies():
+    cache = _cache()
+    cache.put("q", 5, "memory", "v1", [{"id": 1}])
+    cache.get("q", 5, "memory", "v1")[0]["id"] = 99
+    assert cache.get("q", 5, "memory", "v1") == [{"id": 1}]
+
+
+def test_expired_entries_miss():
+    cache = _cache(ttl=10.0)
+    cache.put("q", 5, "memory", "v1", [{"id": 1}])
+    key = ResultCache.make_key("q", 5, "memory", "v1")
+    stored_at, value = cache.backend.get(key)
+    cache.backend._entries[key] = (stored_at - 11.0, value)
+    assert cache.get("q", 5, "memory", "v1") is None
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from snapshot import current_generation, is_snapshot, read_snapshot, write_snapshot
+
+
+def _write(path, ids, prices, metadata, version=None):
+    embeddings = np.arange(len(ids) * 3, dtype=np.float32).reshape(len(ids), 3)
+    categories = {}
+    for row, md in enumerate(metadata):
+        categories.setdefault(str(md.get("category", "")).lower(), []).append(row)
+    write_snapshot(str(path), embeddings, np.array(prices, dtype=np.float64), ids, metadata,
+                   {c: np.array(rows) for c, rows in categories.items()}, catalog_version=version)
+    return embeddings
+
+
+def test_round_trip(tmp_path):
+    ids = [101, 102, 103]
+    metadata = [
+        {"title": "Red dress", "category": "dresses", "price": 20.0, "tags": ["a", "b"]},
+        {"title": "Blue shirt", "category": "shirts", "price": 9.5},
+        {"title": "Unpriced scarf", "category": "dresses"},
+    ]
+    embeddings = _write(tmp_path, ids, [20.0, 9.5, np.nan], metadata, version="digest-1")
+
+    assert is_snapshot(str(tmp_path))
+    snapshot = read_snapshot(str(tmp_path))
+    np.testing.assert_array_equal(snapshot.embeddings, embeddings)
+    assert list(snapshot.ids) == ids
+    # Keys a record did not have stay absent rather than becoming None
+    assert [dict(md) for md in snapshot.metadata] == metadata
+    assert snapshot.id_index.get(102) == 1
+    assert snapshot.id_index.get("103") == 2
+    assert snapshot.id_index.get(999) is None
+    assert {c: list(rows) for c, rows in snapshot.category_rows.items()} == {"dresses": [0, 2], "shirts": [1]}
+    order, sorted_prices = snapshot.price_order
+    assert list(order) == [1, 0]
+    assert list(sorted_prices) == [9.5, 20.0]
+    assert snapshot.manifest["catalog_version"] == "digest-1"
+
+
+def test_generations_keep_current_and_previous(tmp_path):
+    for i in range(4):
+        _write(tmp_path, [i], [float(i)], [{"title": f"item {i}"}])
+    assert current_generation(tmp_path) == "v4"
+    assert sorted(p.name for p in tmp_path.iterdir() if p.is_dir()) == ["v3", "v4"]
+    assert list(read_snapshot(str(tmp_path)).ids) == [3]
+
+
+def test_missing_snapshot(tmp_path):
+    assert not is_snapshot(str(tmp_path))
+    with pytest.raises(FileNotFoundError):
+        read_snapshot(str(tmp_path))
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from embed_and_load import VectorDatabase
+
+
+def _store(matrix, **kwargs):
+    db = VectorDatabase(**kwargs)
+    ids = list(range(len(matrix)))
+    db.add_embeddings(matrix, [{"title": f"item {i}", "price": float(i)} for i in ids], ids)
+    return db
+
+
+def _cosine(query, matrix):
+    return (matrix @ query) / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query))
+
+
+def test_growth_reallocates_logarithmically():
+    db = VectorDatabase(initial_capacity=4)
+    reallocations, previous = 0, None
+    for i in range(1000):
+        db.add_embeddings(np.ones((1, 8), dtype=np.float32), [{"title": str(i)}], [i])
+        if db._matrix is not previous:
+            reallocations += 1
+            previous = db._matrix
+    assert db.count() == 1000
+    assert db._matrix.shape[0] == 1024
+    # 4 -> 8 -> ... -> 1024
+    assert reallocations == 9
+    assert db.embeddings.shape == (1000, 8)
+
+
+def test_scores_are_cosine_similarities_of_unnormalized_inputs():
+    rng = np.random.default_rng(0)
+    matrix = rng.standard_normal((50, 16)).astype(np.float32) * rng.uniform(0.1, 10, (50, 1)).astype(np.float32)
+    db = _store(matrix)
+    np.testing.assert_allclose(np.linalg.norm(db.embeddings, axis=1), 1.0, rtol=1e-5)
+
+    query = rng.standard_normal(16).astype(np.float32) * 7
+    results = db.search(query, top_k=50)
+    expected = _cosine(query, matrix)
+    for r in results:
+        assert r["similarity"] == pytest.approx(float(expected[r["id"]]), abs=1e-5)
+
+
+@pytest.mark.parametrize("top_k", [1, 5, 199, 200, 500])
+def test_top_k_matches_full_sort(top_k):
+    rng = np.random.default_rng(top_k)
+    matrix = rng.standard_normal((200, 12)).astype(np.float32)
+    db = _store(matrix)
+    query = rng.standard_normal(12).astype(np.float32)
+    expected = np.argsort(-_cosine(query, matrix), kind="stable")[:top_k]
+    results = db.search(query, top_k=top_k)
+    assert [r["id"] for r in results] == expected.tolist()
+    similarities = [r["similarity"] for r in results]
+    assert similarities == sorted(similarities, reverse=True)
+
+
+def test_search_batch_matches_single_searches():
+    rng = np.random.default_rng(1)
+    db = _store(rng.standard_normal((120, 8)).astype(np.float32))
+    queries = rng.standard_normal((7, 8)).astype(np.float32)
+    batch = db.search_batch(queries, top_k=10, chunk_size=3)
+    for query, results in zip(queries, batch):
+        single = db.search(query, top_k=10)
+        assert [r["id"] for r in results] == [r["id"] for r in single]
+        np.testing.assert_allclose([r["similarity"] for r in results], [r["similarity"] for r in single], rtol=1e-5)
+
+
+def test_zero_vectors_do_not_divide_by_zero():
+    db = _store(np.zeros((3, 4), dtype=np.float32))
+    results = db.search(np.zeros(4, dtype=np.float32), top_k=3)
+    assert [r["similarity"] for r in results] == [0.0, 0.0, 0.0]
+
+
+def test_upsert_keeps_last_row_of_repeated_ids():
+    db = _store(np.eye(4, dtype=np.float32))
+    vectors = np.array([[1, 1, 0, 0], [0, 0, 1, 1], [0, 1, 1, 0], [0, 0, 0, 2]], dtype=np.float32)
+    metadata = [{"title": "first new"}, {"title": "first update"}, {"title": "last new"}, {"title": "last update"}]
+    db.upsert_embeddings(vectors, metadata, [9, 2, 9, 2])
+    assert db.count() == 5
+    assert len(db.ids) == len(db.metadata) == db.embeddings.shape[0] == 5
+    assert db.get_by_ids([9])[0]["metadata"]["title"] == "last new"
+    assert db.get_by_ids([2])[0]["metadata"]["title"] == "last update"
+    rows, _ = db._search_rows(db._normalize(vectors[2:3])[0], 1, exact=True)
+    assert db.ids[rows[0]] == 9
+    # Every row is reachable through its id, so no orphan was appended
+    assert sorted(db._id_to_row.values()) == list(range(5))